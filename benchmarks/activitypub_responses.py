@@ -0,0 +1,73 @@
+import asyncio
+import time
+from collections.abc import Callable
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from rich.console import Console
+
+from capsule.activitypub.models import ActorAP
+from capsule.activitypub.responses import ActivityJSONResponse, JRDJSONResponse
+from capsule.security.utils import generate_ed25519_keypair, generate_rsa_keypair
+from capsule.settings import CapsuleSettings
+
+TOTAL_RESPONSES = 20000
+
+console = Console(highlight=False)
+
+
+def make_webfinger(settings: CapsuleSettings) -> dict:
+    return {
+        "subject": f"acct:{settings.username}@{settings.hostname.host}",
+        "aliases": [settings.profile_url, settings.actor_url],
+        "links": [
+            {
+                "rel": "http://webfinger.net/rel/profile-page",
+                "type": "text/html",
+                "href": settings.profile_url,
+            },
+            {
+                "rel": "self",
+                "type": "application/activity+json",
+                "href": settings.actor_url,
+            },
+        ],
+    }
+
+
+def run(render: Callable[[Any], bytes], content: Any) -> float:
+    start = time.perf_counter()
+
+    for _ in range(TOTAL_RESPONSES):
+        render(content)
+
+    return TOTAL_RESPONSES / (time.perf_counter() - start)
+
+
+def render_encoded(content: Any) -> bytes:
+    return JSONResponse(jsonable_encoder(content, by_alias=True)).body
+
+
+async def main() -> None:
+    settings = CapsuleSettings(
+        username="benchmark",
+        public_key=generate_rsa_keypair().public_key,
+        ed25519_public_key=generate_ed25519_keypair().public_key,
+    )
+    actor = ActorAP.make_main_actor(settings)
+    webfinger = make_webfinger(settings)
+
+    actor_encoded = run(render_encoded, actor)
+    actor_direct = run(lambda content: ActivityJSONResponse(content).body, actor)
+    webfinger_encoded = run(render_encoded, webfinger)
+    webfinger_direct = run(lambda content: JRDJSONResponse(content).body, webfinger)
+
+    console.print(f"actor encoded:      {actor_encoded:10.1f} responses/sec")
+    console.print(f"actor direct:       {actor_direct:10.1f} responses/sec")
+    console.print(f"webfinger encoded:  {webfinger_encoded:10.1f} responses/sec")
+    console.print(f"webfinger direct:   {webfinger_direct:10.1f} responses/sec")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
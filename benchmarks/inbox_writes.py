@@ -0,0 +1,72 @@
+import asyncio
+import json
+import time
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from uuid import uuid4
+
+from rich.console import Console
+from wheke_sqlmodel import SQLITE_DRIVER, SQLModelService, SQLModelSettings
+
+from capsule.activitypub.models import InboxEntry, RawActivity
+from capsule.activitypub.repositories import InboxRepository
+from capsule.activitypub.writer import InboxWriter
+from capsule.settings import CapsuleSettings
+
+TOTAL_ENTRIES = 2000
+CONCURRENCY = 200
+
+console = Console(highlight=False)
+
+
+def make_entry() -> InboxEntry:
+    actor = "https://social.example/actors/benchmark"
+
+    payload = {
+        "id": f"{actor}/activity/{uuid4()}",
+        "actor": actor,
+        "type": "Create",
+        "object": {"type": "Note", "content": "Hello World"},
+    }
+
+    return InboxEntry(activity=RawActivity.from_bytes(json.dumps(payload).encode()))
+
+
+async def run_concurrently(create: Callable[[InboxEntry], Awaitable]) -> float:
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def create_one() -> None:
+        async with semaphore:
+            await create(make_entry())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(create_one() for _ in range(TOTAL_ENTRIES)))
+
+    return TOTAL_ENTRIES / (time.perf_counter() - start)
+
+
+async def main() -> None:
+    with TemporaryDirectory() as tmp_dir:
+        db = SQLModelService(
+            settings=SQLModelSettings(
+                connection_string=f"{SQLITE_DRIVER}:///{Path(tmp_dir) / 'bench.db'}"
+            )
+        )
+        await db.create_db()
+
+        repository = InboxRepository(db)
+        writer = InboxWriter(settings=CapsuleSettings(), inbox_repository=repository)
+
+        before = await run_concurrently(repository.create_entry)
+        after = await run_concurrently(writer.write)
+
+        await db.dispose()
+
+    console.print(f"create_entry:       {before:10.1f} inserts/sec")
+    console.print(f"InboxWriter.write:  {after:10.1f} inserts/sec")
+    console.print(f"speedup:            {after / before:10.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from httpx import Request
+from pydantic import HttpUrl
+from rich.console import Console
+
+from capsule.security.utils import (
+    SignedRequestAuth,
+    generate_rsa_keypair,
+    load_private_key,
+)
+
+TOTAL_REQUESTS = 2000
+KEY_ID = HttpUrl("https://social.example/actors/benchmark#main-key")
+
+console = Console(highlight=False)
+
+
+def make_requests() -> list[Request]:
+    return [
+        Request(
+            "POST",
+            f"https://remote{i}.example/inbox",
+            json={"type": "Accept", "index": i},
+        )
+        for i in range(TOTAL_REQUESTS)
+    ]
+
+
+def run_uncached(auth: SignedRequestAuth) -> float:
+    requests = make_requests()
+
+    start = time.perf_counter()
+
+    for request in requests:
+        load_private_key.cache_clear()
+        auth.sign_request(request)
+
+    return TOTAL_REQUESTS / (time.perf_counter() - start)
+
+
+def run_cached(auth: SignedRequestAuth) -> float:
+    requests = make_requests()
+
+    start = time.perf_counter()
+
+    for request in requests:
+        auth.sign_request(request)
+
+    return TOTAL_REQUESTS / (time.perf_counter() - start)
+
+
+async def run_batch(auth: SignedRequestAuth) -> float:
+    requests = make_requests()
+
+    start = time.perf_counter()
+    await auth.sign_requests(requests)
+
+    return TOTAL_REQUESTS / (time.perf_counter() - start)
+
+
+async def main() -> None:
+    cores = os.cpu_count() or 1
+    keys = generate_rsa_keypair()
+
+    with ThreadPoolExecutor(max_workers=cores) as executor:
+        auth = SignedRequestAuth(KEY_ID, keys.private_key, executor)
+
+        uncached = run_uncached(auth)
+        cached = run_cached(auth)
+        batch = await run_batch(auth)
+
+    console.print(f"cores:              {cores:10d}")
+    console.print(f"uncached key:       {uncached:10.1f} signs/sec")
+    console.print(f"cached key:         {cached:10.1f} signs/sec")
+    console.print(f"batch executor:     {batch:10.1f} signs/sec")
+    console.print(f"speedup:            {batch / uncached:10.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
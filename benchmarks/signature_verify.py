@@ -0,0 +1,105 @@
+import asyncio
+import os
+import time
+from typing import cast
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey
+from rich.console import Console
+
+from capsule.security.services import SignatureService
+from capsule.security.utils import generate_rsa_keypair
+from capsule.settings import CapsuleSettings
+
+TOTAL_VERIFICATIONS = 2000
+KEY_ID = "https://social.example/actors/benchmark#main-key"
+DATA = "\n".join(
+    [
+        "(request-target): post /actors/testuser/inbox",
+        "host: localhost",
+        "date: Sun, 18 Oct 2026 12:00:00 GMT",
+        "digest: SHA-256=47DEQpj8HBSa+/TImW+5JCeuQeRkm5NMpJWZG3hSuFU=",
+    ]
+)
+
+console = Console(highlight=False)
+
+
+def sign(private_key: str) -> bytes:
+    private_key_instance = cast(
+        RSAPrivateKey,
+        serialization.load_pem_private_key(private_key.encode("ascii"), password=None),
+    )
+
+    return private_key_instance.sign(
+        DATA.encode("utf8"), padding.PKCS1v15(), hashes.SHA256()
+    )
+
+
+def run_uncached(service: SignatureService, signature: bytes, public_key: str) -> float:
+    start = time.perf_counter()
+
+    for _ in range(TOTAL_VERIFICATIONS):
+        service.public_keys.clear()
+        service.verify_signature(
+            signature, DATA, service.load_public_key(KEY_ID, public_key)
+        )
+
+    return TOTAL_VERIFICATIONS / (time.perf_counter() - start)
+
+
+def run_cached(service: SignatureService, signature: bytes, public_key: str) -> float:
+    start = time.perf_counter()
+
+    for _ in range(TOTAL_VERIFICATIONS):
+        service.verify_signature(
+            signature, DATA, service.load_public_key(KEY_ID, public_key)
+        )
+
+    return TOTAL_VERIFICATIONS / (time.perf_counter() - start)
+
+
+async def run_executor(
+    service: SignatureService, signature: bytes, public_key: str
+) -> float:
+    loop = asyncio.get_running_loop()
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            loop.run_in_executor(
+                service.executor,
+                service.verify_signature,
+                signature,
+                DATA,
+                service.load_public_key(KEY_ID, public_key),
+            )
+            for _ in range(TOTAL_VERIFICATIONS)
+        )
+    )
+
+    return TOTAL_VERIFICATIONS / (time.perf_counter() - start)
+
+
+async def main() -> None:
+    cores = os.cpu_count() or 1
+    keys = generate_rsa_keypair()
+    signature = sign(keys.private_key)
+    service = SignatureService(settings=CapsuleSettings(signature_workers=cores))
+
+    uncached = run_uncached(service, signature, keys.public_key)
+    cached = run_cached(service, signature, keys.public_key)
+    executor = await run_executor(service, signature, keys.public_key)
+
+    service.shutdown()
+
+    console.print(f"cores:              {cores:10d}")
+    console.print(f"uncached key:       {uncached:10.1f} verifications/sec")
+    console.print(f"cached key:         {cached:10.1f} verifications/sec")
+    console.print(f"executor:           {executor:10.1f} verifications/sec")
+    console.print(f"executor per core:  {executor / cores:10.1f} verifications/sec")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,6 +7,7 @@ from wheke import get_container
 from wheke_sqlmodel import get_sqlmodel_service
 
 from . import build_app, build_wheke
+from .activitypub.cli import cli as federation_cli
 from .activitypub.service import get_activitypub_service
 from .settings import CapsuleSettings
 
@@ -67,6 +68,7 @@ def build_cli(
     settings: CapsuleSettings | type[CapsuleSettings] = CapsuleSettings,
 ) -> Typer:
     cli = build_wheke(settings).create_cli()
+    cli.add_typer(federation_cli, name="federation")
 
     @cli.command(short_help="Create the databases")
     def syncdb(ctx: Context) -> None:
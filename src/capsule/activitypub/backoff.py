@@ -0,0 +1,123 @@
+import random
+import time
+from collections import OrderedDict
+from typing import Annotated
+
+from fastapi import Depends
+from pydantic import HttpUrl
+from svcs import Container
+from svcs.fastapi import DepContainer
+from wheke import get_service
+
+from capsule.settings import CapsuleSettings, get_capsule_settings
+
+
+def backoff_delay(base: float, maximum: float, attempts: int) -> float:
+    delay = min(base * 2 ** (attempts - 1), maximum)
+
+    return delay / 2 + random.uniform(0, delay / 2)  # noqa: S311
+
+
+class BackoffEntry:
+    attempts: int
+    retry_at: float
+
+    def __init__(self, attempts: int, retry_at: float) -> None:
+        self.attempts = attempts
+        self.retry_at = retry_at
+
+    def is_blocking(self, threshold: int, now: float) -> bool:
+        return self.attempts >= threshold and self.retry_at > now
+
+
+class FetchBackoff:
+    settings: CapsuleSettings
+
+    entries: OrderedDict[str, BackoffEntry]
+    short_circuited: int
+
+    def __init__(self, *, settings: CapsuleSettings) -> None:
+        self.settings = settings
+
+        self.entries = OrderedDict()
+        self.short_circuited = 0
+
+    @property
+    def is_enabled(self) -> bool:
+        return self.settings.actor_fetch_backoff_base > 0
+
+    @property
+    def size(self) -> int:
+        return len(self.entries)
+
+    def is_blocked(self, actor_id: HttpUrl) -> bool:
+        now = time.monotonic()
+
+        for key, threshold in self._keys(actor_id):
+            entry = self.entries.get(key)
+
+            if entry is not None and entry.is_blocking(threshold, now):
+                self.short_circuited += 1
+                return True
+
+        return False
+
+    def record_failure(self, actor_id: HttpUrl, *, host_failure: bool) -> None:
+        if not self.is_enabled:
+            return
+
+        actor_key, host_key = self._keys(actor_id)
+
+        self._fail(*actor_key)
+
+        if host_failure and actor_id.host:
+            self._fail(*host_key)
+
+    def record_success(self, actor_id: HttpUrl) -> None:
+        for key, _ in self._keys(actor_id):
+            self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def _keys(self, actor_id: HttpUrl) -> list[tuple[str, int]]:
+        return [
+            (str(actor_id), 1),
+            (f"host:{actor_id.host}", self.settings.actor_fetch_backoff_host_threshold),
+        ]
+
+    def _fail(self, key: str, threshold: int) -> None:
+        now = time.monotonic()
+        entry = self.entries.get(key)
+
+        if entry is None:
+            entry = self.entries[key] = BackoffEntry(0, now)
+        elif entry.is_blocking(threshold, now):
+            return
+
+        entry.attempts += 1
+        entry.retry_at = now + backoff_delay(
+            self.settings.actor_fetch_backoff_base,
+            self.settings.actor_fetch_backoff_max,
+            entry.attempts,
+        )
+
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.settings.actor_fetch_backoff_size:
+            self.entries.popitem(last=False)
+
+
+def fetch_backoff_factory(container: Container) -> FetchBackoff:
+    return FetchBackoff(settings=get_capsule_settings(container))
+
+
+def get_fetch_backoff(container: Container) -> FetchBackoff:
+    return get_service(container, FetchBackoff)
+
+
+def _fetch_backoff_injection(container: DepContainer) -> FetchBackoff:
+    return get_fetch_backoff(container)
+
+
+FetchBackoffInjection = Annotated[FetchBackoff, Depends(_fetch_backoff_injection)]
@@ -0,0 +1,89 @@
+import time
+from collections import OrderedDict
+from typing import Annotated
+
+from fastapi import Depends
+from pydantic import HttpUrl
+from svcs import Container
+from svcs.fastapi import DepContainer
+from wheke import get_service
+
+from capsule.settings import CapsuleSettings, get_capsule_settings
+
+from .models import Actor
+
+
+class ActorCache:
+    settings: CapsuleSettings
+
+    entries: OrderedDict[str, tuple[float, Actor]]
+    generation: int
+    hits: int
+    misses: int
+
+    def __init__(self, *, settings: CapsuleSettings) -> None:
+        self.settings = settings
+
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def is_enabled(self) -> bool:
+        return self.settings.actor_cache_size > 0 and self.settings.actor_cache_ttl > 0
+
+    @property
+    def size(self) -> int:
+        return len(self.entries)
+
+    def get(self, actor_id: HttpUrl) -> Actor | None:
+        key = str(actor_id)
+        cached = self.entries.get(key)
+
+        if cached is None or cached[0] <= time.monotonic():
+            if cached is not None:
+                del self.entries[key]
+
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+
+        return cached[1]
+
+    def put(self, actor: Actor, generation: int) -> None:
+        if not self.is_enabled or generation != self.generation:
+            return
+
+        key = str(actor.id)
+
+        self.entries[key] = (time.monotonic() + self.settings.actor_cache_ttl, actor)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.settings.actor_cache_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, actor_id: HttpUrl) -> None:
+        self.generation += 1
+        self.entries.pop(str(actor_id), None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self.entries.clear()
+
+
+def actor_cache_factory(container: Container) -> ActorCache:
+    return ActorCache(settings=get_capsule_settings(container))
+
+
+def get_actor_cache(container: Container) -> ActorCache:
+    return get_service(container, ActorCache)
+
+
+def _actor_cache_injection(container: DepContainer) -> ActorCache:
+    return get_actor_cache(container)
+
+
+ActorCacheInjection = Annotated[ActorCache, Depends(_actor_cache_injection)]
@@ -0,0 +1,52 @@
+from typing import Annotated
+
+import anyio
+from rich.console import Console
+from rich.table import Table
+from svcs import Container
+from typer import Context, Option, Typer
+from wheke import get_container
+from wheke_sqlmodel import get_sqlmodel_service
+
+from .models import CircuitState, HostHealth
+from .repositories import HostHealthRepository
+
+cli = Typer(short_help="Federation commands")
+console = Console(highlight=False)
+
+
+async def _list_hosts(
+    container: Container, state: CircuitState | None, limit: int
+) -> list[HostHealth]:
+    repository = HostHealthRepository(get_sqlmodel_service(container))
+
+    return await repository.list_hosts(state, limit)
+
+
+@cli.command()
+def hosts(
+    ctx: Context,
+    state: Annotated[
+        CircuitState | None, Option("--state", help="Only show this circuit state")
+    ] = None,
+    limit: Annotated[int, Option("--limit", help="Maximum hosts to show")] = 100,
+) -> None:
+    container = get_container(ctx)
+    records = anyio.run(_list_hosts, container, state, limit)
+
+    table = Table("Host", "State", "Requests", "Errors", "p50 ms", "p95 ms", "Last OK")
+
+    for record in records:
+        table.add_row(
+            record.host,
+            record.state,
+            str(record.requests),
+            f"{record.error_rate:.0%}",
+            f"{record.latency_p50:.0f}",
+            f"{record.latency_p95:.0f}",
+            record.last_success_at.strftime("%Y-%m-%d %H:%M")
+            if record.last_success_at
+            else "-",
+        )
+
+    console.print(table)
@@ -0,0 +1,442 @@
+import asyncio
+import ipaddress
+import socket
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterable, AsyncIterator, Callable, Iterable, Iterator
+from contextlib import contextmanager
+from functools import partial
+from importlib.util import find_spec
+from typing import Annotated, cast
+
+import httpcore
+import httpx
+from fastapi import Depends
+from loguru import logger
+from pydantic import HttpUrl
+from svcs import Container
+from svcs.fastapi import DepContainer
+from wheke import get_service
+
+from capsule.security.utils import KeyType, SignedRequestAuth
+from capsule.settings import CapsuleSettings, get_capsule_settings
+
+from .exceptions import HostUnavailableError
+from .governor import FetchGovernor, HostSlots
+from .health import HostHealthTracker, get_host_health_tracker
+
+ACTIVITY_ACCEPT = "application/activity+json,application/ld+json"
+
+FlightKey = tuple[str, tuple[tuple[str, str], ...]]
+
+
+class CachingNetworkBackend(httpcore.AsyncNetworkBackend):
+    backend: httpcore.AsyncNetworkBackend
+    ttl: float
+    size: int
+
+    addresses: OrderedDict[tuple[str, int], tuple[float, list[str]]]
+    hits: int
+    misses: int
+
+    def __init__(
+        self, backend: httpcore.AsyncNetworkBackend, *, ttl: float, size: int
+    ) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.size = size
+
+        self.addresses = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, host: str, port: int) -> list[str]:
+        try:
+            ipaddress.ip_address(host)
+        except ValueError:
+            pass
+        else:
+            return [host]
+
+        key = (host, port)
+        cached = self.addresses.get(key)
+        now = time.monotonic()
+
+        if cached is not None and cached[0] > now:
+            self.addresses.move_to_end(key)
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                host, port, type=socket.SOCK_STREAM
+            )
+        except OSError as exc:
+            raise httpcore.ConnectError(str(exc)) from exc
+
+        addresses = list(dict.fromkeys(str(info[4][0]) for info in infos))
+
+        self.addresses[key] = (now + self.ttl, addresses)
+        self.addresses.move_to_end(key)
+
+        while len(self.addresses) > self.size:
+            self.addresses.popitem(last=False)
+
+        return addresses
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: float | None = None,
+        local_address: str | None = None,
+        socket_options: Iterable[httpcore.SOCKET_OPTION] | None = None,
+    ) -> httpcore.AsyncNetworkStream:
+        if self.ttl <= 0:
+            return await self.backend.connect_tcp(
+                host, port, timeout, local_address, socket_options
+            )
+
+        error = httpcore.ConnectError(f"No address found for {host}")
+
+        for address in await self.resolve(host, port):
+            try:
+                return await self.backend.connect_tcp(
+                    address, port, timeout, local_address, socket_options
+                )
+            except httpcore.ConnectError as exc:
+                error = exc
+
+        self.addresses.pop((host, port), None)
+
+        raise error
+
+    async def connect_unix_socket(
+        self,
+        path: str,
+        timeout: float | None = None,
+        socket_options: Iterable[httpcore.SOCKET_OPTION] | None = None,
+    ) -> httpcore.AsyncNetworkStream:
+        return await self.backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self.backend.sleep(seconds)
+
+
+class HostSlotStream(httpx.AsyncByteStream):
+    stream: httpx.AsyncByteStream
+    release: Callable[[], None] | None
+
+    def __init__(
+        self, stream: httpx.AsyncByteStream, release: Callable[[], None]
+    ) -> None:
+        self.stream = stream
+        self.release = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self.stream.aclose()
+        finally:
+            if self.release is not None:
+                self.release()
+                self.release = None
+
+
+POOL_ERRORS: list[tuple[type[Exception], type[httpx.TransportError]]] = [
+    (httpcore.ConnectTimeout, httpx.ConnectTimeout),
+    (httpcore.ReadTimeout, httpx.ReadTimeout),
+    (httpcore.WriteTimeout, httpx.WriteTimeout),
+    (httpcore.PoolTimeout, httpx.PoolTimeout),
+    (httpcore.TimeoutException, httpx.TimeoutException),
+    (httpcore.ConnectError, httpx.ConnectError),
+    (httpcore.ReadError, httpx.ReadError),
+    (httpcore.WriteError, httpx.WriteError),
+    (httpcore.NetworkError, httpx.NetworkError),
+    (httpcore.ProxyError, httpx.ProxyError),
+    (httpcore.UnsupportedProtocol, httpx.UnsupportedProtocol),
+    (httpcore.LocalProtocolError, httpx.LocalProtocolError),
+    (httpcore.RemoteProtocolError, httpx.RemoteProtocolError),
+    (httpcore.ProtocolError, httpx.ProtocolError),
+]
+
+
+@contextmanager
+def map_pool_errors(request: httpx.Request | None = None) -> Iterator[None]:
+    try:
+        yield
+    except Exception as exc:
+        for pool_error, transport_error in POOL_ERRORS:
+            if isinstance(exc, pool_error):
+                raise transport_error(str(exc), request=request) from exc
+
+        raise
+
+
+class PoolResponseStream(httpx.AsyncByteStream):
+    stream: AsyncIterable[bytes]
+
+    def __init__(self, stream: AsyncIterable[bytes]) -> None:
+        self.stream = stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        with map_pool_errors():
+            async for chunk in self.stream:
+                yield chunk
+
+    async def aclose(self) -> None:
+        aclose = getattr(self.stream, "aclose", None)
+
+        if aclose is not None:
+            with map_pool_errors():
+                await aclose()
+
+
+class FederationTransport(httpx.AsyncBaseTransport):
+    network_backend: CachingNetworkBackend
+    pool: httpcore.AsyncConnectionPool
+    host_slots: HostSlots
+    governor: FetchGovernor
+    host_health: HostHealthTracker | None
+
+    def __init__(
+        self,
+        *,
+        settings: CapsuleSettings,
+        http2: bool,
+        host_health: HostHealthTracker | None = None,
+    ) -> None:
+        self.network_backend = CachingNetworkBackend(
+            httpcore.AutoBackend(),
+            ttl=settings.http_client_dns_cache_ttl,
+            size=settings.http_client_dns_cache_size,
+        )
+        self.pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=settings.http_client_max_connections,
+            max_keepalive_connections=settings.http_client_max_keepalive_connections,
+            keepalive_expiry=settings.http_client_keepalive_expiry,
+            http1=True,
+            http2=http2,
+            network_backend=self.network_backend,
+        )
+
+        self.host_slots = HostSlots(settings.http_client_max_connections_per_host)
+        self.governor = FetchGovernor(settings=settings)
+        self.host_health = host_health
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+
+        if self.host_health is not None and not self.host_health.allow(host):
+            msg = f"Circuit open for {host}"
+            raise HostUnavailableError(msg, request=request)
+
+        releases: list[Callable[[], None]] = []
+
+        try:
+            if request.method == "GET":
+                if not await self.governor.acquire(host):
+                    msg = f"Rate limited by {host}"
+                    raise HostUnavailableError(msg, request=request)
+
+                releases.append(partial(self.governor.release, host))
+
+            if self.host_slots.limit > 0:
+                await self.host_slots.acquire(host)
+                releases.append(partial(self.host_slots.release, host))
+
+            response = await self._send_tracked(request)
+        except BaseException:
+            if self.host_health is not None:
+                self.host_health.abandon(host)
+
+            release_all(releases)
+            raise
+
+        try:
+            self.governor.observe(host, response)
+        except Exception:
+            logger.bind(host=host).exception("Failed to read rate limit headers")
+
+        if releases:
+            response.stream = HostSlotStream(
+                cast(httpx.AsyncByteStream, response.stream),
+                partial(release_all, releases),
+            )
+
+        return response
+
+    async def aclose(self) -> None:
+        with map_pool_errors():
+            await self.pool.aclose()
+
+    async def _send(self, request: httpx.Request) -> httpx.Response:
+        pool_request = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(
+                scheme=request.url.raw_scheme,
+                host=request.url.raw_host,
+                port=request.url.port,
+                target=request.url.raw_path,
+            ),
+            headers=request.headers.raw,
+            content=cast(httpx.AsyncByteStream, request.stream),
+            extensions=request.extensions,
+        )
+
+        with map_pool_errors(request):
+            response = await self.pool.handle_async_request(pool_request)
+
+        return httpx.Response(
+            status_code=response.status,
+            headers=response.headers,
+            stream=PoolResponseStream(cast(AsyncIterable[bytes], response.stream)),
+            extensions=response.extensions,
+        )
+
+    async def _send_tracked(self, request: httpx.Request) -> httpx.Response:
+        if self.host_health is None:
+            return await self._send(request)
+
+        host = request.url.host
+        started = time.monotonic()
+
+        try:
+            response = await self._send(request)
+        except Exception:
+            self.host_health.record(host, time.monotonic() - started, ok=False)
+            raise
+
+        self.host_health.record(
+            host, time.monotonic() - started, ok=not response.is_server_error
+        )
+
+        return response
+
+
+def release_all(releases: list[Callable[[], None]]) -> None:
+    for release in releases:
+        release()
+
+
+def get_signed_request_auth(
+    settings: CapsuleSettings, key_type: KeyType
+) -> SignedRequestAuth:
+    if key_type == KeyType.ed25519:
+        return SignedRequestAuth(
+            public_key_id=HttpUrl(settings.ed25519_key_id),
+            private_key=settings.ed25519_private_key,
+        )
+
+    return SignedRequestAuth(
+        public_key_id=HttpUrl(settings.public_key_id),
+        private_key=settings.private_key,
+    )
+
+
+class FederationClient(httpx.AsyncClient):
+    federation_transport: FederationTransport
+
+    flights: dict[FlightKey, asyncio.Task[httpx.Response]]
+    coalesced: int
+
+    def __init__(
+        self,
+        *,
+        settings: CapsuleSettings,
+        host_health: HostHealthTracker | None = None,
+    ) -> None:
+        http2 = settings.http_client_http2
+
+        if http2 and find_spec("h2") is None:
+            logger.warning("HTTP/2 requested but h2 is not installed, using HTTP/1.1")
+            http2 = False
+
+        self.federation_transport = FederationTransport(
+            settings=settings, http2=http2, host_health=host_health
+        )
+
+        super().__init__(
+            headers={"User-Agent": settings.user_agent},
+            timeout=httpx.Timeout(
+                settings.http_client_read_timeout,
+                connect=settings.http_client_connect_timeout,
+            ),
+            transport=self.federation_transport,
+        )
+
+        self.flights = {}
+        self.coalesced = 0
+
+    @property
+    def network_backend(self) -> CachingNetworkBackend:
+        return self.federation_transport.network_backend
+
+    @property
+    def governor(self) -> FetchGovernor:
+        return self.federation_transport.governor
+
+    @property
+    def host_health(self) -> HostHealthTracker | None:
+        return self.federation_transport.host_health
+
+    async def dereference(
+        self,
+        url: str,
+        *,
+        auth: httpx.Auth,
+        headers: dict[str, str] | None = None,
+    ) -> httpx.Response:
+        headers = headers or {}
+        key = (url, tuple(sorted(headers.items())))
+        flight = self.flights.get(key)
+
+        if flight is None:
+            flight = asyncio.create_task(
+                self.get(url, auth=auth, headers={"Accept": ACTIVITY_ACCEPT, **headers})
+            )
+            flight.add_done_callback(partial(self._land, key))
+            self.flights[key] = flight
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(flight)
+
+    def _land(self, key: FlightKey, flight: asyncio.Task[httpx.Response]) -> None:
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+        if not flight.cancelled():
+            flight.exception()
+
+    async def aclose(self) -> None:
+        for flight in self.flights.values():
+            flight.cancel()
+
+        await super().aclose()
+
+
+def federation_client_factory(container: Container) -> FederationClient:
+    return FederationClient(
+        settings=get_capsule_settings(container),
+        host_health=get_host_health_tracker(container),
+    )
+
+
+def get_federation_client(container: Container) -> FederationClient:
+    return get_service(container, FederationClient)
+
+
+def _federation_client_injection(container: DepContainer) -> FederationClient:
+    return get_federation_client(container)
+
+
+FederationClientInjection = Annotated[
+    FederationClient, Depends(_federation_client_injection)
+]
@@ -0,0 +1,320 @@
+import asyncio
+import time
+from contextlib import suppress
+from datetime import timedelta
+from typing import Annotated, cast
+
+import httpx
+from fastapi import Depends
+from loguru import logger
+from pydantic import HttpUrl
+from svcs import Container
+from svcs.fastapi import DepContainer
+from wheke import get_service
+from wheke_sqlmodel import get_sqlmodel_service
+
+from capsule.security.utils import KeyType
+from capsule.settings import CapsuleSettings, get_capsule_settings
+from capsule.utils import utc_now
+
+from .backoff import backoff_delay
+from .client import (
+    FederationClient,
+    get_federation_client,
+    get_signed_request_auth,
+)
+from .governor import HostSlots
+from .models import Delivery, DeliveryStatus
+from .repositories import DeliveryRepository
+
+RETRYABLE_CLIENT_ERRORS = {
+    httpx.codes.REQUEST_TIMEOUT,
+    httpx.codes.TOO_MANY_REQUESTS,
+}
+
+
+class DeliveryWorker:
+    settings: CapsuleSettings
+    deliveries: DeliveryRepository
+    http_client: FederationClient
+
+    task: asyncio.Task | None
+    in_flight: dict[asyncio.Task, int]
+    leasing: bool
+    wakeup: asyncio.Event
+    slots: asyncio.Semaphore
+    host_slots: HostSlots
+    reap_at: float
+
+    delivered: int
+    retried: int
+    deferred: int
+    dead: int
+
+    def __init__(
+        self,
+        *,
+        settings: CapsuleSettings,
+        delivery_repository: DeliveryRepository,
+        federation_client: FederationClient,
+    ) -> None:
+        self.settings = settings
+        self.deliveries = delivery_repository
+        self.http_client = federation_client
+
+        self.task = None
+        self.in_flight = {}
+        self.leasing = False
+        self.wakeup = asyncio.Event()
+        self.slots = asyncio.Semaphore(max(settings.delivery_workers, 1))
+        self.host_slots = HostSlots(max(settings.delivery_max_per_host, 1))
+        self.reap_at = 0
+
+        self.delivered = 0
+        self.retried = 0
+        self.deferred = 0
+        self.dead = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self.task is not None
+
+    @property
+    def is_busy(self) -> bool:
+        return self.leasing or len(self.in_flight) > 0
+
+    async def start(self) -> None:
+        if self.is_running:
+            return
+
+        await self.reap()
+
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        leased_ids = list(self.in_flight.values())
+        tasks = [*self.in_flight, *([self.task] if self.task else [])]
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.task = None
+        self.in_flight.clear()
+
+        if leased_ids:
+            released = await self.deliveries.release_leases(leased_ids)
+
+            logger.info("Released {} delivery leases on shutdown", released)
+
+    async def reap(self) -> None:
+        self.reap_at = time.monotonic() + self.settings.delivery_poll_interval
+
+        released = await self.deliveries.release_expired_leases(
+            utc_now(), list(self.in_flight.values())
+        )
+
+        if released > 0:
+            logger.info("Released {} expired delivery leases", released)
+
+    async def join(self) -> None:
+        while self.is_running:
+            if self.in_flight:
+                await asyncio.gather(*self.in_flight, return_exceptions=True)
+                continue
+
+            if (
+                not self.is_busy
+                and await self.deliveries.count_due_deliveries(utc_now()) == 0
+                and not self.is_busy
+            ):
+                return
+
+            self.wakeup.set()
+            await asyncio.sleep(0.01)
+
+    async def enqueue(
+        self, activity: dict, inbox: HttpUrl, key_type: KeyType = KeyType.rsa
+    ) -> Delivery:
+        delivery = await self.deliveries.create_delivery(
+            Delivery(
+                activity=activity,
+                inbox=str(inbox),
+                host=inbox.host or "",
+                key_type=key_type,
+            )
+        )
+
+        self.wakeup.set()
+
+        return delivery
+
+    async def enqueue_many(
+        self, activity: dict, inboxes: list[HttpUrl], key_type: KeyType = KeyType.rsa
+    ) -> int:
+        await self.deliveries.create_deliveries(
+            [
+                Delivery(
+                    activity=activity,
+                    inbox=str(inbox),
+                    host=inbox.host or "",
+                    key_type=key_type,
+                )
+                for inbox in inboxes
+            ]
+        )
+
+        self.wakeup.set()
+
+        return len(inboxes)
+
+    async def deliver(self, delivery: Delivery) -> None:
+        delivery_id = cast(int, delivery.id)
+        retry_after = self._host_retry_after(delivery.host)
+
+        if retry_after > 0:
+            self.deferred += 1
+            await self.deliveries.update_delivery(
+                delivery_id,
+                DeliveryStatus.pending,
+                attempts=delivery.attempts,
+                next_attempt_at=utc_now() + timedelta(seconds=retry_after),
+                last_error=delivery.last_error,
+            )
+            return
+
+        async with self.host_slots.hold(delivery.host), self.slots:
+            error, retryable = await self._send(delivery)
+
+        attempts = delivery.attempts + 1
+
+        if error is None:
+            self.delivered += 1
+            await self.deliveries.update_delivery(
+                delivery_id, DeliveryStatus.delivered, attempts=attempts
+            )
+        elif retryable and attempts < self.settings.delivery_max_attempts:
+            self.retried += 1
+            delay = backoff_delay(
+                self.settings.delivery_retry_base,
+                self.settings.delivery_retry_max,
+                attempts,
+            )
+            await self.deliveries.update_delivery(
+                delivery_id,
+                DeliveryStatus.pending,
+                attempts=attempts,
+                next_attempt_at=utc_now() + timedelta(seconds=delay),
+                last_error=error,
+            )
+        else:
+            self.dead += 1
+            logger.bind(
+                delivery_id=delivery_id, inbox=delivery.inbox, error=error
+            ).warning("Delivery moved to dead letters")
+            await self.deliveries.update_delivery(
+                delivery_id, DeliveryStatus.dead, attempts=attempts, last_error=error
+            )
+
+    def _host_retry_after(self, host: str) -> float:
+        retry_after = self.http_client.governor.retry_after(host)
+
+        if self.http_client.host_health is not None:
+            retry_after = max(
+                retry_after, self.http_client.host_health.retry_after(host)
+            )
+
+        return retry_after
+
+    async def _send(self, delivery: Delivery) -> tuple[str | None, bool]:
+        try:
+            response = await self.http_client.post(
+                delivery.inbox,
+                json=delivery.activity,
+                auth=get_signed_request_auth(self.settings, delivery.key_type),
+                headers={"Content-Type": "application/activity+json"},
+            )
+        except httpx.HTTPError as exc:
+            return f"{type(exc).__name__}: {exc}", True
+
+        if not response.is_error:
+            return None, False
+
+        retryable = (
+            response.is_server_error or response.status_code in RETRYABLE_CLIENT_ERRORS
+        )
+
+        return f"HTTP {response.status_code}", retryable
+
+    async def _run(self) -> None:
+        while True:
+            capacity = self.settings.delivery_batch_size - len(self.in_flight)
+
+            self.wakeup.clear()
+
+            if time.monotonic() >= self.reap_at:
+                try:
+                    await self.reap()
+                except Exception:
+                    logger.exception("Failed to release expired delivery leases")
+
+            if capacity > 0 and await self._lease(capacity):
+                continue
+
+            with suppress(TimeoutError):
+                await asyncio.wait_for(
+                    self.wakeup.wait(), self.settings.delivery_poll_interval
+                )
+
+    async def _lease(self, capacity: int) -> bool:
+        self.leasing = True
+
+        try:
+            deliveries = await self.deliveries.lease_due_deliveries(
+                utc_now(),
+                capacity,
+                utc_now() + timedelta(seconds=self.settings.delivery_lease_seconds),
+                per_host=self.host_slots.limit,
+            )
+        except Exception:
+            logger.exception("Failed to lease deliveries")
+            return False
+        finally:
+            self.leasing = False
+
+        for delivery in deliveries:
+            task = asyncio.create_task(self._deliver_safely(delivery))
+            self.in_flight[task] = cast(int, delivery.id)
+            task.add_done_callback(self._on_delivered)
+
+        return len(deliveries) > 0
+
+    async def _deliver_safely(self, delivery: Delivery) -> None:
+        try:
+            await self.deliver(delivery)
+        except Exception:
+            logger.bind(delivery_id=delivery.id).exception("Failed to deliver")
+
+    def _on_delivered(self, task: asyncio.Task) -> None:
+        self.in_flight.pop(task, None)
+        self.wakeup.set()
+
+
+def delivery_worker_factory(container: Container) -> DeliveryWorker:
+    return DeliveryWorker(
+        settings=get_capsule_settings(container),
+        delivery_repository=DeliveryRepository(get_sqlmodel_service(container)),
+        federation_client=get_federation_client(container),
+    )
+
+
+def get_delivery_worker(container: Container) -> DeliveryWorker:
+    return get_service(container, DeliveryWorker)
+
+
+def _delivery_worker_injection(container: DepContainer) -> DeliveryWorker:
+    return get_delivery_worker(container)
+
+
+DeliveryWorkerInjection = Annotated[DeliveryWorker, Depends(_delivery_worker_injection)]
@@ -0,0 +1,159 @@
+import gzip
+import hashlib
+from collections.abc import Callable, Hashable
+from typing import Annotated
+
+from fastapi import Depends, Request, Response
+from svcs import Container
+from svcs.fastapi import DepContainer
+from wheke import get_service
+
+from capsule.settings import CapsuleSettings, get_capsule_settings
+
+GZIP_MIN_SIZE = 512
+
+
+def compute_etag(body: bytes) -> str:
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+
+    candidates = {candidate.strip() for candidate in header.split(",")}
+
+    return "*" in candidates or etag in {
+        candidate.removeprefix("W/") for candidate in candidates
+    }
+
+
+class CachedDocument:
+    key: Hashable
+    media_type: str
+    body: bytes
+    etag: str
+    gzip_body: bytes | None
+    gzip_etag: str
+
+    def __init__(
+        self, key: Hashable, body: bytes, media_type: str, *, compress: bool
+    ) -> None:
+        self.key = key
+        self.media_type = media_type
+        self.body = body
+        self.etag = compute_etag(body)
+        self.gzip_body = (
+            gzip.compress(body, mtime=0)
+            if compress and len(body) >= GZIP_MIN_SIZE
+            else None
+        )
+        self.gzip_etag = f'{self.etag[:-1]}-gzip"'
+
+    def render(self, request: Request, max_age: int) -> Response:
+        use_gzip = self.gzip_body is not None and "gzip" in request.headers.get(
+            "accept-encoding", ""
+        )
+        etag = self.gzip_etag if use_gzip else self.etag
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"public, max-age={max_age}",
+        }
+
+        if self.gzip_body is not None:
+            headers["Vary"] = "Accept-Encoding"
+
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
+        if use_gzip:
+            headers["Content-Encoding"] = "gzip"
+
+        return Response(
+            self.gzip_body if use_gzip else self.body,
+            media_type=self.media_type,
+            headers=headers,
+        )
+
+
+class DocumentCache:
+    settings: CapsuleSettings
+
+    documents: dict[str, CachedDocument]
+    hits: int
+    builds: int
+
+    def __init__(self, *, settings: CapsuleSettings) -> None:
+        self.settings = settings
+
+        self.documents = {}
+        self.hits = 0
+        self.builds = 0
+
+    @property
+    def settings_version(self) -> Hashable:
+        settings = self.settings
+
+        return (
+            str(settings.hostname),
+            settings.project_name,
+            settings.username,
+            settings.name,
+            settings.summary,
+            settings.profile_image,
+            settings.public_key,
+            settings.ed25519_public_key,
+        )
+
+    def get(
+        self,
+        name: str,
+        media_type: str,
+        build: Callable[[], bytes],
+        *,
+        key: Hashable = None,
+    ) -> CachedDocument:
+        key = (self.settings_version, key)
+        document = self.documents.get(name)
+
+        if document is not None and document.key == key:
+            self.hits += 1
+            return document
+
+        self.builds += 1
+        document = self.documents[name] = CachedDocument(
+            key, build(), media_type, compress=self.settings.document_cache_gzip
+        )
+
+        return document
+
+    def render(
+        self,
+        request: Request,
+        name: str,
+        media_type: str,
+        build: Callable[[], bytes],
+        *,
+        key: Hashable = None,
+    ) -> Response:
+        return self.get(name, media_type, build, key=key).render(
+            request, self.settings.document_cache_max_age
+        )
+
+    def clear(self) -> None:
+        self.documents.clear()
+
+
+def document_cache_factory(container: Container) -> DocumentCache:
+    return DocumentCache(settings=get_capsule_settings(container))
+
+
+def get_document_cache(container: Container) -> DocumentCache:
+    return get_service(container, DocumentCache)
+
+
+def _document_cache_injection(container: DepContainer) -> DocumentCache:
+    return get_document_cache(container)
+
+
+DocumentCacheInjection = Annotated[DocumentCache, Depends(_document_cache_injection)]
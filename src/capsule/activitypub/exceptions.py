@@ -1,2 +1,13 @@
+import httpx
+
+
 class EnsureActorError(Exception):
     pass
+
+
+class ForgedActivityError(Exception):
+    pass
+
+
+class HostUnavailableError(httpx.TransportError):
+    pass
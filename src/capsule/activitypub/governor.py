@@ -0,0 +1,243 @@
+import asyncio
+import time
+from collections import Counter, OrderedDict
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from capsule.settings import CapsuleSettings
+from capsule.utils import utc_now
+
+from .limiter import TokenBucket
+
+RESET_EPOCH_THRESHOLD = 1_000_000_000
+
+THROTTLED_STATUS_CODES = {
+    httpx.codes.TOO_MANY_REQUESTS,
+    httpx.codes.SERVICE_UNAVAILABLE,
+}
+
+
+class HostSlots:
+    limit: int
+
+    semaphores: dict[str, asyncio.Semaphore]
+    users: Counter[str]
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+
+        self.semaphores = {}
+        self.users = Counter()
+
+    async def acquire(self, host: str) -> None:
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.limit)
+
+        self.users[host] += 1
+
+        try:
+            await self.semaphores[host].acquire()
+        except BaseException:
+            self._leave(host)
+            raise
+
+    def release(self, host: str) -> None:
+        self.semaphores[host].release()
+        self._leave(host)
+
+    @asynccontextmanager
+    async def hold(self, host: str) -> AsyncGenerator[None]:
+        await self.acquire(host)
+
+        try:
+            yield
+        finally:
+            self.release(host)
+
+    def _leave(self, host: str) -> None:
+        self.users[host] -= 1
+
+        if self.users[host] <= 0:
+            del self.users[host]
+            del self.semaphores[host]
+
+
+def seconds_until(moment: datetime) -> float:
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=UTC)
+
+    return max((moment - utc_now()).total_seconds(), 0)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except ValueError:
+        return None
+
+    return seconds_until(retry_at)
+
+
+def parse_rate_limit_reset(value: str | None) -> float | None:
+    if not value:
+        return None
+
+    try:
+        reset = float(value)
+    except ValueError:
+        pass
+    else:
+        return (
+            max(reset - time.time(), 0)
+            if reset > RESET_EPOCH_THRESHOLD
+            else max(reset, 0)
+        )
+
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+    return seconds_until(reset_at)
+
+
+class HostBudget:
+    bucket: TokenBucket
+    blocked_until: float
+
+    def __init__(self, bucket: TokenBucket) -> None:
+        self.bucket = bucket
+        self.blocked_until = 0
+
+
+class FetchGovernor:
+    settings: CapsuleSettings
+
+    slots: HostSlots
+    budgets: OrderedDict[str, HostBudget]
+    throttled: int
+
+    def __init__(self, *, settings: CapsuleSettings) -> None:
+        self.settings = settings
+
+        self.slots = HostSlots(max(settings.fetch_max_per_host, 1))
+        self.budgets = OrderedDict()
+        self.throttled = 0
+
+    @property
+    def size(self) -> int:
+        return len(self.budgets)
+
+    async def acquire(self, host: str) -> bool:
+        await self.slots.acquire(host)
+
+        try:
+            allowed = await self._wait_turn(host)
+        except BaseException:
+            self.slots.release(host)
+            raise
+
+        if not allowed:
+            self.slots.release(host)
+
+        return allowed
+
+    def release(self, host: str) -> None:
+        self.slots.release(host)
+
+    def retry_after(self, host: str) -> float:
+        budget = self.budgets.get(host)
+
+        if budget is None:
+            return 0
+
+        return max(budget.blocked_until - time.monotonic(), 0)
+
+    def observe(self, host: str, response: httpx.Response) -> None:
+        delay = None
+
+        if response.status_code in THROTTLED_STATUS_CODES:
+            delay = parse_retry_after(response.headers.get("Retry-After"))
+
+        remaining = response.headers.get("X-RateLimit-Remaining")
+
+        if remaining is None and delay is None:
+            if response.status_code == httpx.codes.TOO_MANY_REQUESTS:
+                self._get_budget(host).bucket.tokens = 0
+
+            return
+
+        budget = self._get_budget(host)
+
+        try:
+            tokens = float(remaining) if remaining is not None else None
+        except ValueError:
+            tokens = None
+
+        if tokens is not None:
+            budget.bucket.tokens = min(budget.bucket.tokens, tokens)
+
+            if tokens <= 0:
+                reset = parse_rate_limit_reset(
+                    response.headers.get("X-RateLimit-Reset")
+                )
+                delay = max(delay or 0, reset or 0)
+
+        if delay:
+            budget.blocked_until = max(
+                budget.blocked_until,
+                time.monotonic() + min(delay, self.settings.fetch_retry_after_max),
+            )
+
+    async def _wait_turn(self, host: str) -> bool:
+        rate = self.settings.fetch_rate_limit
+        burst = self.settings.fetch_rate_limit_burst
+        throttled = False
+
+        while True:
+            budget = self._get_budget(host)
+            now = time.monotonic()
+            delay = budget.blocked_until - now
+
+            if delay <= 0:
+                if rate <= 0 or budget.bucket.consume(rate, burst, now):
+                    return True
+
+                delay = (1 - budget.bucket.tokens) / rate
+
+            if delay > self.settings.fetch_max_wait:
+                return False
+
+            if not throttled:
+                throttled = True
+                self.throttled += 1
+
+            await asyncio.sleep(delay)
+
+    def _get_budget(self, host: str) -> HostBudget:
+        budget = self.budgets.get(host)
+
+        if budget is not None:
+            self.budgets.move_to_end(host)
+            return budget
+
+        budget = self.budgets[host] = HostBudget(
+            TokenBucket(self.settings.fetch_rate_limit_burst, time.monotonic())
+        )
+
+        while len(self.budgets) > self.settings.fetch_governor_hosts:
+            self.budgets.popitem(last=False)
+
+        return budget
@@ -0,0 +1,256 @@
+import asyncio
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Annotated
+
+from fastapi import Depends
+from loguru import logger
+from svcs import Container
+from svcs.fastapi import DepContainer
+from wheke import get_service
+from wheke_sqlmodel import get_sqlmodel_service
+
+from capsule.settings import CapsuleSettings, get_capsule_settings
+from capsule.utils import utc_now
+
+from .models import CircuitState, HostHealth
+from .repositories import HostHealthRepository
+
+HALF_OPEN_RETRY_AFTER = 1.0
+
+
+class HostCircuit:
+    health: HostHealth
+    samples: deque[tuple[float, bool]]
+    consecutive_failures: int
+    probing: bool
+
+    def __init__(self, health: HostHealth, window: int) -> None:
+        self.health = health
+        self.samples = deque(maxlen=max(window, 1))
+        self.consecutive_failures = 0
+        self.probing = False
+
+    @property
+    def state(self) -> CircuitState:
+        return self.health.state
+
+    def is_open(self, now: datetime) -> bool:
+        return (
+            self.health.state == CircuitState.open
+            and self.health.opened_until is not None
+            and self.health.opened_until > now
+        )
+
+    def add_sample(self, latency: float, *, ok: bool, now: datetime) -> None:
+        self.samples.append((latency * 1000, ok))
+
+        latencies = sorted(sample for sample, _ in self.samples)
+        failures = sum(1 for _, sample_ok in self.samples if not sample_ok)
+
+        self.health.requests += 1
+        self.health.failures += 0 if ok else 1
+        self.health.error_rate = failures / len(self.samples)
+        self.health.latency_p50 = latencies[int(0.5 * (len(latencies) - 1))]
+        self.health.latency_p95 = latencies[int(0.95 * (len(latencies) - 1))]
+        self.health.updated_at = now
+
+        if ok:
+            self.health.last_success_at = now
+        else:
+            self.health.last_failure_at = now
+
+
+class HostHealthTracker:
+    settings: CapsuleSettings
+    repository: HostHealthRepository
+
+    circuits: OrderedDict[str, HostCircuit]
+    dirty: set[str]
+    task: asyncio.Task | None
+    short_circuited: int
+
+    def __init__(
+        self,
+        *,
+        settings: CapsuleSettings,
+        host_health_repository: HostHealthRepository,
+    ) -> None:
+        self.settings = settings
+        self.repository = host_health_repository
+
+        self.circuits = OrderedDict()
+        self.dirty = set()
+        self.task = None
+        self.short_circuited = 0
+
+    @property
+    def is_enabled(self) -> bool:
+        return self.settings.host_circuit_failure_threshold > 0
+
+    @property
+    def open_hosts(self) -> int:
+        now = utc_now()
+
+        return sum(1 for circuit in self.circuits.values() if circuit.is_open(now))
+
+    def allow(self, host: str) -> bool:
+        circuit = self.circuits.get(host)
+
+        if not self.is_enabled or circuit is None:
+            return True
+
+        if circuit.state == CircuitState.closed:
+            return True
+
+        if circuit.is_open(utc_now()):
+            self.short_circuited += 1
+            return False
+
+        if circuit.state == CircuitState.open:
+            self._transition(host, circuit, CircuitState.half_open)
+
+        if circuit.probing:
+            self.short_circuited += 1
+            return False
+
+        circuit.probing = True
+
+        return True
+
+    def retry_after(self, host: str) -> float:
+        circuit = self.circuits.get(host)
+        now = utc_now()
+
+        if not self.is_enabled or circuit is None:
+            return 0
+
+        if circuit.is_open(now) and circuit.health.opened_until is not None:
+            return (circuit.health.opened_until - now).total_seconds()
+
+        if circuit.state == CircuitState.half_open and circuit.probing:
+            return HALF_OPEN_RETRY_AFTER
+
+        return 0
+
+    def record(self, host: str, latency: float, *, ok: bool) -> None:
+        circuit = self._get_circuit(host)
+        now = utc_now()
+
+        circuit.add_sample(latency, ok=ok, now=now)
+        circuit.probing = False
+        self.dirty.add(host)
+
+        if ok:
+            circuit.consecutive_failures = 0
+
+            if circuit.state != CircuitState.closed:
+                self._transition(host, circuit, CircuitState.closed)
+
+            return
+
+        circuit.consecutive_failures += 1
+
+        if self.is_enabled and (
+            circuit.state == CircuitState.half_open
+            or (
+                circuit.state == CircuitState.closed
+                and circuit.consecutive_failures
+                >= self.settings.host_circuit_failure_threshold
+            )
+        ):
+            self._transition(host, circuit, CircuitState.open)
+
+    def abandon(self, host: str) -> None:
+        circuit = self.circuits.get(host)
+
+        if circuit is not None:
+            circuit.probing = False
+
+    async def load(self) -> None:
+        for health in await self.repository.list_hosts(
+            limit=self.settings.host_health_size
+        ):
+            self.circuits.setdefault(
+                health.host, HostCircuit(health, self.settings.host_health_window)
+            )
+
+    async def start(self) -> None:
+        if self.task is None:
+            await self.load()
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+        await self.flush()
+
+    async def flush(self) -> None:
+        hosts, self.dirty = self.dirty, set()
+        records = [
+            self.circuits[host].health for host in hosts if host in self.circuits
+        ]
+
+        try:
+            await self.repository.upsert_hosts(records)
+        except Exception:
+            self.dirty |= hosts
+            logger.exception("Failed to flush host health")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.settings.host_health_flush_interval)
+            await self.flush()
+
+    def _get_circuit(self, host: str) -> HostCircuit:
+        circuit = self.circuits.get(host)
+
+        if circuit is None:
+            circuit = self.circuits[host] = HostCircuit(
+                HostHealth(host=host), self.settings.host_health_window
+            )
+
+            while len(self.circuits) > self.settings.host_health_size:
+                evicted, _ = self.circuits.popitem(last=False)
+                self.dirty.discard(evicted)
+        else:
+            self.circuits.move_to_end(host)
+
+        return circuit
+
+    def _transition(self, host: str, circuit: HostCircuit, state: CircuitState) -> None:
+        circuit.health.state = state
+        circuit.health.updated_at = utc_now()
+        self.dirty.add(host)
+
+        if state == CircuitState.open:
+            circuit.health.opened_until = utc_now() + timedelta(
+                seconds=self.settings.host_circuit_open_seconds
+            )
+            logger.bind(host=host).warning("Host circuit opened")
+        elif state == CircuitState.closed:
+            circuit.health.opened_until = None
+            logger.bind(host=host).info("Host circuit closed")
+
+
+def host_health_tracker_factory(container: Container) -> HostHealthTracker:
+    return HostHealthTracker(
+        settings=get_capsule_settings(container),
+        host_health_repository=HostHealthRepository(get_sqlmodel_service(container)),
+    )
+
+
+def get_host_health_tracker(container: Container) -> HostHealthTracker:
+    return get_service(container, HostHealthTracker)
+
+
+def _host_health_tracker_injection(container: DepContainer) -> HostHealthTracker:
+    return get_host_health_tracker(container)
+
+
+HostHealthTrackerInjection = Annotated[
+    HostHealthTracker, Depends(_host_health_tracker_injection)
+]
@@ -0,0 +1,124 @@
+import time
+from collections import OrderedDict
+from math import ceil
+from typing import Annotated
+
+from fastapi import Depends
+from svcs import Container
+from svcs.fastapi import DepContainer
+from wheke import get_service
+from wheke_sqlmodel import get_sqlmodel_service
+
+from capsule.settings import CapsuleSettings, RateLimitBackend, get_capsule_settings
+
+from .repositories import RateLimitRepository
+
+
+class TokenBucket:
+    tokens: float
+    updated_at: float
+
+    def __init__(self, tokens: float, updated_at: float) -> None:
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+    def consume(self, rate: float, burst: int, now: float) -> bool:
+        self.tokens = min(burst, self.tokens + (now - self.updated_at) * rate)
+        self.updated_at = now
+
+        if self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+
+        return True
+
+
+class HostRateLimiter:
+    settings: CapsuleSettings
+    repository: RateLimitRepository
+
+    buckets: OrderedDict[str, TokenBucket]
+    pruned_at: float
+    limited: int
+
+    def __init__(
+        self,
+        *,
+        settings: CapsuleSettings,
+        rate_limit_repository: RateLimitRepository,
+    ) -> None:
+        self.settings = settings
+        self.repository = rate_limit_repository
+
+        self.buckets = OrderedDict()
+        self.pruned_at = 0
+        self.limited = 0
+
+    @property
+    def is_enabled(self) -> bool:
+        return self.settings.inbox_rate_limit > 0
+
+    async def acquire(self, host: str) -> int:
+        if not self.is_enabled:
+            return 0
+
+        rate = self.settings.inbox_rate_limit
+        burst = self.settings.inbox_rate_limit_burst
+
+        if self.settings.inbox_rate_limit_backend == RateLimitBackend.database:
+            now = time.time()
+            refill_time = burst / rate
+
+            if now - self.pruned_at >= refill_time:
+                self.pruned_at = now
+                await self.repository.delete_refilled(now - refill_time)
+
+            bucket = await self.repository.consume_token(host, rate, burst, now)
+            allowed = not bucket.limited
+            tokens = bucket.tokens
+        else:
+            allowed, tokens = self._consume(host, rate, burst)
+
+        if allowed:
+            return 0
+
+        self.limited += 1
+
+        return max(ceil((1 - tokens) / rate), 1)
+
+    def _consume(self, host: str, rate: float, burst: int) -> tuple[bool, float]:
+        now = time.monotonic()
+        bucket = self.buckets.get(host)
+
+        if bucket is None:
+            bucket = self.buckets[host] = TokenBucket(burst, now)
+
+            while len(self.buckets) > self.settings.inbox_rate_limit_hosts:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(host)
+
+        allowed = bucket.consume(rate, burst, now)
+
+        return allowed, bucket.tokens
+
+
+def host_rate_limiter_factory(container: Container) -> HostRateLimiter:
+    return HostRateLimiter(
+        settings=get_capsule_settings(container),
+        rate_limit_repository=RateLimitRepository(get_sqlmodel_service(container)),
+    )
+
+
+def get_host_rate_limiter(container: Container) -> HostRateLimiter:
+    return get_service(container, HostRateLimiter)
+
+
+def _host_rate_limiter_injection(container: DepContainer) -> HostRateLimiter:
+    return get_host_rate_limiter(container)
+
+
+HostRateLimiterInjection = Annotated[
+    HostRateLimiter, Depends(_host_rate_limiter_injection)
+]
@@ -1,15 +1,37 @@
-from .actor import Actor, ActorAP, ActorType, PublicKey
-from .follow import Follow, FollowStatus
-from .inbox import Activity, InboxEntry, InboxEntryStatus
+from .actor import Actor, ActorAP, ActorType, Multikey, PublicKey
+from .delivery import Delivery, DeliveryStatus
+from .follow import DeliveryTarget, Follow, FollowStatus
+from .health import CircuitState, HostHealth
+from .inbox import (
+    Activity,
+    InboxCleanupResult,
+    InboxEntry,
+    InboxEntryAgeField,
+    InboxEntryStatus,
+    InboxRetentionPolicy,
+    RawActivity,
+)
+from .ratelimit import HostRateLimit
 
 __all__ = [
     "Activity",
     "Actor",
     "ActorAP",
     "ActorType",
+    "CircuitState",
+    "Delivery",
+    "DeliveryStatus",
+    "DeliveryTarget",
     "Follow",
     "FollowStatus",
+    "HostHealth",
+    "HostRateLimit",
+    "InboxCleanupResult",
     "InboxEntry",
+    "InboxEntryAgeField",
     "InboxEntryStatus",
+    "InboxRetentionPolicy",
+    "Multikey",
     "PublicKey",
+    "RawActivity",
 ]
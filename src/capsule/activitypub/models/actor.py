@@ -1,8 +1,13 @@
 import mimetypes
+from datetime import datetime
 from enum import StrEnum
 
-from pydantic import BaseModel, ConfigDict, Field, HttpUrl
+from pydantic import BaseModel, ConfigDict, Field, HttpUrl, ValidationError
 
+from capsule.security.utils import (
+    multibase_to_public_key_pem,
+    public_key_pem_to_multibase,
+)
 from capsule.settings import CapsuleSettings
 
 
@@ -12,6 +17,19 @@ class PublicKey(BaseModel):
     public_key_pem: str = Field(alias="publicKeyPem")
 
 
+class Multikey(BaseModel):
+    id: HttpUrl
+    type: str
+    controller: HttpUrl
+    public_key_multibase: str = Field(alias="publicKeyMultibase")
+
+    model_config = ConfigDict(extra="allow")
+
+    @property
+    def is_ed25519(self) -> bool:
+        return self.type == "Multikey" and self.public_key_multibase.startswith("z6Mk")
+
+
 class ActorType(StrEnum):
     application = "Application"
     group = "Group"
@@ -33,6 +51,46 @@ class ActorAP(BaseModel):
 
     model_config = ConfigDict(extra="allow")
 
+    @property
+    def assertion_method(self) -> list[Multikey]:
+        value = (self.model_extra or {}).get("assertionMethod", [])
+        keys = []
+
+        for item in value if isinstance(value, list) else [value]:
+            try:
+                keys.append(Multikey.model_validate(item))
+            except ValidationError:
+                continue
+
+        return keys
+
+    @property
+    def shared_inbox(self) -> HttpUrl | None:
+        endpoints = (self.model_extra or {}).get("endpoints")
+
+        if not isinstance(endpoints, dict) or not endpoints.get("sharedInbox"):
+            return None
+
+        try:
+            return HttpUrl(endpoints["sharedInbox"])
+        except ValidationError:
+            return None
+
+    @property
+    def delivery_inbox(self) -> HttpUrl:
+        return self.shared_inbox or self.inbox
+
+    @property
+    def supports_ed25519(self) -> bool:
+        return any(key.is_ed25519 for key in self.assertion_method)
+
+    def get_public_key_pem(self, key_id: str) -> str:
+        for key in self.assertion_method:
+            if key.is_ed25519 and str(key.id) == key_id:
+                return multibase_to_public_key_pem(key.public_key_multibase)
+
+        return self.public_key.public_key_pem
+
     @classmethod
     def make_main_actor(cls, settings: CapsuleSettings) -> ActorAP:
         data: dict = {
@@ -58,6 +116,19 @@ class ActorAP(BaseModel):
             },
         }
 
+        if settings.ed25519_public_key:
+            data["@context"].insert(2, "https://w3id.org/security/multikey/v1")
+            data["assertionMethod"] = [
+                {
+                    "id": settings.ed25519_key_id,
+                    "type": "Multikey",
+                    "controller": settings.actor_url,
+                    "publicKeyMultibase": public_key_pem_to_multibase(
+                        settings.ed25519_public_key
+                    ),
+                }
+            ]
+
         if settings.profile_image:
             mime, _ = mimetypes.guess_type(settings.profile_image.name)
             data["icon"] = {
@@ -74,3 +145,6 @@ class Actor(BaseModel):
     ap_data: ActorAP
 
     is_local: bool = Field(default=False)
+    fetched_at: datetime | None = Field(default=None)
+    etag: str | None = Field(default=None)
+    last_modified: str | None = Field(default=None)
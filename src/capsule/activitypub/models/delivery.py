@@ -0,0 +1,39 @@
+from datetime import datetime
+from enum import StrEnum
+
+from sqlalchemy import JSON
+from sqlmodel import Field, SQLModel
+
+from capsule.security.utils import KeyType
+from capsule.types import DateTimeType
+from capsule.utils import utc_now
+
+
+class DeliveryStatus(StrEnum):
+    pending = "pending"
+    delivering = "delivering"
+    delivered = "delivered"
+    dead = "dead"
+
+
+class Delivery(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    status: DeliveryStatus = Field(default=DeliveryStatus.pending, index=True)
+    activity: dict = Field(sa_type=JSON)
+    inbox: str
+    host: str = Field(index=True)
+    key_type: KeyType = Field(default=KeyType.rsa)
+    attempts: int = Field(default=0)
+    last_error: str | None = Field(default=None, nullable=True)
+    next_attempt_at: datetime = Field(
+        default_factory=utc_now, sa_type=DateTimeType, index=True
+    )
+    leased_until: datetime | None = Field(
+        default=None, sa_type=DateTimeType, nullable=True
+    )
+    created_at: datetime = Field(default_factory=utc_now, sa_type=DateTimeType)
+    updated_at: datetime = Field(
+        default_factory=utc_now,
+        sa_type=DateTimeType,
+        sa_column_kwargs={"onupdate": utc_now},
+    )
@@ -9,6 +9,12 @@ class FollowStatus(StrEnum):
     accepted = "accepted"
 
 
+class DeliveryTarget(BaseModel):
+    actor: HttpUrl
+    inbox: HttpUrl
+    followers: int
+
+
 class Follow(BaseModel):
     id: HttpUrl
     from_actor: HttpUrl
@@ -0,0 +1,33 @@
+from datetime import datetime
+from enum import StrEnum
+
+from sqlmodel import Field, SQLModel
+
+from capsule.types import DateTimeType
+from capsule.utils import utc_now
+
+
+class CircuitState(StrEnum):
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+class HostHealth(SQLModel, table=True):
+    host: str = Field(primary_key=True)
+    state: CircuitState = Field(default=CircuitState.closed, index=True)
+    requests: int = Field(default=0)
+    failures: int = Field(default=0)
+    error_rate: float = Field(default=0.0)
+    latency_p50: float = Field(default=0.0)
+    latency_p95: float = Field(default=0.0)
+    last_success_at: datetime | None = Field(
+        default=None, sa_type=DateTimeType, nullable=True
+    )
+    last_failure_at: datetime | None = Field(
+        default=None, sa_type=DateTimeType, nullable=True
+    )
+    opened_until: datetime | None = Field(
+        default=None, sa_type=DateTimeType, nullable=True
+    )
+    updated_at: datetime = Field(default_factory=utc_now, sa_type=DateTimeType)
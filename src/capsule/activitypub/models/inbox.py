@@ -1,11 +1,11 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import StrEnum
+from functools import cached_property
 from typing import Any
 
 from pydantic import BaseModel, ConfigDict, HttpUrl
-from pydantic_core import to_jsonable_python
-from sqlalchemy import Dialect
-from sqlmodel import JSON, Field, SQLModel, TypeDecorator
+from sqlalchemy import JSON, Computed, Dialect, Text
+from sqlmodel import Field, SQLModel, TypeDecorator
 
 from capsule.types import DateTimeType
 from capsule.utils import utc_now
@@ -26,28 +26,83 @@ class Activity(BaseModel):
         return None
 
 
-class ActivityType(TypeDecorator[Activity]):
-    impl = JSON
+class ActivityObjectHeader(BaseModel):
+    type: str | None = None
+
+
+class ActivityHeader(BaseModel):
+    id: str
+    actor: HttpUrl
+    type: str
+    object: ActivityObjectHeader | str | list | None
+
+
+class RawActivity(BaseModel):
+    raw: bytes
+    raw_id: str
+    id: HttpUrl
+    actor: HttpUrl
+    type: str
+    object_type: str | None = None
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> RawActivity:
+        header = ActivityHeader.model_validate_json(raw)
+
+        return cls.model_construct(
+            raw=raw,
+            raw_id=header.id,
+            id=HttpUrl(header.id),
+            actor=header.actor,
+            type=header.type,
+            object_type=(
+                header.object.type
+                if isinstance(header.object, ActivityObjectHeader)
+                else None
+            ),
+        )
+
+    @cached_property
+    def parsed(self) -> Activity:
+        return Activity.model_validate_json(self.raw)
+
+    @property
+    def object(self) -> Any:
+        return self.parsed.object
+
+    @property
+    def is_actor_delete(self) -> bool:
+        return (
+            self.type == "Delete"
+            and self.object_type is None
+            and self.object == str(self.actor)
+        )
+
+
+class ActivityType(TypeDecorator[RawActivity]):
+    impl = Text
     cache_ok = True
-    python_type = Activity
+    python_type = RawActivity
 
     def process_bind_param(
         self,
-        value: BaseModel | None,
+        value: RawActivity | None,
         dialect: Dialect,  # noqa: ARG002
-    ) -> dict | None:
-        return to_jsonable_python(value) if value else None
+    ) -> str | None:
+        return value.raw.decode("utf8") if value else None
 
     def process_result_value(
         self,
-        value: dict | None,
+        value: str | None,
         dialect: Dialect,  # noqa: ARG002
-    ) -> Activity | None:
-        return Activity(**value) if value else None
+    ) -> RawActivity | None:
+        return RawActivity.from_bytes(value.encode("utf8")) if value else None
 
 
 class InboxEntryStatus(StrEnum):
     created = "created"
+    pending_verification = "pending_verification"
+    processing = "processing"
     synced = "synced"
     error = "error"
     not_implemented = "not_implemented"
@@ -55,11 +110,56 @@ class InboxEntryStatus(StrEnum):
 
 class InboxEntry(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
-    status: InboxEntryStatus = InboxEntryStatus.created
-    activity: Activity = Field(sa_type=ActivityType)
-    created_at: datetime = Field(default_factory=utc_now, sa_type=DateTimeType)
+    status: InboxEntryStatus = Field(default=InboxEntryStatus.created, index=True)
+    activity: RawActivity = Field(sa_type=ActivityType)
+    activity_id: str | None = Field(
+        default=None,
+        index=True,
+        unique=True,
+        sa_column_args=[Computed("json_extract(activity, '$.id')")],
+    )
+    activity_type: str | None = Field(
+        default=None,
+        index=True,
+        sa_column_args=[Computed("json_extract(activity, '$.type')")],
+    )
+    activity_actor: str | None = Field(
+        default=None,
+        index=True,
+        sa_column_args=[Computed("json_extract(activity, '$.actor')")],
+    )
+    request_headers: dict[str, str] | None = Field(
+        default=None, sa_type=JSON(none_as_null=True), nullable=True
+    )
+    leased_until: datetime | None = Field(
+        default=None, sa_type=DateTimeType, nullable=True
+    )
+    created_at: datetime = Field(
+        default_factory=utc_now, sa_type=DateTimeType, index=True
+    )
     updated_at: datetime = Field(
         default_factory=utc_now,
         sa_type=DateTimeType,
         sa_column_kwargs={"onupdate": utc_now},
+        index=True,
     )
+
+
+class InboxEntryAgeField(StrEnum):
+    created_at = "created_at"
+    updated_at = "updated_at"
+
+
+class InboxRetentionPolicy(BaseModel):
+    statuses: list[InboxEntryStatus] = [
+        InboxEntryStatus.synced,
+        InboxEntryStatus.not_implemented,
+    ]
+    max_age: timedelta
+    age_field: InboxEntryAgeField = InboxEntryAgeField.updated_at
+    chunk_size: int = Field(default=500, gt=0)
+
+
+class InboxCleanupResult(BaseModel):
+    deleted: int
+    elapsed: float
@@ -0,0 +1,8 @@
+from sqlmodel import Field, SQLModel
+
+
+class HostRateLimit(SQLModel, table=True):
+    host: str = Field(primary_key=True)
+    tokens: float
+    limited: bool = False
+    updated_at: float
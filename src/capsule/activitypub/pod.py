@@ -1,10 +1,55 @@
 from wheke import Pod, ServiceConfig
 
+from .backoff import FetchBackoff, fetch_backoff_factory
+from .cache import ActorCache, actor_cache_factory
+from .client import FederationClient, federation_client_factory
+from .delivery import DeliveryWorker, delivery_worker_factory
+from .documents import DocumentCache, document_cache_factory
+from .health import HostHealthTracker, host_health_tracker_factory
+from .limiter import HostRateLimiter, host_rate_limiter_factory
 from .routes import router
 from .service import ActivityPubService, activitypub_service_factory
+from .worker import InboxWorker, inbox_worker_factory
+from .writer import InboxWriter, inbox_writer_factory
 
 activitypub_pod = Pod(
     "activitypub",
-    services=[ServiceConfig(ActivityPubService, activitypub_service_factory)],
+    services=[
+        ServiceConfig(
+            InboxWriter,
+            inbox_writer_factory,
+            is_singleton=True,
+            singleton_cleanup_method="flush",
+        ),
+        ServiceConfig(ActorCache, actor_cache_factory, is_singleton=True),
+        ServiceConfig(DocumentCache, document_cache_factory, is_singleton=True),
+        ServiceConfig(FetchBackoff, fetch_backoff_factory, is_singleton=True),
+        ServiceConfig(
+            HostHealthTracker,
+            host_health_tracker_factory,
+            is_singleton=True,
+            singleton_cleanup_method="stop",
+        ),
+        ServiceConfig(
+            FederationClient,
+            federation_client_factory,
+            is_singleton=True,
+            singleton_cleanup_method="aclose",
+        ),
+        ServiceConfig(
+            DeliveryWorker,
+            delivery_worker_factory,
+            is_singleton=True,
+            singleton_cleanup_method="stop",
+        ),
+        ServiceConfig(ActivityPubService, activitypub_service_factory),
+        ServiceConfig(HostRateLimiter, host_rate_limiter_factory, is_singleton=True),
+        ServiceConfig(
+            InboxWorker,
+            inbox_worker_factory,
+            is_singleton=True,
+            singleton_cleanup_method="stop",
+        ),
+    ],
     router=router,
 )
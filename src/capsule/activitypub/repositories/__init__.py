@@ -1,9 +1,15 @@
 from .actor import ActorRepository
+from .delivery import DeliveryRepository
 from .follow import FollowRepository
+from .health import HostHealthRepository
 from .inbox import InboxRepository
+from .ratelimit import RateLimitRepository
 
 __all__ = [
     "ActorRepository",
+    "DeliveryRepository",
     "FollowRepository",
+    "HostHealthRepository",
     "InboxRepository",
+    "RateLimitRepository",
 ]
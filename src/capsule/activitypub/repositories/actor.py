@@ -3,12 +3,28 @@ from typing import cast
 from ladybug import QueryResult
 from pydantic import HttpUrl
 from pydantic_core import to_jsonable_python
-from wheke_ladybug import LadybugRepository
+from wheke_ladybug import LadybugRepository, LadybugService
 
+from capsule.activitypub.cache import ActorCache
 from capsule.activitypub.models import Actor, ActorAP
 
+ACTOR_FETCH_COLUMNS = [
+    ("fetched_at", "DOUBLE"),
+    ("etag", "STRING"),
+    ("last_modified", "STRING"),
+]
+
 
 class ActorRepository(LadybugRepository):
+    cache: ActorCache | None
+
+    def __init__(
+        self, ladybug_service: LadybugService, cache: ActorCache | None = None
+    ) -> None:
+        super().__init__(ladybug_service)
+
+        self.cache = cache
+
     async def create_table(self) -> None:
         with self.db.async_connection as conn:
             await conn.execute(
@@ -17,16 +33,46 @@ class ActorRepository(LadybugRepository):
                 (
                     id STRING PRIMARY KEY,
                     ap_data JSON,
-                    is_local BOOLEAN
+                    is_local BOOLEAN,
+                    fetched_at DOUBLE,
+                    etag STRING,
+                    last_modified STRING
                 );
                 """
             )
 
+    async def migrate_table(self) -> None:
+        await self.create_table()
+
+        with self.db.async_connection as conn:
+            for column, column_type in ACTOR_FETCH_COLUMNS:
+                await conn.execute(
+                    f"ALTER TABLE Actor ADD IF NOT EXISTS {column} {column_type};"
+                )
+
     async def drop_table(self) -> None:
         with self.db.async_connection as conn:
             await conn.execute("DROP TABLE IF EXISTS Actor;")
 
+        if self.cache is not None:
+            self.cache.clear()
+
     async def get_actor(self, actor_id: HttpUrl) -> Actor | None:
+        if self.cache is None:
+            return await self._get_actor(actor_id)
+
+        actor = self.cache.get(actor_id)
+
+        if actor is None:
+            generation = self.cache.generation
+            actor = await self._get_actor(actor_id)
+
+            if actor is not None:
+                self.cache.put(actor, generation)
+
+        return actor
+
+    async def _get_actor(self, actor_id: HttpUrl) -> Actor | None:
         with self.db.async_connection as conn:
             response = cast(
                 QueryResult,
@@ -37,7 +83,10 @@ class ActorRepository(LadybugRepository):
                     RETURN
                     a.id AS id,
                     a.ap_data AS ap_data,
-                    a.is_local AS is_local;
+                    a.is_local AS is_local,
+                    a.fetched_at AS fetched_at,
+                    a.etag AS etag,
+                    a.last_modified AS last_modified;
                     """,
                     parameters={"actor_id": str(actor_id)},
                 ),
@@ -46,13 +95,41 @@ class ActorRepository(LadybugRepository):
             response_data = cast(list[dict], response.rows_as_dict().get_all())
 
             if len(response_data) > 0:
-                data = response_data[0]
-            else:
-                return None
+                return self._to_actor(response_data[0])
 
-            data["ap_data"] = ActorAP.model_validate_json(data["ap_data"])
+            return None
 
-            return Actor.model_validate(data)
+    async def list_stale_actors(self, stale_before: float, limit: int) -> list[Actor]:
+        with self.db.async_connection as conn:
+            response = cast(
+                QueryResult,
+                await conn.execute(
+                    """
+                    MATCH (a:Actor)
+                    WHERE a.is_local = false
+                    AND (a.fetched_at IS NULL OR a.fetched_at < $stale_before)
+                    RETURN
+                    a.id AS id,
+                    a.ap_data AS ap_data,
+                    a.is_local AS is_local,
+                    a.fetched_at AS fetched_at,
+                    a.etag AS etag,
+                    a.last_modified AS last_modified
+                    ORDER BY a.fetched_at
+                    LIMIT $limit;
+                    """,
+                    parameters={"stale_before": stale_before, "limit": limit},
+                ),
+            )
+
+            response_data = cast(list[dict], response.rows_as_dict().get_all())
+
+            return [self._to_actor(data) for data in response_data]
+
+    def _to_actor(self, data: dict) -> Actor:
+        data["ap_data"] = ActorAP.model_validate_json(data["ap_data"])
+
+        return Actor.model_validate(data)
 
     async def upsert_actor(self, actor: Actor) -> None:
         with self.db.async_connection as conn:
@@ -61,14 +138,28 @@ class ActorRepository(LadybugRepository):
                 MERGE (a:Actor {id: $id})
                 ON CREATE SET
                 a.ap_data = to_json($ap_data),
-                a.is_local = $is_local
+                a.is_local = $is_local,
+                a.fetched_at = $fetched_at,
+                a.etag = $etag,
+                a.last_modified = $last_modified
                 ON MATCH SET
                 a.ap_data = to_json($ap_data),
-                a.is_local = $is_local;
+                a.is_local = $is_local,
+                a.fetched_at = $fetched_at,
+                a.etag = $etag,
+                a.last_modified = $last_modified;
                 """,
-                parameters=to_jsonable_python(actor),
+                parameters={
+                    **to_jsonable_python(actor),
+                    "fetched_at": actor.fetched_at.timestamp()
+                    if actor.fetched_at is not None
+                    else None,
+                },
             )
 
+        if self.cache is not None:
+            self.cache.invalidate(actor.id)
+
     async def delete_actor(self, actor_id: HttpUrl) -> None:
         with self.db.async_connection as conn:
             await conn.execute(
@@ -79,3 +170,6 @@ class ActorRepository(LadybugRepository):
                 """,
                 parameters={"actor_id": str(actor_id)},
             )
+
+        if self.cache is not None:
+            self.cache.invalidate(actor_id)
@@ -0,0 +1,150 @@
+from datetime import datetime
+
+from sqlalchemy import ColumnElement
+from sqlmodel import col, func, select, update
+from wheke_sqlmodel import SQLModelRepository
+
+from capsule.activitypub.models import Delivery, DeliveryStatus
+
+
+class DeliveryRepository(SQLModelRepository):
+    async def create_delivery(self, delivery: Delivery) -> Delivery:
+        async with self.db.session as session:
+            session.add(delivery)
+            await session.commit()
+            await session.refresh(delivery)
+
+        return delivery
+
+    async def create_deliveries(self, deliveries: list[Delivery]) -> None:
+        async with self.db.session as session:
+            session.add_all(deliveries)
+            await session.commit()
+
+    async def get_delivery(self, delivery_id: int) -> Delivery | None:
+        async with self.db.session as session:
+            return await session.get(Delivery, delivery_id)
+
+    async def lease_due_deliveries(
+        self,
+        now: datetime,
+        limit: int,
+        leased_until: datetime,
+        *,
+        per_host: int,
+    ) -> list[Delivery]:
+        async with self.db.session as session:
+            due = (
+                select(
+                    col(Delivery.id).label("id"),
+                    col(Delivery.host).label("host"),
+                    col(Delivery.next_attempt_at).label("next_attempt_at"),
+                    func.row_number()
+                    .over(
+                        partition_by=col(Delivery.host),
+                        order_by=(col(Delivery.next_attempt_at), col(Delivery.id)),
+                    )
+                    .label("rank"),
+                )
+                .where(Delivery.status == DeliveryStatus.pending)
+                .where(col(Delivery.next_attempt_at) <= now)
+                .subquery()
+            )
+            busy = (
+                select(
+                    col(Delivery.host).label("host"), func.count().label("delivering")
+                )
+                .where(Delivery.status == DeliveryStatus.delivering)
+                .group_by(col(Delivery.host))
+                .subquery()
+            )
+            due_ids = (
+                select(due.c.id)
+                .outerjoin(busy, busy.c.host == due.c.host)
+                .where(due.c.rank + func.coalesce(busy.c.delivering, 0) <= per_host)
+                .order_by(due.c.next_attempt_at)
+                .limit(limit)
+            )
+            stmt = (
+                update(Delivery)
+                .where(col(Delivery.id).in_(due_ids))
+                .where(col(Delivery.status) == DeliveryStatus.pending)
+                .values(status=DeliveryStatus.delivering, leased_until=leased_until)
+                .returning(col(Delivery.id))
+            )
+            leased_ids = list((await session.exec(stmt)).all())
+            await session.commit()
+
+            if not leased_ids:
+                return []
+
+            result = await session.exec(
+                select(Delivery)
+                .where(col(Delivery.id).in_(leased_ids))
+                .order_by(col(Delivery.next_attempt_at))
+            )
+
+            return list(result.all())
+
+    async def count_due_deliveries(self, now: datetime) -> int:
+        async with self.db.session as session:
+            stmt = (
+                select(func.count())
+                .select_from(Delivery)
+                .where(Delivery.status == DeliveryStatus.pending)
+                .where(col(Delivery.next_attempt_at) <= now)
+            )
+
+            return (await session.exec(stmt)).one()
+
+    async def update_delivery(
+        self,
+        delivery_id: int,
+        status: DeliveryStatus,
+        *,
+        attempts: int,
+        next_attempt_at: datetime | None = None,
+        last_error: str | None = None,
+    ) -> None:
+        values: dict = {
+            "status": status,
+            "attempts": attempts,
+            "last_error": last_error,
+            "leased_until": None,
+        }
+
+        if next_attempt_at is not None:
+            values["next_attempt_at"] = next_attempt_at
+
+        async with self.db.session as session:
+            stmt = (
+                update(Delivery).where(col(Delivery.id) == delivery_id).values(**values)
+            )
+            await session.exec(stmt)
+            await session.commit()
+
+    async def release_leases(self, ids: list[int]) -> int:
+        return await self._release_leases(col(Delivery.id).in_(ids))
+
+    async def release_expired_leases(
+        self, now: datetime, exclude: list[int] | None = None
+    ) -> int:
+        condition = col(Delivery.leased_until) < now
+
+        if exclude:
+            condition &= col(Delivery.id).not_in(exclude)
+
+        return await self._release_leases(condition)
+
+    async def _release_leases(self, condition: ColumnElement[bool]) -> int:
+        async with self.db.session as session:
+            stmt = (
+                update(Delivery)
+                .where(col(Delivery.status) == DeliveryStatus.delivering)
+                .where(condition)
+                .values(status=DeliveryStatus.pending, leased_until=None)
+            )
+            result = await session.exec(stmt)
+            await session.commit()
+
+        return result.rowcount
@@ -1,11 +1,16 @@
 from typing import cast
 
-from ladybug import QueryResult
+from ladybug import AsyncConnection, QueryResult
 from pydantic import HttpUrl
 from pydantic_core import to_jsonable_python
 from wheke_ladybug import LadybugRepository
 
-from capsule.activitypub.models import Follow
+from capsule.activitypub.models import (
+    ActorAP,
+    DeliveryTarget,
+    Follow,
+    FollowStatus,
+)
 
 
 class FollowRepository(LadybugRepository):
@@ -17,14 +22,64 @@ class FollowRepository(LadybugRepository):
                 (
                     FROM Actor to Actor,
                     id STRING,
-                    status STRING
+                    status STRING,
+                    delivery_inbox STRING
                 );
                 """
             )
+            await conn.execute(
+                """
+                CREATE NODE TABLE IF NOT EXISTS DeliveryTarget
+                (
+                    id STRING PRIMARY KEY,
+                    actor STRING,
+                    inbox STRING,
+                    followers INT64
+                );
+                """
+            )
+
+    async def migrate_table(self) -> None:
+        await self.create_table()
+
+        with self.db.async_connection as conn:
+            await conn.execute(
+                "ALTER TABLE Follows ADD IF NOT EXISTS delivery_inbox STRING;"
+            )
+            response = cast(
+                QueryResult,
+                await conn.execute(
+                    """
+                    MATCH (a:Actor)-[f:Follows]->(:Actor)
+                    WHERE f.delivery_inbox IS NULL
+                    RETURN f.id AS id, a.ap_data AS ap_data;
+                    """
+                ),
+            )
+            missing = cast(list[dict], response.rows_as_dict().get_all())
+
+            for data in missing:
+                await conn.execute(
+                    """
+                    MATCH (:Actor)-[f:Follows]->(:Actor)
+                    WHERE f.id = $id
+                    SET f.delivery_inbox = $inbox;
+                    """,
+                    parameters={
+                        "id": data["id"],
+                        "inbox": str(
+                            ActorAP.model_validate_json(data["ap_data"]).delivery_inbox
+                        ),
+                    },
+                )
+
+        if missing:
+            await self.rebuild_delivery_targets()
 
     async def drop_table(self) -> None:
         with self.db.async_connection as conn:
             await conn.execute("DROP TABLE IF EXISTS Follows;")
+            await conn.execute("DROP TABLE IF EXISTS DeliveryTarget;")
 
     async def get_follow(self, follow_id: HttpUrl) -> Follow | None:
         with self.db.async_connection as conn:
@@ -47,44 +102,231 @@ class FollowRepository(LadybugRepository):
             data = cast(list[dict], response.rows_as_dict().get_all())
             return Follow.model_validate(data[0]) if len(data) > 0 else None
 
+    async def is_following(self, from_actor: HttpUrl, to_actor: HttpUrl) -> bool:
+        with self.db.async_connection as conn:
+            response = cast(
+                QueryResult,
+                await conn.execute(
+                    """
+                    MATCH (a:Actor)-[f:Follows]->(b:Actor)
+                    WHERE a.id = $from_actor AND b.id = $to_actor
+                    RETURN f.id AS id
+                    LIMIT 1;
+                    """,
+                    parameters={
+                        "from_actor": str(from_actor),
+                        "to_actor": str(to_actor),
+                    },
+                ),
+            )
+
+            return len(response.rows_as_dict().get_all()) > 0
+
     async def upsert_follow(self, follow: Follow) -> None:
         with self.db.async_connection as conn:
+            response = cast(
+                QueryResult,
+                await conn.execute(
+                    """
+                    MATCH (a:Actor)
+                    WHERE a.id = $from_actor
+                    OPTIONAL MATCH (a)-[f:Follows]->(:Actor)
+                    WHERE f.id = $id
+                    RETURN a.ap_data AS ap_data, f.delivery_inbox AS delivery_inbox;
+                    """,
+                    parameters={
+                        "from_actor": str(follow.from_actor),
+                        "id": str(follow.id),
+                    },
+                ),
+            )
+            data = cast(list[dict], response.rows_as_dict().get_all())
+
+            if len(data) == 0:
+                return
+
+            inbox = str(ActorAP.model_validate_json(data[0]["ap_data"]).delivery_inbox)
+
             await conn.execute(
                 """
                 MATCH (a:Actor), (b:Actor)
                 WHERE a.id = $from_actor AND b.id = $to_actor
                 MERGE (a)-[f:Follows {id:$id}]->(b)
                 ON CREATE SET
-                f.status = $status
+                f.status = $status,
+                f.delivery_inbox = $delivery_inbox
                 ON MATCH SET
-                f.status = $status;
+                f.status = $status,
+                f.delivery_inbox = $delivery_inbox;
                 """,
-                parameters=to_jsonable_python(follow),
+                parameters={**to_jsonable_python(follow), "delivery_inbox": inbox},
             )
 
+        stale = {data[0]["delivery_inbox"]} - {None, inbox}
+
+        for target_inbox in {inbox, *stale}:
+            await self._refresh_delivery_target(str(follow.to_actor), target_inbox)
+
     async def delete_follow(self, follow_id: HttpUrl) -> None:
+        await self._delete_follows("f.id = $follow_id", {"follow_id": str(follow_id)})
+
+    async def delete_follow_by_actors(
+        self, from_actor: HttpUrl, to_actor: HttpUrl
+    ) -> None:
+        await self._delete_follows(
+            "a.id = $from_actor AND b.id = $to_actor",
+            {"from_actor": str(from_actor), "to_actor": str(to_actor)},
+        )
+
+    async def update_delivery_inbox(self, actor_id: HttpUrl, inbox: HttpUrl) -> None:
         with self.db.async_connection as conn:
+            response = cast(
+                QueryResult,
+                await conn.execute(
+                    """
+                    MATCH (a:Actor)-[f:Follows]->(b:Actor)
+                    WHERE a.id = $actor_id
+                    RETURN DISTINCT b.id AS actor, f.delivery_inbox AS inbox;
+                    """,
+                    parameters={"actor_id": str(actor_id)},
+                ),
+            )
+            targets = cast(list[dict], response.rows_as_dict().get_all())
+
             await conn.execute(
                 """
-                MATCH (a:Actor)-[f:Follows]->(b:Actor)
-                WHERE f.id = $follow_id
-                DELETE f;
+                MATCH (a:Actor)-[f:Follows]->(:Actor)
+                WHERE a.id = $actor_id
+                SET f.delivery_inbox = $inbox;
                 """,
-                parameters={"follow_id": str(follow_id)},
+                parameters={"actor_id": str(actor_id), "inbox": str(inbox)},
             )
 
-    async def delete_follow_by_actors(
-        self, from_actor: HttpUrl, to_actor: HttpUrl
-    ) -> None:
+        affected = {(target["actor"], str(inbox)) for target in targets} | {
+            (target["actor"], target["inbox"])
+            for target in targets
+            if target["inbox"] is not None
+        }
+
+        for actor, target_inbox in affected:
+            await self._refresh_delivery_target(actor, target_inbox)
+
+    async def list_delivery_targets(self, actor_id: HttpUrl) -> list[DeliveryTarget]:
+        with self.db.async_connection as conn:
+            response = cast(
+                QueryResult,
+                await conn.execute(
+                    """
+                    MATCH (t:DeliveryTarget)
+                    WHERE t.actor = $actor_id
+                    RETURN t.actor AS actor, t.inbox AS inbox, t.followers AS followers
+                    ORDER BY t.inbox;
+                    """,
+                    parameters={"actor_id": str(actor_id)},
+                ),
+            )
+
+            data = cast(list[dict], response.rows_as_dict().get_all())
+            return [DeliveryTarget.model_validate(target) for target in data]
+
+    async def rebuild_delivery_targets(self) -> None:
         with self.db.async_connection as conn:
+            await conn.execute("MATCH (t:DeliveryTarget) DELETE t;")
+            response = cast(
+                QueryResult,
+                await conn.execute(
+                    """
+                    MATCH (:Actor)-[f:Follows]->(b:Actor)
+                    WHERE f.status = $status AND f.delivery_inbox IS NOT NULL
+                    RETURN
+                    b.id AS actor,
+                    f.delivery_inbox AS inbox,
+                    count(f) AS followers;
+                    """,
+                    parameters={"status": FollowStatus.accepted},
+                ),
+            )
+
+            for target in cast(list[dict], response.rows_as_dict().get_all()):
+                await self._save_delivery_target(conn, **target)
+
+    async def _delete_follows(self, condition: str, parameters: dict) -> None:
+        with self.db.async_connection as conn:
+            response = cast(
+                QueryResult,
+                await conn.execute(
+                    f"""
+                    MATCH (a:Actor)-[f:Follows]->(b:Actor)
+                    WHERE {condition}
+                    RETURN DISTINCT b.id AS actor, f.delivery_inbox AS inbox;
+                    """,
+                    parameters=parameters,
+                ),
+            )
+            targets = cast(list[dict], response.rows_as_dict().get_all())
+
             await conn.execute(
-                """
+                f"""
                 MATCH (a:Actor)-[f:Follows]->(b:Actor)
-                WHERE a.id = $from_actor AND b.id = $to_actor
+                WHERE {condition}
                 DELETE f;
                 """,
-                parameters={
-                    "from_actor": str(from_actor),
-                    "to_actor": str(to_actor),
-                },
+                parameters=parameters,
             )
+
+        for target in targets:
+            if target["inbox"] is not None:
+                await self._refresh_delivery_target(target["actor"], target["inbox"])
+
+    async def _refresh_delivery_target(self, actor: str, inbox: str) -> None:
+        with self.db.async_connection as conn:
+            response = cast(
+                QueryResult,
+                await conn.execute(
+                    """
+                    MATCH (:Actor)-[f:Follows]->(b:Actor)
+                    WHERE b.id = $actor
+                    AND f.delivery_inbox = $inbox
+                    AND f.status = $status
+                    RETURN count(f) AS followers;
+                    """,
+                    parameters={
+                        "actor": actor,
+                        "inbox": inbox,
+                        "status": FollowStatus.accepted,
+                    },
+                ),
+            )
+            data = cast(list[dict], response.rows_as_dict().get_all())
+
+            await self._save_delivery_target(
+                conn, actor, inbox, data[0]["followers"] if data else 0
+            )
+
+    async def _save_delivery_target(
+        self, conn: AsyncConnection, actor: str, inbox: str, followers: int
+    ) -> None:
+        if followers == 0:
+            await conn.execute(
+                "MATCH (t:DeliveryTarget) WHERE t.id = $id DELETE t;",
+                parameters={"id": f"{actor} {inbox}"},
+            )
+            return
+
+        await conn.execute(
+            """
+            MERGE (t:DeliveryTarget {id: $id})
+            ON CREATE SET
+            t.actor = $actor,
+            t.inbox = $inbox,
+            t.followers = $followers
+            ON MATCH SET
+            t.followers = $followers;
+            """,
+            parameters={
+                "id": f"{actor} {inbox}",
+                "actor": actor,
+                "inbox": inbox,
+                "followers": followers,
+            },
+        )
@@ -0,0 +1,43 @@
+from typing import cast
+
+from sqlalchemy import Table
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import col, select
+from wheke_sqlmodel import SQLModelRepository
+
+from capsule.activitypub.models import CircuitState, HostHealth
+
+
+class HostHealthRepository(SQLModelRepository):
+    async def list_hosts(
+        self, state: CircuitState | None = None, limit: int | None = None
+    ) -> list[HostHealth]:
+        stmt = select(HostHealth).order_by(col(HostHealth.host))
+
+        if state is not None:
+            stmt = stmt.where(HostHealth.state == state)
+
+        if limit is not None:
+            stmt = stmt.limit(limit)
+
+        async with self.db.session as session:
+            return list((await session.exec(stmt)).all())
+
+    async def upsert_hosts(self, hosts: list[HostHealth]) -> None:
+        if not hosts:
+            return
+
+        table = cast(Table, HostHealth.__table__)
+        stmt = insert(HostHealth)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["host"],
+            set_={
+                column.name: stmt.excluded[column.name]
+                for column in table.columns
+                if column.name != "host"
+            },
+        )
+
+        async with self.db.session as session:
+            await session.exec(stmt, params=[host.model_dump() for host in hosts])
+            await session.commit()
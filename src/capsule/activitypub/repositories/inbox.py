@@ -1,12 +1,48 @@
 from collections.abc import AsyncGenerator
+from datetime import datetime
+from typing import cast
 
-from sqlmodel import col, delete, select
+from sqlalchemy import ColumnElement, Table, case
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.schema import CreateColumn
+from sqlmodel import col, delete, func, select, update
 from wheke_sqlmodel import SQLModelRepository
 
-from capsule.activitypub.models import InboxEntry, InboxEntryStatus
+from capsule.activitypub.models import (
+    InboxEntry,
+    InboxEntryAgeField,
+    InboxEntryStatus,
+)
+
+GENERATED_COLUMNS = {"activity_id", "activity_type", "activity_actor"}
 
 
 class InboxRepository(SQLModelRepository):
+    async def migrate_table(self) -> None:
+        table = cast(Table, InboxEntry.__table__)
+
+        async with self.db.engine.begin() as conn:
+            result = await conn.exec_driver_sql(f"PRAGMA table_xinfo({table.name})")
+            existing_columns = {row[1] for row in result}
+
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_spec = CreateColumn(column).compile(dialect=conn.dialect)
+                    await conn.exec_driver_sql(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column_spec}"
+                    )
+
+            if "activity_id" not in existing_columns:
+                first_ids = select(func.min(col(InboxEntry.id))).group_by(
+                    col(InboxEntry.activity_id)
+                )
+                await conn.execute(
+                    delete(InboxEntry).where(col(InboxEntry.id).not_in(first_ids))
+                )
+
+            for index in table.indexes:
+                await conn.run_sync(index.create, checkfirst=True)
+
     async def create_entry(self, entry: InboxEntry) -> InboxEntry:
         async with self.db.session as session:
             session.add(entry)
@@ -15,25 +51,192 @@ class InboxRepository(SQLModelRepository):
 
         return entry
 
+    async def create_entries(
+        self, entries: list[InboxEntry]
+    ) -> list[InboxEntry | None]:
+        async with self.db.session as session:
+            stmt = (
+                insert(InboxEntry)
+                .on_conflict_do_nothing(index_elements=["activity_id"])
+                .returning(col(InboxEntry.id), col(InboxEntry.activity_id))
+            )
+            result = await session.exec(
+                stmt,
+                params=[
+                    {
+                        **entry.model_dump(
+                            exclude={"id", "activity", *GENERATED_COLUMNS}
+                        ),
+                        "activity": entry.activity,
+                    }
+                    for entry in entries
+                ],
+            )
+            created_ids = {activity_id: entry_id for entry_id, activity_id in result}
+
+            await session.commit()
+
+        created: list[InboxEntry | None] = []
+
+        for entry in entries:
+            activity_id = entry.activity.raw_id
+            entry_id = created_ids.pop(activity_id, None)
+
+            if entry_id is None:
+                created.append(None)
+            else:
+                entry.id = entry_id
+                entry.activity_id = activity_id
+                created.append(entry)
+
+        return created
+
     async def list_entries(
-        self, status: InboxEntryStatus
+        self,
+        status: InboxEntryStatus | list[InboxEntryStatus],
+        *,
+        activity_type: str | None = None,
+        actor: str | None = None,
     ) -> AsyncGenerator[InboxEntry]:
+        statuses = status if isinstance(status, list) else [status]
+
         async with self.db.session as session:
-            stmt = select(InboxEntry).where(InboxEntry.status == status)
-            for entry in await session.exec(stmt):
+            stmt = select(InboxEntry).where(col(InboxEntry.status).in_(statuses))
+
+            if activity_type is not None:
+                stmt = stmt.where(InboxEntry.activity_type == activity_type)
+
+            if actor is not None:
+                stmt = stmt.where(InboxEntry.activity_actor == actor)
+
+            for entry in await session.exec(stmt.order_by(col(InboxEntry.id))):
                 yield entry
 
+    async def list_entries_chunks(
+        self,
+        status: InboxEntryStatus | list[InboxEntryStatus],
+        chunk_size: int,
+        *,
+        created_before: datetime | None = None,
+    ) -> AsyncGenerator[list[InboxEntry]]:
+        statuses = status if isinstance(status, list) else [status]
+        last_id = 0
+
+        while True:
+            async with self.db.session as session:
+                stmt = (
+                    select(InboxEntry)
+                    .where(col(InboxEntry.status).in_(statuses))
+                    .where(col(InboxEntry.id) > last_id)
+                    .order_by(col(InboxEntry.id))
+                    .limit(chunk_size)
+                )
+
+                if created_before is not None:
+                    stmt = stmt.where(col(InboxEntry.created_at) < created_before)
+                entries = list(await session.exec(stmt))
+
+            if not entries:
+                return
+
+            yield entries
+
+            last_id = cast(int, entries[-1].id)
+
     async def update_entries_state(self, ids: list, status: InboxEntryStatus) -> None:
         async with self.db.session as session:
-            stmt = select(InboxEntry).where(col(InboxEntry.id).in_(ids))
-            for entry in await session.exec(stmt):
-                entry.status = status
-                session.add(entry)
+            stmt = (
+                update(InboxEntry)
+                .where(col(InboxEntry.id).in_(ids))
+                .values(status=status, leased_until=None)
+            )
+            await session.exec(stmt)
+            await session.commit()
+
+    async def lease_entry(
+        self,
+        entry_id: int,
+        leased_until: datetime,
+        statuses: list[InboxEntryStatus] | None = None,
+    ) -> bool:
+        if statuses is None:
+            statuses = [
+                InboxEntryStatus.created,
+                InboxEntryStatus.pending_verification,
+            ]
 
+        async with self.db.session as session:
+            stmt = (
+                update(InboxEntry)
+                .where(col(InboxEntry.id) == entry_id)
+                .where(col(InboxEntry.status).in_(statuses))
+                .values(status=InboxEntryStatus.processing, leased_until=leased_until)
+            )
+            result = await session.exec(stmt)
             await session.commit()
 
-    async def delete_entries(self) -> None:
+        return result.rowcount > 0
+
+    async def release_leases(self, ids: list[int]) -> int:
+        return await self._release_leases(col(InboxEntry.id).in_(ids))
+
+    async def release_expired_leases(self, now: datetime) -> int:
+        return await self._release_leases(col(InboxEntry.leased_until) < now)
+
+    async def _release_leases(self, condition: ColumnElement[bool]) -> int:
         async with self.db.session as session:
-            stmt = delete(InboxEntry)
+            stmt = (
+                update(InboxEntry)
+                .where(col(InboxEntry.status) == InboxEntryStatus.processing)
+                .where(condition)
+                .values(
+                    status=case(
+                        (
+                            col(InboxEntry.request_headers).is_(None),
+                            InboxEntryStatus.created,
+                        ),
+                        else_=InboxEntryStatus.pending_verification,
+                    ),
+                    leased_until=None,
+                )
+            )
+            result = await session.exec(stmt)
+            await session.commit()
+
+        return result.rowcount
+
+    async def mark_entry_verified(self, entry_id: int) -> None:
+        async with self.db.session as session:
+            stmt = (
+                update(InboxEntry)
+                .where(col(InboxEntry.id) == entry_id)
+                .values(request_headers=None)
+            )
+            await session.exec(stmt)
+            await session.commit()
+
+    async def delete_entry(self, entry_id: int) -> None:
+        async with self.db.session as session:
+            stmt = delete(InboxEntry).where(col(InboxEntry.id) == entry_id)
             await session.exec(stmt)
             await session.commit()
+
+    async def delete_entries(
+        self,
+        statuses: list[InboxEntryStatus],
+        before: datetime,
+        age_field: InboxEntryAgeField,
+        limit: int,
+    ) -> int:
+        async with self.db.session as session:
+            ids = (
+                select(InboxEntry.id)
+                .where(col(InboxEntry.status).in_(statuses))
+                .where(col(getattr(InboxEntry, age_field)) < before)
+                .limit(limit)
+            )
+            stmt = delete(InboxEntry).where(col(InboxEntry.id).in_(ids))
+            result = await session.exec(stmt)
+            await session.commit()
+
+        return result.rowcount
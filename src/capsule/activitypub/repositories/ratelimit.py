@@ -0,0 +1,43 @@
+from sqlalchemy import case
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import col, delete, func
+from wheke_sqlmodel import SQLModelRepository
+
+from capsule.activitypub.models import HostRateLimit
+
+
+class RateLimitRepository(SQLModelRepository):
+    async def consume_token(
+        self, host: str, rate: float, burst: int, now: float
+    ) -> HostRateLimit:
+        refilled = func.min(
+            burst,
+            col(HostRateLimit.tokens) + (now - col(HostRateLimit.updated_at)) * rate,
+        )
+        stmt = (
+            insert(HostRateLimit)
+            .values(host=host, tokens=burst - 1, limited=False, updated_at=now)
+            .on_conflict_do_update(
+                index_elements=["host"],
+                set_={
+                    "tokens": case((refilled >= 1, refilled - 1), else_=refilled),
+                    "limited": refilled < 1,
+                    "updated_at": now,
+                },
+            )
+            .returning(col(HostRateLimit.tokens), col(HostRateLimit.limited))
+        )
+
+        async with self.db.session as session:
+            tokens, limited = (await session.exec(stmt)).one()
+            await session.commit()
+
+        return HostRateLimit(host=host, tokens=tokens, limited=limited, updated_at=now)
+
+    async def delete_refilled(self, before: float) -> int:
+        async with self.db.session as session:
+            stmt = delete(HostRateLimit).where(col(HostRateLimit.updated_at) < before)
+            result = await session.exec(stmt)
+            await session.commit()
+
+        return result.rowcount
@@ -0,0 +1,21 @@
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic_core import to_json
+
+
+def render_json(content: Any) -> bytes:
+    return to_json(content, by_alias=True, exclude_none=True)
+
+
+class PydanticJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return render_json(content)
+
+
+class ActivityJSONResponse(PydanticJSONResponse):
+    media_type = "application/activity+json"
+
+
+class JRDJSONResponse(PydanticJSONResponse):
+    media_type = "application/jrd+json"
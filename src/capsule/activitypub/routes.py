@@ -1,114 +1,172 @@
+from datetime import timedelta
 from pathlib import Path
+from typing import Annotated
 
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Request, Response, status
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse
 from loguru import logger
+from pydantic import ValidationError
 from starlette.status import (
     HTTP_400_BAD_REQUEST,
     HTTP_401_UNAUTHORIZED,
     HTTP_404_NOT_FOUND,
+    HTTP_429_TOO_MANY_REQUESTS,
+    HTTP_503_SERVICE_UNAVAILABLE,
 )
 from starlette.templating import Jinja2Templates
 
 from capsule.__about__ import __version__
-from capsule.activitypub.models.inbox import InboxEntryStatus
 from capsule.security.exception import VerificationBadFormatError, VerificationError
 from capsule.security.services import SignatureServiceInjection
 from capsule.settings import CapsuleSettingsInjection
 
-from .models import Activity, ActorAP, InboxEntry
+from .cache import ActorCacheInjection
+from .documents import DocumentCacheInjection
+from .health import HostHealthTrackerInjection
+from .limiter import HostRateLimiterInjection
+from .models import (
+    ActorAP,
+    InboxCleanupResult,
+    InboxEntry,
+    InboxEntryAgeField,
+    InboxEntryStatus,
+    RawActivity,
+)
+from .responses import ActivityJSONResponse, JRDJSONResponse, render_json
 from .service import ActivityPubServiceInjection
+from .worker import InboxWorkerInjection, inbox_worker_lifespan
 
-router = APIRouter(tags=["activitypub"])
+router = APIRouter(tags=["activitypub"], lifespan=inbox_worker_lifespan)
 templates = Jinja2Templates(directory=Path(__file__).resolve().parent / "templates")
 
 
-class ActivityJSONResponse(JSONResponse):
-    media_type = "application/activity+json"
-
-
-class JRDJSONResponse(JSONResponse):
-    media_type = "application/jrd+json"
-
-
 @router.get("/.well-known/host-meta", response_model=None)
 async def well_known_host_meta(
-    settings: CapsuleSettingsInjection, request: Request
+    settings: CapsuleSettingsInjection,
+    documents: DocumentCacheInjection,
+    request: Request,
 ) -> Response:
-    return templates.TemplateResponse(
-        name="host-meta.xml",
-        media_type="application/xrd+xml",
-        request=request,
-        context={
-            "hostname": settings.hostname,
-        },
+    return documents.render(
+        request,
+        "host-meta",
+        "application/xrd+xml",
+        lambda: (
+            templates.get_template("host-meta.xml")
+            .render(hostname=settings.hostname)
+            .encode()
+        ),
     )
 
 
-@router.get("/.well-known/nodeinfo")
-async def well_known_nodeinfo(settings: CapsuleSettingsInjection) -> dict:
-    return {
-        "links": [
+@router.get("/.well-known/nodeinfo", response_model=None)
+async def well_known_nodeinfo(
+    settings: CapsuleSettingsInjection,
+    documents: DocumentCacheInjection,
+    request: Request,
+) -> Response:
+    return documents.render(
+        request,
+        "nodeinfo-links",
+        "application/json",
+        lambda: render_json(
             {
-                "rel": "http://nodeinfo.diaspora.software/ns/schema/2.0",
-                "href": f"{settings.hostname}nodeinfo/2.0",
+                "links": [
+                    {
+                        "rel": "http://nodeinfo.diaspora.software/ns/schema/2.0",
+                        "href": f"{settings.hostname}nodeinfo/2.0",
+                    }
+                ],
             }
-        ],
-    }
+        ),
+    )
 
 
-@router.get("/.well-known/webfinger", response_class=JRDJSONResponse)
+@router.get(
+    "/.well-known/webfinger", response_class=JRDJSONResponse, response_model=None
+)
 async def well_known_webfinger(
     settings: CapsuleSettingsInjection,
     service: ActivityPubServiceInjection,
+    documents: DocumentCacheInjection,
+    request: Request,
     resource: str = "",
-) -> dict:
+) -> Response:
     acct = resource.removeprefix("acct:").split("@")
 
     match acct:
         case [settings.username, settings.hostname.host]:
-            return service.get_webfinger()
+            return documents.render(
+                request,
+                "webfinger",
+                JRDJSONResponse.media_type,
+                lambda: render_json(service.get_webfinger()),
+            )
         case [_, _]:
             raise HTTPException(HTTP_404_NOT_FOUND)
         case _:
             raise HTTPException(HTTP_400_BAD_REQUEST)
 
 
-@router.get("/nodeinfo/2.0")
+@router.get("/nodeinfo/2.0", response_model=None)
 async def nodeinfo(
-    settings: CapsuleSettingsInjection, service: ActivityPubServiceInjection
-) -> dict:
-    return {
-        "version": "2.0",
-        "software": {
-            "name": settings.project_name.lower(),
-            "version": __version__,
-        },
-        "protocols": ["activitypub"],
-        "services": {
-            "outbound": [],
-            "inbound": [],
-        },
-        "usage": {
-            "users": {
-                "total": service.get_instance_actor_count(),
-            },
-            "localPosts": service.get_instance_post_count(),
-        },
-        "openRegistrations": False,
-        "metadata": {},
-    }
-
+    settings: CapsuleSettingsInjection,
+    service: ActivityPubServiceInjection,
+    documents: DocumentCacheInjection,
+    request: Request,
+) -> Response:
+    users = service.get_instance_actor_count()
+    posts = service.get_instance_post_count()
+
+    return documents.render(
+        request,
+        "nodeinfo",
+        "application/json",
+        lambda: render_json(
+            {
+                "version": "2.0",
+                "software": {
+                    "name": settings.project_name.lower(),
+                    "version": __version__,
+                },
+                "protocols": ["activitypub"],
+                "services": {
+                    "outbound": [],
+                    "inbound": [],
+                },
+                "usage": {
+                    "users": {
+                        "total": users,
+                    },
+                    "localPosts": posts,
+                },
+                "openRegistrations": False,
+                "metadata": {},
+            }
+        ),
+        key=(users, posts),
+    )
 
-@router.get("/@{username}", response_class=ActivityJSONResponse)
-@router.get("/actors/{username}", response_class=ActivityJSONResponse)
-async def actor(service: ActivityPubServiceInjection, username: str) -> ActorAP:
-    actor = service.get_main_actor_ap()
 
-    if username != actor.username:
+@router.get("/@{username}", response_class=ActivityJSONResponse, response_model=ActorAP)
+@router.get(
+    "/actors/{username}", response_class=ActivityJSONResponse, response_model=ActorAP
+)
+async def actor(
+    service: ActivityPubServiceInjection,
+    documents: DocumentCacheInjection,
+    request: Request,
+    username: str,
+) -> Response:
+    if username != service.settings.username:
         raise HTTPException(HTTP_404_NOT_FOUND)
 
-    return actor
+    return documents.render(
+        request,
+        "actor",
+        ActivityJSONResponse.media_type,
+        lambda: render_json(service.get_main_actor_ap()),
+    )
 
 
 @router.get("/actors/{username}/icon")
@@ -127,50 +185,111 @@ async def actor_profile_picture(
 
 @router.post("/actors/{username}/inbox", status_code=status.HTTP_202_ACCEPTED)
 async def actor_inbox(
+    *,
     activitypub: ActivityPubServiceInjection,
     signature: SignatureServiceInjection,
-    background_tasks: BackgroundTasks,
+    inbox_worker: InboxWorkerInjection,
+    rate_limiter: HostRateLimiterInjection,
     request: Request,
     username: str,
-    activity: Activity,
 ) -> None:
+    try:
+        activity = RawActivity.from_bytes(await request.body())
+    except ValidationError as exc:
+        raise RequestValidationError(exc.errors()) from exc
+
+    retry_after = await rate_limiter.acquire(activity.actor.host or "")
+
+    if retry_after > 0:
+        raise HTTPException(
+            HTTP_429_TOO_MANY_REQUESTS, headers={"Retry-After": str(retry_after)}
+        )
+
     to_actor = activitypub.get_main_actor_ap()
 
     if username != to_actor.username:
         raise HTTPException(HTTP_404_NOT_FOUND)
 
+    if activitypub.is_duplicate_activity(activity.id):
+        return
+
+    if not inbox_worker.admits(
+        activity.actor, is_follower=False
+    ) and not inbox_worker.admits(
+        activity.actor, is_follower=await activitypub.is_follower(activity.actor)
+    ):
+        retry_after = inbox_worker.reject()
+
+        raise HTTPException(
+            HTTP_503_SERVICE_UNAVAILABLE, headers={"Retry-After": str(retry_after)}
+        )
+
     from_actor = await activitypub.get_actor(activity.actor)
 
+    if from_actor is None and activity.is_actor_delete:
+        logger.bind(actor_id=activity.actor).debug("Ignoring delete of unknown actor")
+        return
+
     if from_actor:
         try:
             await signature.verify_request(
-                request, from_actor.ap_data.public_key.public_key_pem
+                request, from_actor.ap_data.get_public_key_pem
             )
         except VerificationBadFormatError as exc:
             raise HTTPException(HTTP_400_BAD_REQUEST) from exc
         except VerificationError as exc:
-            raise HTTPException(HTTP_401_UNAUTHORIZED) from exc
+            if not activitypub.can_refetch_actor(from_actor):
+                raise HTTPException(HTTP_401_UNAUTHORIZED) from exc
+
+            logger.bind(actor_id=activity.actor).info(
+                "Signature check failed with a cached key, deferring to a refresh"
+            )
+
+            entry = InboxEntry(
+                activity=activity,
+                status=InboxEntryStatus.pending_verification,
+                request_headers=signature.get_request_headers(request),
+            )
+        else:
+            entry = InboxEntry(activity=activity)
+    elif "signature" in request.headers:
+        logger.bind(actor_id=activity.actor).info(
+            "New actor, deferring signature check"
+        )
+
+        entry = InboxEntry(
+            activity=activity,
+            status=InboxEntryStatus.pending_verification,
+            request_headers=signature.get_request_headers(request),
+        )
     else:
-        logger.bind(actor_id=activity.actor).info("New actor, skipping signature check")
+        raise HTTPException(HTTP_400_BAD_REQUEST)
 
-    entry = await activitypub.create_inbox_entry(InboxEntry(activity=activity))
+    created = await activitypub.create_inbox_entry(entry)
 
-    background_tasks.add_task(activitypub.handle_activity, entry)
+    if created is not None:
+        inbox_worker.submit(created)
 
 
-@router.get("/actors/{username}/outbox")
-async def actor_outbox(service: ActivityPubServiceInjection, username: str) -> dict:
+@router.get(
+    "/actors/{username}/outbox",
+    response_class=ActivityJSONResponse,
+    response_model=None,
+)
+async def actor_outbox(service: ActivityPubServiceInjection, username: str) -> Response:
     actor = service.get_main_actor_ap()
 
     if username != actor.username:
         raise HTTPException(HTTP_404_NOT_FOUND)
 
-    return {
-        "@context": "https://www.w3.org/ns/activitystreams",
-        "type": "OrderedCollection",
-        "totalItems": 0,
-        "orderedItems": [],
-    }
+    return ActivityJSONResponse(
+        {
+            "@context": "https://www.w3.org/ns/activitystreams",
+            "type": "OrderedCollection",
+            "totalItems": 0,
+            "orderedItems": [],
+        }
+    )
 
 
 @router.post("/system/inbox/sync", status_code=status.HTTP_202_ACCEPTED)
@@ -182,5 +301,69 @@ async def system_inbox_sync(
 
 
 @router.post("/system/inbox/cleanup", status_code=status.HTTP_202_ACCEPTED)
-async def system_inbox_cleanup(service: ActivityPubServiceInjection) -> None:
-    await service.cleanup_inbox_entries()
+async def system_inbox_cleanup(
+    service: ActivityPubServiceInjection,
+    status: Annotated[list[InboxEntryStatus] | None, Query()] = None,
+    older_than: Annotated[int | None, Query(ge=0)] = None,
+    age_field: InboxEntryAgeField = InboxEntryAgeField.updated_at,
+    chunk_size: Annotated[int | None, Query(gt=0)] = None,
+) -> InboxCleanupResult:
+    policy = service.get_inbox_retention_policy()
+    policy.age_field = age_field
+
+    if status:
+        policy.statuses = status
+
+    if older_than is not None:
+        policy.max_age = timedelta(seconds=older_than)
+
+    if chunk_size is not None:
+        policy.chunk_size = chunk_size
+
+    return await service.cleanup_inbox_entries(policy)
+
+
+@router.get("/system/inbox/stats")
+async def system_inbox_stats(
+    service: ActivityPubServiceInjection,
+    inbox_worker: InboxWorkerInjection,
+    rate_limiter: HostRateLimiterInjection,
+    actor_cache: ActorCacheInjection,
+    host_health: HostHealthTrackerInjection,
+) -> dict:
+    return {
+        "queued": inbox_worker.queued,
+        "in_flight": inbox_worker.in_flight,
+        "duplicates": service.inbox_writer.duplicates,
+        "rejected": inbox_worker.rejected,
+        "overflowed": inbox_worker.overflowed,
+        "rate_limited": rate_limiter.limited,
+        "lanes": [
+            {"depth": lane.depth, "lag": lane.lag} for lane in inbox_worker.lanes
+        ],
+        "actor_cache": {
+            "size": actor_cache.size,
+            "hits": actor_cache.hits,
+            "misses": actor_cache.misses,
+        },
+        "coalesced_fetches": service.http_client.coalesced,
+        "fetch_governor": {
+            "hosts": service.http_client.governor.size,
+            "throttled": service.http_client.governor.throttled,
+        },
+        "host_circuits": {
+            "open": host_health.open_hosts,
+            "short_circuited": host_health.short_circuited,
+        },
+        "fetch_backoff": {
+            "size": service.fetch_backoff.size,
+            "short_circuited": service.fetch_backoff.short_circuited,
+        },
+        "deliveries": {
+            "in_flight": len(service.delivery_worker.in_flight),
+            "delivered": service.delivery_worker.delivered,
+            "retried": service.delivery_worker.retried,
+            "deferred": service.delivery_worker.deferred,
+            "dead": service.delivery_worker.dead,
+        },
+    }
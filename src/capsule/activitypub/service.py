@@ -1,4 +1,9 @@
+import asyncio
 import mimetypes
+import time
+from collections import defaultdict
+from datetime import timedelta
+from itertools import chain
 from typing import Annotated, cast
 
 import httpx
@@ -11,12 +16,34 @@ from wheke import get_service
 from wheke_ladybug import get_ladybug_service
 from wheke_sqlmodel import get_sqlmodel_service
 
-from capsule.security.utils import SignedRequestAuth
+from capsule.security.exception import VerificationError
+from capsule.security.services import SignatureService, get_signature_service
+from capsule.security.utils import KeyType, SignedRequestAuth
 from capsule.settings import CapsuleSettings, get_capsule_settings
-
-from .exceptions import EnsureActorError
-from .models import Actor, ActorAP, Follow, FollowStatus, InboxEntry, InboxEntryStatus
+from capsule.utils import utc_now
+
+from .backoff import FetchBackoff, get_fetch_backoff
+from .cache import get_actor_cache
+from .client import (
+    FederationClient,
+    get_federation_client,
+    get_signed_request_auth,
+)
+from .delivery import DeliveryWorker, get_delivery_worker
+from .exceptions import EnsureActorError, ForgedActivityError, HostUnavailableError
+from .models import (
+    Actor,
+    ActorAP,
+    DeliveryTarget,
+    Follow,
+    FollowStatus,
+    InboxCleanupResult,
+    InboxEntry,
+    InboxEntryStatus,
+    InboxRetentionPolicy,
+)
 from .repositories import ActorRepository, FollowRepository, InboxRepository
+from .writer import InboxWriter, get_inbox_writer
 
 
 class ActivityPubService:
@@ -26,6 +53,12 @@ class ActivityPubService:
     actors: ActorRepository
     follows: FollowRepository
 
+    inbox_writer: InboxWriter
+    signature: SignatureService
+    http_client: FederationClient
+    fetch_backoff: FetchBackoff
+    delivery_worker: DeliveryWorker
+
     def __init__(
         self,
         *,
@@ -33,6 +66,11 @@ class ActivityPubService:
         inbox_repository: InboxRepository,
         actor_repository: ActorRepository,
         follows_repository: FollowRepository,
+        inbox_writer: InboxWriter,
+        signature_service: SignatureService,
+        federation_client: FederationClient,
+        fetch_backoff: FetchBackoff,
+        delivery_worker: DeliveryWorker,
     ) -> None:
         self.settings = settings
 
@@ -40,9 +78,16 @@ class ActivityPubService:
         self.actors = actor_repository
         self.follows = follows_repository
 
+        self.inbox_writer = inbox_writer
+        self.signature = signature_service
+        self.http_client = federation_client
+        self.fetch_backoff = fetch_backoff
+        self.delivery_worker = delivery_worker
+
     async def create_tables(self) -> None:
-        await self.actors.create_table()
-        await self.follows.create_table()
+        await self.inbox.migrate_table()
+        await self.actors.migrate_table()
+        await self.follows.migrate_table()
 
     async def drop_tables(self) -> None:
         await self.follows.drop_table()
@@ -54,6 +99,19 @@ class ActivityPubService:
     async def get_actor(self, actor_id: HttpUrl) -> Actor | None:
         return await self.actors.get_actor(actor_id)
 
+    async def is_follower(self, actor_id: HttpUrl) -> bool:
+        return await self.follows.is_following(actor_id, self.settings.main_actor_id)
+
+    async def list_follower_targets(self) -> list[DeliveryTarget]:
+        return await self.follows.list_delivery_targets(self.settings.main_actor_id)
+
+    async def deliver_to_followers(self, activity: dict) -> int:
+        targets = await self.list_follower_targets()
+
+        return await self.delivery_worker.enqueue_many(
+            activity, [target.inbox for target in targets]
+        )
+
     def get_instance_post_count(self) -> int:
         return 0
 
@@ -90,32 +148,180 @@ class ActivityPubService:
 
         return webfinger
 
-    async def create_inbox_entry(self, entry: InboxEntry) -> InboxEntry:
-        return await self.inbox.create_entry(entry)
+    def is_duplicate_activity(self, activity_id: HttpUrl) -> bool:
+        return self.inbox_writer.is_duplicate(str(activity_id))
+
+    async def create_inbox_entry(self, entry: InboxEntry) -> InboxEntry | None:
+        return await self.inbox_writer.write(entry)
+
+    async def lease_inbox_entry(
+        self, entry: InboxEntry, statuses: list[InboxEntryStatus] | None = None
+    ) -> bool:
+        leased_until = utc_now() + timedelta(seconds=self.settings.inbox_lease_seconds)
+
+        return await self.inbox.lease_entry(cast(int, entry.id), leased_until, statuses)
+
+    async def release_expired_inbox_leases(self) -> int:
+        return await self.inbox.release_expired_leases(utc_now())
+
+    async def drop_inbox_entry(self, entry: InboxEntry) -> None:
+        await self.inbox.delete_entry(cast(int, entry.id))
+
+        self.inbox_writer.forget(str(entry.activity.id))
+
+    async def verify_inbox_entry(self, entry: InboxEntry) -> None:
+        if entry.request_headers is None:
+            return
+
+        actor = await self.ensure_remote_actor(entry)
+
+        try:
+            await self.verify_entry_signature(entry, actor)
+        except VerificationError as exc:
+            if not self.can_refetch_actor(actor):
+                raise ForgedActivityError from exc
+
+            logger.bind(actor_id=actor.id).info(
+                "Signature check failed, refreshing actor"
+            )
+
+            refreshed = await self.refresh_actor(actor)
+
+            if refreshed is None:
+                logger.bind(actor_id=actor.id).warning(
+                    "Actor refresh failed, keeping entry for a later verification"
+                )
+                raise EnsureActorError from exc
+
+            try:
+                await self.verify_entry_signature(entry, refreshed)
+            except VerificationError as refreshed_exc:
+                raise ForgedActivityError from refreshed_exc
+
+        await self.inbox.mark_entry_verified(cast(int, entry.id))
+
+        entry.request_headers = None
 
-    async def fetch_actor_from_remote(self, actor_id: HttpUrl) -> Actor | None:
-        auth = SignedRequestAuth(
-            public_key_id=HttpUrl(self.settings.public_key_id),
-            private_key=self.settings.private_key,
+    async def verify_entry_signature(self, entry: InboxEntry, actor: Actor) -> None:
+        await self.signature.verify_headers(
+            cast(dict[str, str], entry.request_headers),
+            entry.activity.raw,
+            actor.ap_data.get_public_key_pem,
+            entry.created_at,
         )
-        headers = {
-            "User-Agent": self.settings.user_agent,
-            "Accept": "application/activity+json,application/ld+json",
-        }
-        async with httpx.AsyncClient(auth=auth, headers=headers) as client:
-            response = await client.get(str(actor_id))
 
-            if response.is_error:
-                logger.bind(
-                    actor_id=actor_id,
-                    http_status=response.status_code,
-                    http_message=response.text,
-                ).error("Failed to fetch actor from remote")
-                return None
+    def get_request_key_type(self, actor: Actor | None = None) -> KeyType:
+        if (
+            self.settings.ed25519_private_key
+            and actor is not None
+            and actor.ap_data.supports_ed25519
+        ):
+            return KeyType.ed25519
+
+        return KeyType.rsa
+
+    def get_request_auth(self, actor: Actor | None = None) -> SignedRequestAuth:
+        return get_signed_request_auth(self.settings, self.get_request_key_type(actor))
+
+    async def fetch_actor_from_remote(
+        self, actor_id: HttpUrl, cached: Actor | None = None
+    ) -> Actor | None:
+        headers = {}
+
+        if cached is not None and cached.etag:
+            headers["If-None-Match"] = cached.etag
+
+        if cached is not None and cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+        if self.fetch_backoff.is_blocked(actor_id):
+            logger.bind(actor_id=actor_id).debug("Actor fetch is backing off")
+            return None
+
+        try:
+            response = await self.http_client.dereference(
+                str(actor_id), auth=self.get_request_auth(), headers=headers
+            )
+        except HostUnavailableError:
+            raise
+        except httpx.TransportError:
+            self.fetch_backoff.record_failure(actor_id, host_failure=True)
+            raise
+
+        if cached is not None and response.status_code == httpx.codes.NOT_MODIFIED:
+            self.fetch_backoff.record_success(actor_id)
+            return cached.model_copy(update={"fetched_at": utc_now()})
+
+        if response.is_error:
+            self.fetch_backoff.record_failure(
+                actor_id, host_failure=response.is_server_error
+            )
+            logger.bind(
+                actor_id=actor_id,
+                http_status=response.status_code,
+                http_message=response.text,
+            ).error("Failed to fetch actor from remote")
+            return None
+
+        ap_data = ActorAP(**response.json())
+
+        self.fetch_backoff.record_success(actor_id)
+
+        return Actor(
+            id=ap_data.id,
+            ap_data=ap_data,
+            is_local=False,
+            fetched_at=utc_now(),
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
 
-            ap_data = ActorAP(**response.json())
+    def can_refetch_actor(self, actor: Actor) -> bool:
+        if actor.is_local:
+            return False
 
-            return Actor(id=ap_data.id, ap_data=ap_data, is_local=False)
+        if actor.fetched_at is None:
+            return True
+
+        cooldown = timedelta(seconds=self.settings.actor_refetch_cooldown)
+
+        return utc_now() - actor.fetched_at >= cooldown
+
+    async def refresh_actor(self, actor: Actor) -> Actor | None:
+        try:
+            refreshed = await self.fetch_actor_from_remote(actor.id, actor)
+        except Exception:
+            logger.bind(actor_id=actor.id).exception("Failed to refresh actor")
+            refreshed = None
+
+        if refreshed is None:
+            await self.actors.upsert_actor(
+                actor.model_copy(update={"fetched_at": utc_now()})
+            )
+        else:
+            await self.actors.upsert_actor(refreshed)
+
+            if refreshed.ap_data.delivery_inbox != actor.ap_data.delivery_inbox:
+                await self.follows.update_delivery_inbox(
+                    refreshed.id, refreshed.ap_data.delivery_inbox
+                )
+
+        return refreshed
+
+    async def refresh_stale_actors(self) -> int:
+        stale_before = utc_now() - timedelta(seconds=self.settings.actor_refresh_after)
+        actors = await self.actors.list_stale_actors(
+            stale_before.timestamp(), self.settings.actor_refresh_batch_size
+        )
+        semaphore = asyncio.Semaphore(max(self.settings.actor_refresh_concurrency, 1))
+
+        async def refresh(actor: Actor) -> bool:
+            async with semaphore:
+                return await self.refresh_actor(actor) is not None
+
+        results = await asyncio.gather(*(refresh(actor) for actor in actors))
+
+        return sum(results)
 
     async def ensure_main_actor(self) -> None:
         actor = await self.get_actor(self.settings.main_actor_id)
@@ -140,19 +346,115 @@ class ActivityPubService:
 
         return actor
 
-    async def cleanup_inbox_entries(self) -> None:
-        await self.inbox.delete_entries()
+    def get_inbox_retention_policy(self) -> InboxRetentionPolicy:
+        return InboxRetentionPolicy(
+            max_age=timedelta(seconds=self.settings.inbox_retention_seconds),
+            chunk_size=self.settings.inbox_cleanup_chunk_size,
+        )
+
+    async def cleanup_inbox_entries(
+        self, policy: InboxRetentionPolicy
+    ) -> InboxCleanupResult:
+        start = time.perf_counter()
+        before = utc_now() - policy.max_age
+        deleted = 0
+
+        while True:
+            chunk_deleted = await self.inbox.delete_entries(
+                policy.statuses, before, policy.age_field, policy.chunk_size
+            )
+            deleted += chunk_deleted
+
+            if chunk_deleted < policy.chunk_size:
+                break
+
+            await asyncio.sleep(0)
+
+        return InboxCleanupResult(deleted=deleted, elapsed=time.perf_counter() - start)
 
     async def sync_inbox_entries(self, status: InboxEntryStatus) -> None:
-        if status != InboxEntryStatus.synced:
-            async for entry in self.inbox.list_entries(status):
-                await self.handle_activity(entry)
+        if status in {InboxEntryStatus.synced, InboxEntryStatus.processing}:
+            return
+
+        if status == InboxEntryStatus.error:
+            self.fetch_backoff.clear()
+
+        semaphore = asyncio.Semaphore(self.settings.inbox_sync_concurrency)
+
+        async def sync_actor_entries(
+            entries: list[InboxEntry],
+        ) -> list[tuple[int, InboxEntryStatus]]:
+            results = []
+
+            async with semaphore:
+                for entry in entries:
+                    if not await self.lease_inbox_entry(entry, [status]):
+                        continue
+
+                    try:
+                        entry_status = await self.process_activity(entry)
+                    except ForgedActivityError:
+                        logger.bind(entry_id=entry.id).warning(
+                            "Dropping inbox entry with invalid signature"
+                        )
+                        await self.drop_inbox_entry(entry)
+                        continue
+                    except Exception:
+                        logger.bind(entry_id=entry.id).exception(
+                            "Failed to sync inbox entry"
+                        )
+                        entry_status = InboxEntryStatus.error
+
+                    results.append((cast(int, entry.id), entry_status))
+
+            return results
+
+        async for entries in self.inbox.list_entries_chunks(
+            status, self.settings.inbox_sync_chunk_size
+        ):
+            entries_by_actor: dict[str, list[InboxEntry]] = defaultdict(list)
+
+            for entry in entries:
+                entries_by_actor[str(entry.activity.actor)].append(entry)
+
+            results = await asyncio.gather(
+                *(
+                    sync_actor_entries(actor_entries)
+                    for actor_entries in entries_by_actor.values()
+                )
+            )
+            entries_by_status: dict[InboxEntryStatus, list[int]] = defaultdict(list)
+
+            for entry_id, entry_status in chain.from_iterable(results):
+                entries_by_status[entry_status].append(entry_id)
+
+            for entry_status, ids in entries_by_status.items():
+                await self.inbox.update_entries_state(ids, entry_status)
 
     async def handle_activity(self, entry: InboxEntry) -> None:
-        entry_id = entry.id
+        try:
+            entry_status = await self.process_activity(entry)
+        except ForgedActivityError:
+            logger.bind(entry_id=entry.id, actor_id=entry.activity.actor).warning(
+                "Dropping inbox entry with invalid signature"
+            )
+            await self.drop_inbox_entry(entry)
+            return
+
+        await self.inbox.update_entries_state([entry.id], entry_status)
+
+    async def process_activity(self, entry: InboxEntry) -> InboxEntryStatus:
         entry_status = entry.status
 
+        if (
+            entry.activity.is_actor_delete
+            and await self.get_actor(entry.activity.actor) is None
+        ):
+            return InboxEntryStatus.synced
+
         try:
+            await self.verify_inbox_entry(entry)
+
             match entry.activity.type, entry.activity.object_type:
                 case "Follow", _:
                     entry_status = await self.handle_follow(entry)
@@ -173,7 +475,7 @@ class ActivityPubService:
         except EnsureActorError:
             entry_status = InboxEntryStatus.error
 
-        await self.inbox.update_entries_state([entry_id], entry_status)
+        return entry_status
 
     async def handle_follow(self, entry: InboxEntry) -> InboxEntryStatus:
         actor = await self.ensure_remote_actor(entry)
@@ -186,29 +488,11 @@ class ActivityPubService:
                 to_actor=self.settings.main_actor_id,
                 status=FollowStatus.accepted,
             )
-            auth = SignedRequestAuth(
-                public_key_id=HttpUrl(self.settings.public_key_id),
-                private_key=self.settings.private_key,
+            await self.delivery_worker.enqueue(
+                follow.to_accept_ap(),
+                actor.ap_data.inbox,
+                self.get_request_key_type(actor),
             )
-            headers = {
-                "User-Agent": self.settings.user_agent,
-                "Content-Type": "application/activity+json",
-            }
-
-            async with httpx.AsyncClient(auth=auth, headers=headers) as client:
-                response = await client.post(
-                    str(actor.ap_data.inbox), json=follow.to_accept_ap()
-                )
-
-                if response.is_error:
-                    logger.bind(
-                        follow_id=follow.id,
-                        http_status=response.status_code,
-                        http_message=response.text,
-                    ).error("Failed to accept follow")
-
-                    return InboxEntryStatus.error
-
             await self.follows.upsert_follow(follow)
 
         return InboxEntryStatus.synced
@@ -251,8 +535,13 @@ def activitypub_service_factory(container: Container) -> ActivityPubService:
     return ActivityPubService(
         settings=get_capsule_settings(container),
         inbox_repository=InboxRepository(sqlmodel_service),
-        actor_repository=ActorRepository(ladybug_service),
+        actor_repository=ActorRepository(ladybug_service, get_actor_cache(container)),
         follows_repository=FollowRepository(ladybug_service),
+        inbox_writer=get_inbox_writer(container),
+        signature_service=get_signature_service(container),
+        federation_client=get_federation_client(container),
+        fetch_backoff=get_fetch_backoff(container),
+        delivery_worker=get_delivery_worker(container),
     )
 
 
@@ -0,0 +1,312 @@
+import asyncio
+import time
+import zlib
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from math import ceil
+from typing import Annotated, cast
+
+from fastapi import Depends, FastAPI
+from loguru import logger
+from pydantic import HttpUrl
+from svcs import Container
+from svcs.fastapi import DepContainer, get_registry
+from wheke import get_service
+
+from capsule.settings import CapsuleSettings, get_capsule_settings
+from capsule.utils import utc_now
+
+from .delivery import get_delivery_worker
+from .health import get_host_health_tracker
+from .models import InboxEntry, InboxEntryStatus
+from .service import ActivityPubService, get_activitypub_service
+
+PROCESSING_TIME_WEIGHT = 0.2
+
+
+class InboxLane:
+    queue: asyncio.Queue[tuple[InboxEntry, float]]
+    lag: float
+
+    def __init__(self, maxsize: int) -> None:
+        self.queue = asyncio.Queue(maxsize)
+        self.lag = 0.0
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+
+class InboxWorker:
+    settings: CapsuleSettings
+    activitypub: ActivityPubService
+
+    lanes: list[InboxLane]
+    tasks: set[asyncio.Task]
+    queued_ids: set[int]
+    leased_ids: set[int]
+
+    in_flight: int
+    processing_time: float
+    rejected: int
+    overflowed: int
+
+    def __init__(
+        self,
+        *,
+        settings: CapsuleSettings,
+        activitypub_service: ActivityPubService,
+    ) -> None:
+        self.settings = settings
+        self.activitypub = activitypub_service
+
+        lanes_count = max(settings.inbox_workers, 1)
+        lane_size = max(settings.inbox_queue_size // lanes_count, 1)
+
+        self.lanes = [InboxLane(lane_size) for _ in range(lanes_count)]
+        self.tasks = set()
+        self.queued_ids = set()
+        self.leased_ids = set()
+
+        self.in_flight = 0
+        self.processing_time = 0.0
+        self.rejected = 0
+        self.overflowed = 0
+
+    @property
+    def is_running(self) -> bool:
+        return len(self.tasks) > 0
+
+    @property
+    def queued(self) -> int:
+        return sum(lane.depth for lane in self.lanes)
+
+    @property
+    def backlog(self) -> int:
+        return self.queued + self.in_flight
+
+    def get_lane(self, entry: InboxEntry) -> InboxLane:
+        return self.get_actor_lane(entry.activity.actor)
+
+    def get_actor_lane(self, actor: HttpUrl) -> InboxLane:
+        key = str(actor).encode("utf8")
+
+        return self.lanes[zlib.crc32(key) % len(self.lanes)]
+
+    def admits(self, actor: HttpUrl, *, is_follower: bool) -> bool:
+        if self.get_actor_lane(actor).queue.full():
+            return False
+
+        if is_follower:
+            return self.backlog < self.settings.inbox_follower_high_water
+
+        return self.backlog < self.settings.inbox_high_water
+
+    def reject(self) -> int:
+        self.rejected += 1
+
+        drain_time = (
+            self.backlog * self.processing_time / max(self.settings.inbox_workers, 1)
+        )
+
+        return min(max(ceil(drain_time), 1), self.settings.inbox_max_retry_after)
+
+    async def start(self) -> None:
+        if self.is_running:
+            return
+
+        for lane in self.lanes:
+            self.tasks.add(asyncio.create_task(self._run(lane)))
+
+        if self.settings.inbox_retention_interval > 0:
+            self.tasks.add(asyncio.create_task(self._run_retention()))
+
+        if self.settings.actor_refresh_interval > 0:
+            self.tasks.add(asyncio.create_task(self._run_actor_refresh()))
+
+        await self.recover()
+
+        if self.settings.inbox_recovery_interval > 0:
+            self.tasks.add(asyncio.create_task(self._run_recovery()))
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+        self.tasks.clear()
+
+        if self.leased_ids:
+            released = await self.activitypub.inbox.release_leases(
+                list(self.leased_ids)
+            )
+            self.leased_ids.clear()
+
+            logger.info("Released {} inbox leases on shutdown", released)
+
+    async def join(self) -> None:
+        for lane in self.lanes:
+            await lane.queue.join()
+
+    async def recover(self) -> None:
+        released = await self.activitypub.release_expired_inbox_leases()
+
+        if released > 0:
+            logger.info("Released {} expired inbox leases", released)
+
+        created_before = utc_now() - timedelta(
+            seconds=self.settings.inbox_recovery_grace
+        )
+
+        async for entries in self.activitypub.inbox.list_entries_chunks(
+            [InboxEntryStatus.created, InboxEntryStatus.pending_verification],
+            self.settings.inbox_sync_chunk_size,
+            created_before=created_before,
+        ):
+            for entry in entries:
+                if entry.id not in self.queued_ids and not self.submit(entry):
+                    return
+
+    def submit(self, entry: InboxEntry) -> bool:
+        entry_id = cast(int, entry.id)
+
+        if entry_id in self.queued_ids:
+            return True
+
+        try:
+            self.get_lane(entry).queue.put_nowait((entry, time.monotonic()))
+        except asyncio.QueueFull:
+            self.overflowed += 1
+            logger.bind(entry_id=entry_id).warning(
+                "Inbox lane is full, leaving entry for recovery"
+            )
+            return False
+
+        self.queued_ids.add(entry_id)
+
+        return True
+
+    async def process(self, entry: InboxEntry) -> None:
+        if not await self.activitypub.lease_inbox_entry(entry):
+            return
+
+        entry_id = cast(int, entry.id)
+        self.leased_ids.add(entry_id)
+        self.in_flight += 1
+        start = time.perf_counter()
+
+        try:
+            await self.activitypub.handle_activity(entry)
+        except Exception:
+            logger.bind(entry_id=entry.id).exception("Failed to process inbox entry")
+
+            await self.activitypub.inbox.update_entries_state(
+                [entry.id], InboxEntryStatus.error
+            )
+        finally:
+            self.in_flight -= 1
+            self._record_processing_time(time.perf_counter() - start)
+
+        self.leased_ids.discard(entry_id)
+
+    def _record_processing_time(self, duration: float) -> None:
+        if self.processing_time == 0:
+            self.processing_time = duration
+        else:
+            self.processing_time += PROCESSING_TIME_WEIGHT * (
+                duration - self.processing_time
+            )
+
+    async def _run(self, lane: InboxLane) -> None:
+        while True:
+            entry, queued_at = await lane.queue.get()
+            self.queued_ids.discard(cast(int, entry.id))
+            lane.lag = time.monotonic() - queued_at
+
+            try:
+                await self.process(entry)
+            except Exception:
+                logger.bind(entry_id=entry.id).exception(
+                    "Inbox lane failed on entry, leaving it for recovery"
+                )
+            finally:
+                lane.queue.task_done()
+
+    async def _run_recovery(self) -> None:
+        while True:
+            await asyncio.sleep(self.settings.inbox_recovery_interval)
+
+            try:
+                await self.recover()
+            except Exception:
+                logger.exception("Failed to recover inbox entries")
+
+    async def _run_retention(self) -> None:
+        while True:
+            await asyncio.sleep(self.settings.inbox_retention_interval)
+
+            try:
+                result = await self.activitypub.cleanup_inbox_entries(
+                    self.activitypub.get_inbox_retention_policy()
+                )
+            except Exception:
+                logger.exception("Failed to apply inbox retention policy")
+                continue
+
+            logger.info(
+                "Inbox retention removed {} entries in {:.3f}s",
+                result.deleted,
+                result.elapsed,
+            )
+
+    async def _run_actor_refresh(self) -> None:
+        while True:
+            await asyncio.sleep(self.settings.actor_refresh_interval)
+
+            try:
+                refreshed = await self.activitypub.refresh_stale_actors()
+            except Exception:
+                logger.exception("Failed to refresh stale actors")
+                continue
+
+            if refreshed > 0:
+                logger.info("Refreshed {} stale actors", refreshed)
+
+
+def inbox_worker_factory(container: Container) -> InboxWorker:
+    return InboxWorker(
+        settings=get_capsule_settings(container),
+        activitypub_service=get_activitypub_service(container),
+    )
+
+
+def get_inbox_worker(container: Container) -> InboxWorker:
+    return get_service(container, InboxWorker)
+
+
+def _inbox_worker_injection(container: DepContainer) -> InboxWorker:
+    return get_inbox_worker(container)
+
+
+InboxWorkerInjection = Annotated[InboxWorker, Depends(_inbox_worker_injection)]
+
+
+@asynccontextmanager
+async def inbox_worker_lifespan(app: FastAPI) -> AsyncGenerator[None]:
+    async with Container(get_registry(app)) as container:
+        worker = get_inbox_worker(container)
+        delivery_worker = get_delivery_worker(container)
+        host_health = get_host_health_tracker(container)
+
+        await host_health.start()
+        await worker.start()
+        await delivery_worker.start()
+
+        try:
+            yield
+        finally:
+            await worker.stop()
+            await delivery_worker.stop()
+            await host_health.stop()
@@ -0,0 +1,129 @@
+import asyncio
+from collections import OrderedDict
+
+from svcs import Container
+from wheke import get_service
+from wheke_sqlmodel import get_sqlmodel_service
+
+from capsule.settings import CapsuleSettings, get_capsule_settings
+
+from .models import InboxEntry
+from .repositories import InboxRepository
+
+PendingEntry = tuple[InboxEntry, asyncio.Future[InboxEntry | None]]
+
+
+class InboxWriter:
+    settings: CapsuleSettings
+    inbox: InboxRepository
+
+    pending: list[PendingEntry]
+    flush_handle: asyncio.TimerHandle | None
+    commit_lock: asyncio.Lock
+    tasks: set[asyncio.Task]
+
+    recent_ids: OrderedDict[str, None]
+    duplicates: int
+
+    def __init__(
+        self,
+        *,
+        settings: CapsuleSettings,
+        inbox_repository: InboxRepository,
+    ) -> None:
+        self.settings = settings
+        self.inbox = inbox_repository
+
+        self.pending = []
+        self.flush_handle = None
+        self.commit_lock = asyncio.Lock()
+        self.tasks = set()
+
+        self.recent_ids = OrderedDict()
+        self.duplicates = 0
+
+    def is_duplicate(self, activity_id: str) -> bool:
+        if activity_id in self.recent_ids:
+            self.recent_ids.move_to_end(activity_id)
+            self.duplicates += 1
+            return True
+
+        return False
+
+    def forget(self, activity_id: str) -> None:
+        self.recent_ids.pop(activity_id, None)
+
+    async def write(self, entry: InboxEntry) -> InboxEntry | None:
+        activity_id = str(entry.activity.id)
+
+        if self.is_duplicate(activity_id):
+            return None
+
+        self._remember(activity_id)
+
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[InboxEntry | None] = loop.create_future()
+
+        self.pending.append((entry, future))
+
+        if len(self.pending) >= self.settings.inbox_write_batch_size:
+            self._flush_pending()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(
+                self.settings.inbox_write_batch_delay, self._flush_pending
+            )
+
+        return await future
+
+    async def flush(self) -> None:
+        if self.pending:
+            self._flush_pending()
+
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def _flush_pending(self) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        batch, self.pending = self.pending, []
+
+        task = asyncio.create_task(self._commit(batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _commit(self, batch: list[PendingEntry]) -> None:
+        async with self.commit_lock:
+            try:
+                entries = await self.inbox.create_entries([entry for entry, _ in batch])
+            except Exception as exc:
+                for entry, future in batch:
+                    self.recent_ids.pop(str(entry.activity.id), None)
+
+                    if not future.done():
+                        future.set_exception(exc)
+                return
+
+        for (_, future), created in zip(batch, entries, strict=True):
+            if created is None:
+                self.duplicates += 1
+
+            if not future.done():
+                future.set_result(created)
+
+    def _remember(self, activity_id: str) -> None:
+        self.recent_ids[activity_id] = None
+
+        while len(self.recent_ids) > self.settings.inbox_recent_ids_size:
+            self.recent_ids.popitem(last=False)
+
+
+def inbox_writer_factory(container: Container) -> InboxWriter:
+    return InboxWriter(
+        settings=get_capsule_settings(container),
+        inbox_repository=InboxRepository(get_sqlmodel_service(container)),
+    )
+
+
+def get_inbox_writer(container: Container) -> InboxWriter:
+    return get_service(container, InboxWriter)
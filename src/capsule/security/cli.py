@@ -1,9 +1,11 @@
+from typing import Annotated
+
 from rich.console import Console
-from typer import Context, Typer
+from typer import Context, Option, Typer
 from wheke import get_container
 
 from .services.auth import get_auth_service
-from .utils import generate_rsa_keypair
+from .utils import KeyType, generate_keypair
 
 cli = Typer(short_help="Security commands")
 console = Console(highlight=False)
@@ -17,8 +19,10 @@ def hashpwd(ctx: Context, password: str) -> None:
 
 
 @cli.command()
-def keypair() -> None:
-    key_pair = generate_rsa_keypair()
+def keypair(
+    key_type: Annotated[KeyType, Option("--type", help="Key algorithm")] = KeyType.rsa,
+) -> None:
+    key_pair = generate_keypair(key_type)
     console.print(
         key_pair.private_key,
         key_pair.public_key,
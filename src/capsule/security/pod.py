@@ -13,7 +13,12 @@ security_pod = Pod(
     "security",
     services=[
         ServiceConfig(AuthService, auth_service_factory),
-        ServiceConfig(SignatureService, signature_service_factory),
+        ServiceConfig(
+            SignatureService,
+            signature_service_factory,
+            is_singleton=True,
+            singleton_cleanup_method="shutdown",
+        ),
     ],
     router=router,
     cli=cli,
@@ -1,83 +1,187 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from collections.abc import Callable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
 from datetime import UTC, datetime, timedelta
 from email.utils import parsedate_to_datetime
-from typing import Annotated, cast
+from typing import Annotated
 
 from cryptography.exceptions import InvalidSignature
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
 from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
 from fastapi import Depends, Request
 from svcs import Container
 from svcs.fastapi import DepContainer
 from wheke import get_service
 
+from capsule.settings import CapsuleSettings, get_capsule_settings
+
 from ..exception import VerificationBadFormatError, VerificationError
 from ..utils import HttpSignatureInfo, calculate_sha_256_digest
 
+PublicKeyCacheKey = tuple[str, bytes]
+PublicKeyInstance = RSAPublicKey | Ed25519PublicKey
+
+SIGNATURE_ALGORITHMS = ["rsa-sha256", "hs2019", "ed25519"]
+
 
 class SignatureService:
-    async def verify_request(self, request: Request, public_key: str) -> None:
-        if "digest" in request.headers:
-            expected_digest = calculate_sha_256_digest(await request.body())
+    settings: CapsuleSettings
+
+    executor: ThreadPoolExecutor
+    public_keys: OrderedDict[PublicKeyCacheKey, PublicKeyInstance]
+
+    def __init__(self, *, settings: CapsuleSettings) -> None:
+        self.settings = settings
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.signature_workers,
+            thread_name_prefix="signature",
+        )
+        self.public_keys = OrderedDict()
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def load_public_key(self, key_id: str, public_key: str) -> PublicKeyInstance:
+        cache_key = (key_id, hashlib.sha256(public_key.encode("ascii")).digest())
+        pk_instance = self.public_keys.get(cache_key)
+
+        if pk_instance is not None:
+            self.public_keys.move_to_end(cache_key)
+            return pk_instance
+
+        try:
+            pk_instance = serialization.load_pem_public_key(public_key.encode("ascii"))
+        except ValueError as exc:
+            msg = "Bad public key"
+            raise VerificationBadFormatError(msg) from exc
+
+        if not isinstance(pk_instance, RSAPublicKey | Ed25519PublicKey):
+            msg = "Unsupported public key type"
+            raise VerificationBadFormatError(msg)
+
+        self.public_keys[cache_key] = pk_instance
+
+        while len(self.public_keys) > self.settings.signature_key_cache_size:
+            self.public_keys.popitem(last=False)
 
-            if request.headers["digest"] != expected_digest:
+        return pk_instance
+
+    def get_request_headers(self, request: Request) -> dict[str, str]:
+        headers = {
+            "(request-target)": f"{request.method.lower()} {request.url.path}",
+            **request.headers,
+        }
+        signed_headers = {"signature", "digest", "date"}
+
+        with suppress(KeyError, ValueError):
+            signed_headers.update(
+                HttpSignatureInfo.from_compiled_signature(
+                    request.headers.get("signature", "")
+                ).headers
+            )
+
+        return {k: v for k, v in headers.items() if k in signed_headers}
+
+    async def verify_request(
+        self, request: Request, get_public_key: Callable[[str], str]
+    ) -> None:
+        await self.verify_headers(
+            self.get_request_headers(request), await request.body(), get_public_key
+        )
+
+    async def verify_headers(
+        self,
+        headers: Mapping[str, str],
+        body: bytes,
+        get_public_key: Callable[[str], str],
+        received_at: datetime | None = None,
+    ) -> None:
+        if "digest" in headers:
+            expected_digest = calculate_sha_256_digest(body)
+
+            if headers["digest"] != expected_digest:
                 msg = "Bad digest"
                 raise VerificationBadFormatError(msg)
 
-        if "date" in request.headers:
-            expiration = parsedate_to_datetime(request.headers["date"]).astimezone(UTC)
+        if "date" in headers:
+            expiration = parsedate_to_datetime(headers["date"]).astimezone(UTC)
 
-            if datetime.now(UTC) - expiration > timedelta(seconds=60):
+            if (received_at or datetime.now(UTC)) - expiration > timedelta(seconds=60):
                 msg = "Expired digest"
                 raise VerificationBadFormatError(msg)
 
-        if "signature" not in request.headers:
+        if "signature" not in headers:
             msg = "Missing signature"
             raise VerificationBadFormatError(msg)
 
         try:
             signature_info = HttpSignatureInfo.from_compiled_signature(
-                request.headers["signature"]
+                headers["signature"]
             )
         except (KeyError, ValueError) as exc:
             msg = "Bad signature"
             raise VerificationBadFormatError(msg) from exc
 
-        if signature_info.algorithm not in ["rsa-sha256", "hs2019"]:
+        if signature_info.algorithm not in SIGNATURE_ALGORITHMS:
             msg = "Unknown signature algorithm"
             raise VerificationBadFormatError(msg)
 
-        headers = {}
+        signed_headers = {}
 
         for header in signature_info.headers:
-            if header == "(request-target)":
-                value = f"{request.method.lower()} {request.url.path}"
-            else:
-                value = request.headers[header]
+            if header not in headers:
+                msg = "Missing signed header"
+                raise VerificationBadFormatError(msg)
+
+            signed_headers[header] = headers[header]
 
-            headers[header] = value
+        data = "\n".join(f"{k}: {v}" for k, v in signed_headers.items())
+
+        try:
+            public_key = get_public_key(signature_info.keyid)
+        except ValueError as exc:
+            msg = "Bad public key"
+            raise VerificationBadFormatError(msg) from exc
 
-        data = "\n".join(f"{k}: {v}" for k, v in headers.items())
+        pk_instance = self.load_public_key(signature_info.keyid, public_key)
 
-        self.verify_signature(signature_info.signature, data, public_key)
+        if signature_info.algorithm == "rsa-sha256" and not isinstance(
+            pk_instance, RSAPublicKey
+        ):
+            msg = "Signature algorithm does not match the key type"
+            raise VerificationBadFormatError(msg)
 
-    def verify_signature(self, signature: bytes, data: str, public_key: str) -> None:
-        pk_instance: RSAPublicKey = cast(
-            RSAPublicKey,
-            serialization.load_pem_public_key(public_key.encode("ascii")),
+        await asyncio.get_running_loop().run_in_executor(
+            self.executor,
+            self.verify_signature,
+            signature_info.signature,
+            data,
+            pk_instance,
         )
 
+    def verify_signature(
+        self, signature: bytes, data: str, pk_instance: PublicKeyInstance
+    ) -> None:
         try:
-            pk_instance.verify(
-                signature, data.encode("utf8"), padding.PKCS1v15(), hashes.SHA256()
-            )
+            if isinstance(pk_instance, Ed25519PublicKey):
+                pk_instance.verify(signature, data.encode("utf8"))
+            else:
+                pk_instance.verify(
+                    signature, data.encode("utf8"), padding.PKCS1v15(), hashes.SHA256()
+                )
         except InvalidSignature as exc:
             msg = "Invalid Signature"
             raise VerificationError(msg) from exc
 
 
-def signature_service_factory(_: Container) -> SignatureService:
-    return SignatureService()
+def signature_service_factory(container: Container) -> SignatureService:
+    return SignatureService(settings=get_capsule_settings(container))
 
 
 def get_signature_service(container: Container) -> SignatureService:
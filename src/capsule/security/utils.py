@@ -1,14 +1,21 @@
+import asyncio
 import base64
 import secrets
 from base64 import b64decode, b64encode
 from collections import namedtuple
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator, Iterable
+from concurrent.futures import Executor
 from datetime import UTC, datetime
 from email.utils import format_datetime
-from typing import cast
+from enum import StrEnum
+from functools import lru_cache
 
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric.ed25519 import (
+    Ed25519PrivateKey,
+    Ed25519PublicKey,
+)
 from cryptography.hazmat.primitives.asymmetric.rsa import (
     RSAPrivateKey,
     generate_private_key,
@@ -16,7 +23,16 @@ from cryptography.hazmat.primitives.asymmetric.rsa import (
 from httpx import Auth, Request, Response
 from pydantic import HttpUrl
 
-RSAKeyPair = namedtuple("RSAKeyPair", ["private_key", "public_key"])
+KeyPair = namedtuple("KeyPair", ["private_key", "public_key"])
+RSAKeyPair = KeyPair
+
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+ED25519_MULTICODEC_PREFIX = b"\xed\x01"
+
+
+class KeyType(StrEnum):
+    rsa = "rsa"
+    ed25519 = "ed25519"
 
 
 def client_id() -> str:
@@ -34,12 +50,20 @@ def calculate_sha_256_digest(data: bytes) -> str:
     return "SHA-256=" + base64.b64encode(digest.finalize()).decode("ascii")
 
 
-def generate_rsa_keypair() -> RSAKeyPair:
-    private_key = generate_private_key(
-        public_exponent=65537,
-        key_size=2048,
+@lru_cache(maxsize=16)
+def load_private_key(private_key: str) -> RSAPrivateKey | Ed25519PrivateKey:
+    private_key_instance = serialization.load_pem_private_key(
+        private_key.encode("ascii"), password=None
     )
 
+    if not isinstance(private_key_instance, RSAPrivateKey | Ed25519PrivateKey):
+        msg = "Unsupported private key type"
+        raise TypeError(msg)
+
+    return private_key_instance
+
+
+def serialize_keypair(private_key: RSAPrivateKey | Ed25519PrivateKey) -> KeyPair:
     private_key_serialized = private_key.private_bytes(
         encoding=serialization.Encoding.PEM,
         format=serialization.PrivateFormat.PKCS8,
@@ -55,7 +79,90 @@ def generate_rsa_keypair() -> RSAKeyPair:
         .decode("ascii")
     )
 
-    return RSAKeyPair(private_key_serialized, public_key_serialized)
+    return KeyPair(private_key_serialized, public_key_serialized)
+
+
+def generate_keypair(key_type: KeyType = KeyType.rsa) -> KeyPair:
+    match key_type:
+        case KeyType.ed25519:
+            return generate_ed25519_keypair()
+        case _:
+            return generate_rsa_keypair()
+
+
+def generate_rsa_keypair() -> RSAKeyPair:
+    private_key = generate_private_key(
+        public_exponent=65537,
+        key_size=2048,
+    )
+
+    return serialize_keypair(private_key)
+
+
+def generate_ed25519_keypair() -> KeyPair:
+    return serialize_keypair(Ed25519PrivateKey.generate())
+
+
+def base58_encode(data: bytes) -> str:
+    number = int.from_bytes(data, "big")
+    encoded = ""
+
+    while number > 0:
+        number, remainder = divmod(number, 58)
+        encoded = BASE58_ALPHABET[remainder] + encoded
+
+    padding_size = len(data) - len(data.lstrip(b"\x00"))
+
+    return BASE58_ALPHABET[0] * padding_size + encoded
+
+
+def base58_decode(data: str) -> bytes:
+    number = 0
+
+    for char in data:
+        number = number * 58 + BASE58_ALPHABET.index(char)
+
+    padding_size = len(data) - len(data.lstrip(BASE58_ALPHABET[0]))
+
+    return b"\x00" * padding_size + number.to_bytes(
+        (number.bit_length() + 7) // 8, "big"
+    )
+
+
+def public_key_pem_to_multibase(public_key: str) -> str:
+    public_key_instance = serialization.load_pem_public_key(public_key.encode("ascii"))
+
+    if not isinstance(public_key_instance, Ed25519PublicKey):
+        msg = "Only Ed25519 keys can be encoded as multikey"
+        raise TypeError(msg)
+
+    raw = public_key_instance.public_bytes(
+        encoding=serialization.Encoding.Raw,
+        format=serialization.PublicFormat.Raw,
+    )
+
+    return "z" + base58_encode(ED25519_MULTICODEC_PREFIX + raw)
+
+
+def multibase_to_public_key_pem(multibase: str) -> str:
+    if not multibase.startswith("z"):
+        msg = "Unsupported multibase encoding"
+        raise ValueError(msg)
+
+    decoded = base58_decode(multibase[1:])
+
+    if not decoded.startswith(ED25519_MULTICODEC_PREFIX):
+        msg = "Unsupported multikey codec"
+        raise ValueError(msg)
+
+    public_key_instance = Ed25519PublicKey.from_public_bytes(
+        decoded.removeprefix(ED25519_MULTICODEC_PREFIX)
+    )
+
+    return public_key_instance.public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode("ascii")
 
 
 class HttpSignatureInfo:
@@ -110,15 +217,42 @@ class HttpSignatureInfo:
 class SignedRequestAuth(Auth):
     public_key_id: HttpUrl
     private_key: str
+    executor: Executor | None
 
-    def __init__(self, public_key_id: HttpUrl, private_key: str) -> None:
+    def __init__(
+        self,
+        public_key_id: HttpUrl,
+        private_key: str,
+        executor: Executor | None = None,
+    ) -> None:
         self.public_key_id = public_key_id
         self.private_key = private_key
+        self.executor = executor
 
     def auth_flow(self, request: Request) -> Generator[Request, Response]:
         self.sign_request(request)
         yield request
 
+    async def async_auth_flow(
+        self, request: Request
+    ) -> AsyncGenerator[Request, Response]:
+        await self.sign_request_async(request)
+        yield request
+
+    async def sign_request_async(self, request: Request) -> None:
+        await asyncio.get_running_loop().run_in_executor(
+            self.executor, self.sign_request, request
+        )
+
+    async def sign_requests(self, requests: Iterable[Request]) -> list[Request]:
+        requests = list(requests)
+
+        await asyncio.gather(
+            *(self.sign_request_async(request) for request in requests)
+        )
+
+        return requests
+
     def sign_request(self, request: Request) -> None:
         request.headers["(request-target)"] = (
             f"{request.method.lower()} {request.url.path}"
@@ -141,21 +275,22 @@ class SignedRequestAuth(Auth):
         data_to_sign = "\n".join(
             f"{header.lower()}: {request.headers[header]}" for header in headers_to_sign
         ).encode("utf8")
-        private_key_instance: RSAPrivateKey = cast(
-            RSAPrivateKey,
-            serialization.load_pem_private_key(
-                self.private_key.encode("ascii"), password=None
-            ),
-        )
-        signature = private_key_instance.sign(
-            data_to_sign, padding.PKCS1v15(), hashes.SHA256()
-        )
+        private_key_instance = load_private_key(self.private_key)
+
+        if isinstance(private_key_instance, Ed25519PrivateKey):
+            signature = private_key_instance.sign(data_to_sign)
+            algorithm = "hs2019"
+        else:
+            signature = private_key_instance.sign(
+                data_to_sign, padding.PKCS1v15(), hashes.SHA256()
+            )
+            algorithm = "rsa-sha256"
 
         signature_info = HttpSignatureInfo(
             keyid=str(self.public_key_id),
             headers=headers_to_sign,
             signature=signature,
-            algorithm="rsa-sha256",
+            algorithm=algorithm,
         )
 
         request.headers["Signature"] = signature_info.compiled_signature
@@ -1,3 +1,4 @@
+from enum import StrEnum
 from typing import Annotated
 
 import httpx
@@ -24,6 +25,11 @@ def default_features() -> dict:
     }
 
 
+class RateLimitBackend(StrEnum):
+    memory = "memory"
+    database = "database"
+
+
 class CapsuleSettings(WhekeSettings):
     project_name: str = "Capsule"
     hostname: HttpUrl = HttpUrl("http://localhost:8000")
@@ -36,6 +42,79 @@ class CapsuleSettings(WhekeSettings):
 
     public_key: str = ""
     private_key: str = ""
+    ed25519_public_key: str = ""
+    ed25519_private_key: str = ""
+
+    document_cache_max_age: int = 300
+    document_cache_gzip: bool = True
+
+    signature_workers: int = 4
+    signature_key_cache_size: int = 1024
+
+    inbox_workers: int = 4
+    inbox_queue_size: int = 1024
+    inbox_lease_seconds: int = 300
+    inbox_recovery_interval: int = 60
+    inbox_recovery_grace: int = 300
+    inbox_high_water: int = 512
+    inbox_follower_high_water: int = 1024
+    inbox_max_retry_after: int = 300
+    inbox_rate_limit: float = 10.0
+    inbox_rate_limit_burst: int = 100
+    inbox_rate_limit_hosts: int = 10000
+    inbox_rate_limit_backend: RateLimitBackend = RateLimitBackend.memory
+    inbox_write_batch_size: int = 64
+    inbox_write_batch_delay: float = 0.005
+    inbox_recent_ids_size: int = 10000
+    inbox_sync_chunk_size: int = 500
+    inbox_sync_concurrency: int = 8
+    inbox_retention_seconds: int = 30 * 24 * 60 * 60
+    inbox_retention_interval: int = 0
+    inbox_cleanup_chunk_size: int = 500
+
+    actor_cache_size: int = 4096
+    actor_cache_ttl: float = 300.0
+    actor_refresh_after: int = 24 * 60 * 60
+    actor_refresh_interval: int = 300
+    actor_refresh_batch_size: int = 50
+    actor_refresh_concurrency: int = 4
+    actor_refetch_cooldown: int = 60
+    actor_fetch_backoff_base: float = 60.0
+    actor_fetch_backoff_max: float = 6 * 60 * 60
+    actor_fetch_backoff_host_threshold: int = 3
+    actor_fetch_backoff_size: int = 10000
+
+    delivery_workers: int = 16
+    delivery_max_per_host: int = 2
+    delivery_batch_size: int = 64
+    delivery_max_attempts: int = 8
+    delivery_retry_base: float = 60.0
+    delivery_retry_max: float = 6 * 60 * 60
+    delivery_poll_interval: float = 5.0
+    delivery_lease_seconds: int = 300
+
+    fetch_rate_limit: float = 5.0
+    fetch_rate_limit_burst: int = 10
+    fetch_max_per_host: int = 4
+    fetch_max_wait: float = 30.0
+    fetch_retry_after_max: float = 60 * 60
+    fetch_governor_hosts: int = 10000
+
+    host_circuit_failure_threshold: int = 5
+    host_circuit_open_seconds: float = 60.0
+    host_health_window: int = 100
+    host_health_size: int = 10000
+    host_health_flush_interval: float = 10.0
+
+    http_client_http2: bool = False
+    http_client_max_connections: int = 100
+    http_client_max_keepalive_connections: int = 20
+    http_client_max_connections_per_host: int = 8
+    http_client_keepalive_expiry: float = 30.0
+    http_client_connect_timeout: float = 5.0
+    http_client_read_timeout: float = 10.0
+    http_client_dns_cache_ttl: float = 300.0
+    http_client_dns_cache_size: int = 256
 
     features: dict = Field(default_factory=default_features)
 
@@ -59,6 +138,10 @@ class CapsuleSettings(WhekeSettings):
     def public_key_id(self) -> str:
         return f"{self.actor_url}#main-key"
 
+    @property
+    def ed25519_key_id(self) -> str:
+        return f"{self.actor_url}#ed25519-key"
+
     @property
     def user_agent(self):
         return (
@@ -5,6 +5,10 @@ from fastapi import status
 from fastapi.testclient import TestClient
 from pydantic import HttpUrl
 
+from capsule.security.utils import (
+    generate_ed25519_keypair,
+    multibase_to_public_key_pem,
+)
 from capsule.settings import CapsuleSettings
 
 
@@ -64,6 +68,30 @@ def test_actor(
     }
 
 
+def test_actor_ed25519_assertion_method(
+    client: TestClient, capsule_settings: CapsuleSettings
+) -> None:
+    keys = generate_ed25519_keypair()
+    capsule_settings.ed25519_public_key = keys.public_key
+
+    response = client.get(f"/actors/{capsule_settings.username}")
+
+    assert response.status_code == status.HTTP_200_OK
+
+    data = response.json()
+    assertion_method = data["assertionMethod"][0]
+
+    assert "https://w3id.org/security/multikey/v1" in data["@context"]
+    assert assertion_method["id"] == capsule_settings.ed25519_key_id
+    assert assertion_method["type"] == "Multikey"
+    assert assertion_method["controller"] == capsule_settings.actor_url
+    assert assertion_method["publicKeyMultibase"].startswith("z6Mk")
+    assert (
+        multibase_to_public_key_pem(assertion_method["publicKeyMultibase"])
+        == keys.public_key
+    )
+
+
 def test_actor_not_found(client: TestClient) -> None:
     response = client.get("/actors/notfound")
     assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,119 @@
+import time
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from httpx import Response
+from pydantic import HttpUrl
+from respx import MockRouter
+from svcs import Container
+
+from capsule.activitypub.backoff import FetchBackoff
+from capsule.activitypub.exceptions import HostUnavailableError
+from capsule.activitypub.models import InboxEntry, InboxEntryStatus
+from capsule.activitypub.service import get_activitypub_service
+from capsule.security.utils import RSAKeyPair
+from capsule.settings import CapsuleSettings
+from tests.utils import (
+    ap_actor_auth,
+    ap_create_note,
+    run_with_container,
+    wait_inbox_worker,
+)
+
+
+def test_fetch_backoff(capsule_settings: CapsuleSettings) -> None:
+    capsule_settings.actor_fetch_backoff_base = 10
+    capsule_settings.actor_fetch_backoff_max = 40
+    capsule_settings.actor_fetch_backoff_host_threshold = 2
+    capsule_settings.actor_fetch_backoff_size = 3
+    backoff = FetchBackoff(settings=capsule_settings)
+    actor_id = HttpUrl("https://dead.example/actors/first")
+    other_id = HttpUrl("https://dead.example/actors/other")
+
+    backoff.record_failure(actor_id, host_failure=True)
+
+    assert backoff.is_blocked(actor_id)
+    assert not backoff.is_blocked(other_id)
+
+    backoff.record_failure(actor_id, host_failure=True)
+
+    assert backoff.entries[str(actor_id)].attempts == 1
+    assert backoff.is_blocked(other_id)
+    assert backoff.short_circuited == 2
+
+    for max_delay in (20, 40, 40):
+        entry = backoff.entries[str(actor_id)]
+        entry.retry_at = 0
+        backoff.record_failure(actor_id, host_failure=False)
+
+        assert max_delay / 2 - 1 < entry.retry_at - time.monotonic() <= max_delay
+
+    backoff.record_success(other_id)
+
+    assert not backoff.is_blocked(other_id)
+    assert backoff.is_blocked(actor_id)
+
+    for i in range(5):
+        backoff.record_failure(
+            HttpUrl(f"https://dead{i}.example/actors/first"), host_failure=True
+        )
+
+    assert backoff.size == 3
+
+
+def test_inbox_backs_off_failed_actor_fetch(
+    client: TestClient,
+    capsule_settings: CapsuleSettings,
+    actor_and_keypair: tuple[dict, RSAKeyPair],
+    respx_mock: MockRouter,
+) -> None:
+    instance_username = capsule_settings.username
+    actor, keys = actor_and_keypair
+    actor_username = actor["preferredUsername"]
+
+    route = respx_mock.get(actor["id"]).mock(return_value=Response(status_code=404))
+
+    for _ in range(3):
+        response = client.post(
+            f"/actors/{instance_username}/inbox",
+            json=ap_create_note(actor_username, instance_username),
+            auth=ap_actor_auth(actor, keys),
+        )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        wait_inbox_worker(client)
+
+    assert route.call_count == 1
+
+    async def list_errors(container: Container) -> list[InboxEntry]:
+        activitypub = get_activitypub_service(container)
+
+        return [
+            entry
+            async for entry in activitypub.inbox.list_entries(InboxEntryStatus.error)
+        ]
+
+    assert len(run_with_container(client, list_errors)) == 3
+
+    response = client.get("/system/inbox/stats")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["fetch_backoff"]["short_circuited"] == 2
+
+
+def test_local_refusal_does_not_back_off_host(client: TestClient) -> None:
+    actor_id = HttpUrl("https://busy.example/actors/first")
+
+    async def fetch(container: Container) -> FetchBackoff:
+        activitypub = get_activitypub_service(container)
+        activitypub.http_client.governor.observe(
+            "busy.example", Response(status_code=429, headers={"Retry-After": "120"})
+        )
+
+        with pytest.raises(HostUnavailableError):
+            await activitypub.fetch_actor_from_remote(actor_id)
+
+        return activitypub.fetch_backoff
+
+    backoff = run_with_container(client, fetch)
+
+    assert not backoff.is_blocked(actor_id)
@@ -0,0 +1,82 @@
+import time
+
+from fastapi import status
+from fastapi.testclient import TestClient
+from httpx import Response
+from respx import MockRouter
+
+from capsule.activitypub.cache import ActorCache
+from capsule.activitypub.models import Actor, ActorAP
+from capsule.security.utils import RSAKeyPair
+from capsule.settings import CapsuleSettings
+from tests.utils import ap_actor_auth, ap_create_note, wait_inbox_worker
+
+
+def make_actor(actor: dict) -> Actor:
+    ap_data = ActorAP(**actor)
+
+    return Actor(id=ap_data.id, ap_data=ap_data, is_local=False)
+
+
+def test_actor_cache(
+    capsule_settings: CapsuleSettings, actor_and_keypair: tuple[dict, RSAKeyPair]
+) -> None:
+    capsule_settings.actor_cache_size = 1
+    cache = ActorCache(settings=capsule_settings)
+    actor = make_actor(actor_and_keypair[0])
+    main_actor_ap = ActorAP.make_main_actor(capsule_settings)
+    main_actor = Actor(id=main_actor_ap.id, ap_data=main_actor_ap, is_local=True)
+
+    assert cache.get(actor.id) is None
+
+    cache.put(actor, cache.generation)
+
+    assert cache.get(actor.id) is actor
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.put(main_actor, cache.generation)
+
+    assert cache.get(actor.id) is None
+    assert cache.size == 1
+
+    generation = cache.generation
+    cache.invalidate(main_actor.id)
+    cache.put(main_actor, generation)
+
+    assert cache.get(main_actor.id) is None
+
+    cache.put(main_actor, cache.generation)
+    cache.entries[str(main_actor.id)] = (time.monotonic(), main_actor)
+
+    assert cache.get(main_actor.id) is None
+    assert cache.size == 0
+
+
+def test_inbox_reads_actor_from_cache(
+    client: TestClient,
+    capsule_settings: CapsuleSettings,
+    actor_and_keypair: tuple[dict, RSAKeyPair],
+    respx_mock: MockRouter,
+) -> None:
+    instance_username = capsule_settings.username
+    instance_inbox = f"/actors/{instance_username}/inbox"
+    actor, keys = actor_and_keypair
+    actor_username = actor["preferredUsername"]
+
+    mocked_response = Response(status_code=200, json=actor)
+    route = respx_mock.get(actor["id"]).mock(return_value=mocked_response)
+
+    for _ in range(3):
+        payload = ap_create_note(actor_username, instance_username)
+        response = client.post(
+            instance_inbox, json=payload, auth=ap_actor_auth(actor, keys)
+        )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        wait_inbox_worker(client)
+
+    assert route.call_count == 1
+
+    response = client.get("/system/inbox/stats")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["actor_cache"]["size"] == 1
+    assert response.json()["actor_cache"]["hits"] >= 3
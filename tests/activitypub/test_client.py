@@ -0,0 +1,116 @@
+import asyncio
+
+import httpcore
+from fastapi.testclient import TestClient
+from httpx import BasicAuth, ConnectError, Request, Response
+from respx import MockRouter
+from svcs import Container
+
+from capsule.activitypub.client import (
+    CachingNetworkBackend,
+    FederationClient,
+    get_federation_client,
+)
+from capsule.settings import CapsuleSettings
+from tests.utils import run_with_container
+
+
+def test_federation_client_is_shared(client: TestClient) -> None:
+    async def get_client(container: Container) -> FederationClient:
+        return get_federation_client(container)
+
+    federation_client = run_with_container(client, get_client)
+
+    assert run_with_container(client, get_client) is federation_client
+    assert not federation_client.is_closed
+
+
+def test_dns_cache() -> None:
+    backend = CachingNetworkBackend(httpcore.AutoBackend(), ttl=60, size=1)
+
+    async def resolve() -> None:
+        assert await backend.resolve("127.0.0.1", 80) == ["127.0.0.1"]
+
+        addresses = await backend.resolve("localhost", 80)
+
+        assert await backend.resolve("localhost", 80) == addresses
+        assert (backend.hits, backend.misses) == (1, 1)
+
+        await backend.resolve("localhost", 8080)
+
+        assert list(backend.addresses) == [("localhost", 8080)]
+
+    asyncio.run(resolve())
+
+
+def test_max_connections_per_host(
+    capsule_settings: CapsuleSettings, respx_mock: MockRouter
+) -> None:
+    capsule_settings.http_client_max_connections_per_host = 2
+    active = 0
+    max_active = 0
+
+    async def handle(_request: Request) -> Response:
+        nonlocal active, max_active
+
+        active += 1
+        max_active = max(max_active, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+
+        return Response(status_code=200)
+
+    respx_mock.get(host="remote.example").mock(side_effect=handle)
+    respx_mock.get(host="other.example").mock(return_value=Response(status_code=200))
+
+    async def fetch() -> FederationClient:
+        async with FederationClient(settings=capsule_settings) as client:
+            responses = await asyncio.gather(
+                *(client.get(f"https://remote.example/{i}") for i in range(6)),
+                client.get("https://other.example/"),
+            )
+
+            assert all(response.status_code == 200 for response in responses)
+
+        return client
+
+    federation_client = asyncio.run(fetch())
+
+    assert max_active == 2
+    assert federation_client.federation_transport.host_slots.semaphores == {}
+
+
+def test_dereference_coalesces_concurrent_fetches(
+    capsule_settings: CapsuleSettings, respx_mock: MockRouter
+) -> None:
+    url = "https://remote.example/actors/popular"
+    auth = BasicAuth("user", "pass")
+
+    async def handle(_request: Request) -> Response:
+        await asyncio.sleep(0.01)
+
+        return Response(status_code=200, json={"id": url})
+
+    route = respx_mock.get(url).mock(side_effect=handle)
+
+    async def dereference() -> None:
+        async with FederationClient(settings=capsule_settings) as client:
+            responses = await asyncio.gather(
+                *(client.dereference(url, auth=auth) for _ in range(5))
+            )
+
+            assert all(response is responses[0] for response in responses)
+            assert client.coalesced == 4
+
+            route.mock(side_effect=ConnectError("unreachable"))
+            results = await asyncio.gather(
+                *(client.dereference(url, auth=auth) for _ in range(5)),
+                return_exceptions=True,
+            )
+
+            assert all(isinstance(result, ConnectError) for result in results)
+            assert client.flights == {}
+
+    asyncio.run(dereference())
+
+    assert route.call_count == 2
@@ -3,10 +3,19 @@ from fastapi.testclient import TestClient
 from httpx import Response
 from pydantic import HttpUrl
 from respx import MockRouter
+from svcs import Container
 
+from capsule.activitypub.models import InboxEntry, InboxEntryStatus
+from capsule.activitypub.service import get_activitypub_service
 from capsule.security.utils import RSAKeyPair, SignedRequestAuth
 from capsule.settings import CapsuleSettings
-from tests.utils import ap_create_note, ap_delete_actor
+from tests.utils import (
+    ap_actor_auth,
+    ap_create_note,
+    ap_delete_actor,
+    run_with_container,
+    wait_inbox_worker,
+)
 
 
 def test_delete_actor(
@@ -25,8 +34,11 @@ def test_delete_actor(
 
     payload = ap_create_note(actor_username, instance_username)
 
-    response = client.post(instance_inbox, json=payload)
+    response = client.post(
+        instance_inbox, json=payload, auth=ap_actor_auth(actor, keys)
+    )
     assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
 
     payload = ap_delete_actor(actor_username)
     auth = SignedRequestAuth(
@@ -36,3 +48,31 @@ def test_delete_actor(
 
     response = client.post(instance_inbox, json=payload, auth=auth)
     assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
+
+
+def test_delete_unknown_actor_is_ignored(
+    client: TestClient,
+    capsule_settings: CapsuleSettings,
+    actor_and_keypair: tuple[dict, RSAKeyPair],
+) -> None:
+    instance_inbox = f"/actors/{capsule_settings.username}/inbox"
+    actor, keys = actor_and_keypair
+
+    payload = ap_delete_actor(actor["preferredUsername"])
+
+    response = client.post(
+        instance_inbox, json=payload, auth=ap_actor_auth(actor, keys)
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
+
+    async def list_entries(container: Container) -> list[InboxEntry]:
+        activitypub = get_activitypub_service(container)
+
+        return [
+            entry
+            async for entry in activitypub.inbox.list_entries(list(InboxEntryStatus))
+        ]
+
+    assert run_with_container(client, list_entries) == []
@@ -0,0 +1,218 @@
+import asyncio
+from datetime import timedelta
+
+from fastapi import status
+from fastapi.testclient import TestClient
+from httpx import Request, Response
+from pydantic import HttpUrl
+from respx import MockRouter
+from svcs import Container
+
+from capsule.activitypub.client import get_federation_client
+from capsule.activitypub.delivery import DeliveryWorker, get_delivery_worker
+from capsule.activitypub.models import Delivery, DeliveryStatus
+from capsule.settings import CapsuleSettings
+from capsule.utils import utc_now
+from tests.utils import run_with_container, wait_inbox_worker
+
+INBOX = "https://social.example/users/alice/inbox"
+
+
+def enqueue(client: TestClient, activity: dict) -> int:
+    async def run(container: Container) -> int:
+        delivery = await get_delivery_worker(container).enqueue(
+            activity, HttpUrl(INBOX)
+        )
+
+        return delivery.id or 0
+
+    return run_with_container(client, run)
+
+
+def get_delivery(client: TestClient, delivery_id: int) -> Delivery | None:
+    async def run(container: Container) -> Delivery | None:
+        worker = get_delivery_worker(container)
+
+        return await worker.deliveries.get_delivery(delivery_id)
+
+    return run_with_container(client, run)
+
+
+def test_delivery_retries_then_dead_letters(
+    client: TestClient, capsule_settings: CapsuleSettings, respx_mock: MockRouter
+) -> None:
+    capsule_settings.delivery_max_attempts = 2
+    capsule_settings.delivery_retry_base = 0
+
+    route = respx_mock.post(INBOX).mock(return_value=Response(status_code=500))
+
+    delivery_id = enqueue(client, {"type": "Accept"})
+    wait_inbox_worker(client)
+
+    delivery = get_delivery(client, delivery_id)
+
+    assert route.call_count == 2
+    assert delivery is not None
+    assert delivery.status == DeliveryStatus.dead
+    assert delivery.attempts == 2
+    assert delivery.last_error == "HTTP 500"
+
+    response = client.get("/system/inbox/stats")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["deliveries"] == {
+        "in_flight": 0,
+        "delivered": 0,
+        "retried": 1,
+        "deferred": 0,
+        "dead": 1,
+    }
+
+
+def test_delivery_permanent_failure(client: TestClient, respx_mock: MockRouter) -> None:
+    route = respx_mock.post(INBOX).mock(return_value=Response(status_code=404))
+
+    delivery_id = enqueue(client, {"type": "Accept"})
+    wait_inbox_worker(client)
+
+    delivery = get_delivery(client, delivery_id)
+
+    assert route.call_count == 1
+    assert delivery is not None
+    assert delivery.status == DeliveryStatus.dead
+    assert delivery.attempts == 1
+
+
+def test_delivery_max_per_host(
+    client: TestClient, capsule_settings: CapsuleSettings, respx_mock: MockRouter
+) -> None:
+    capsule_settings.delivery_max_per_host = 1
+    active = 0
+    peak = 0
+
+    async def handle(_request: Request) -> Response:
+        nonlocal active, peak
+
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+
+        return Response(status_code=202)
+
+    route = respx_mock.post(INBOX).mock(side_effect=handle)
+
+    async def run(container: Container) -> list[Delivery | None]:
+        main_worker = get_delivery_worker(container)
+        worker = DeliveryWorker(
+            settings=capsule_settings,
+            delivery_repository=main_worker.deliveries,
+            federation_client=get_federation_client(container),
+        )
+        later = utc_now() + timedelta(hours=1)
+        deliveries = [
+            await worker.deliveries.create_delivery(
+                Delivery(
+                    activity={"type": "Accept"},
+                    inbox=INBOX,
+                    host="social.example",
+                    next_attempt_at=later,
+                )
+            )
+            for _ in range(3)
+        ]
+
+        await asyncio.gather(*(worker.deliver(delivery) for delivery in deliveries))
+
+        return [
+            await worker.deliveries.get_delivery(delivery.id or 0)
+            for delivery in deliveries
+        ]
+
+    deliveries = run_with_container(client, run)
+
+    assert route.call_count == 3
+    assert peak == 1
+    assert all(
+        delivery is not None and delivery.status == DeliveryStatus.delivered
+        for delivery in deliveries
+    )
+
+
+def test_delivery_worker_releases_leases_on_stop(
+    client: TestClient, capsule_settings: CapsuleSettings, respx_mock: MockRouter
+) -> None:
+    async def handle(_request: Request) -> Response:
+        await asyncio.sleep(60)
+
+        return Response(status_code=202)
+
+    respx_mock.post(INBOX).mock(side_effect=handle)
+
+    async def run(container: Container) -> Delivery | None:
+        main_worker = get_delivery_worker(container)
+        worker = DeliveryWorker(
+            settings=capsule_settings,
+            delivery_repository=main_worker.deliveries,
+            federation_client=get_federation_client(container),
+        )
+        later = utc_now() + timedelta(hours=1)
+        delivery = await worker.deliveries.create_delivery(
+            Delivery(
+                activity={"type": "Accept"},
+                inbox=INBOX,
+                host="social.example",
+                next_attempt_at=later,
+            )
+        )
+        [leased] = await worker.deliveries.lease_due_deliveries(
+            later, 1, later + timedelta(minutes=5), per_host=1
+        )
+
+        task = asyncio.create_task(worker.deliver(leased))
+        worker.in_flight[task] = delivery.id or 0
+        await asyncio.sleep(0.01)
+        await worker.stop()
+
+        return await worker.deliveries.get_delivery(delivery.id or 0)
+
+    delivery = run_with_container(client, run)
+
+    assert delivery is not None
+    assert delivery.status == DeliveryStatus.pending
+    assert delivery.attempts == 0
+    assert delivery.leased_until is None
+
+
+def test_delivery_lease_respects_host_slots(client: TestClient) -> None:
+    async def run(container: Container) -> tuple[list[str], int]:
+        worker = get_delivery_worker(container)
+        later = utc_now() + timedelta(hours=1)
+
+        for host in ["busy.example"] * 4 + ["quiet.example"]:
+            await worker.deliveries.create_delivery(
+                Delivery(
+                    activity={"type": "Accept"},
+                    inbox=f"https://{host}/inbox",
+                    host=host,
+                    next_attempt_at=later,
+                )
+            )
+
+        leased = await worker.deliveries.lease_due_deliveries(
+            later, 10, later + timedelta(minutes=5), per_host=2
+        )
+        released = await worker.deliveries.release_expired_leases(
+            later + timedelta(minutes=10),
+            [
+                delivery.id or 0
+                for delivery in leased
+                if delivery.host == "busy.example"
+            ],
+        )
+
+        return sorted(delivery.host for delivery in leased), released
+
+    hosts, released = run_with_container(client, run)
+
+    assert hosts == ["busy.example", "busy.example", "quiet.example"]
+    assert released == 1
@@ -0,0 +1,81 @@
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from svcs import Container
+
+from capsule.activitypub.documents import DocumentCache, get_document_cache
+from capsule.activitypub.models import ActorAP
+from capsule.activitypub.responses import ActivityJSONResponse
+from capsule.settings import CapsuleSettings
+from tests.utils import run_with_container
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/actors/testuser",
+        "/.well-known/webfinger?resource=acct:testuser@localhost",
+        "/.well-known/nodeinfo",
+        "/.well-known/host-meta",
+        "/nodeinfo/2.0",
+    ],
+)
+def test_document_etag(client: TestClient, url: str) -> None:
+    response = client.get(url, headers={"Accept-Encoding": "identity"})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Cache-Control"] == "public, max-age=300"
+    assert "Content-Encoding" not in response.headers
+
+    etag = response.headers["ETag"]
+    response = client.get(
+        url, headers={"Accept-Encoding": "identity", "If-None-Match": etag}
+    )
+
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+
+def test_actor_document_is_cached_and_compressed(
+    client: TestClient, capsule_settings: CapsuleSettings
+) -> None:
+    url = f"/actors/{capsule_settings.username}"
+
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+    compressed = client.get(url, headers={"Accept-Encoding": "gzip"})
+
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert compressed.headers["Vary"] == "Accept-Encoding"
+    assert compressed.headers["ETag"] != plain.headers["ETag"]
+    assert compressed.json() == plain.json()
+
+    capsule_settings.name = "Renamed"
+    renamed = client.get(url, headers={"Accept-Encoding": "identity"})
+
+    assert renamed.json()["name"] == "Renamed"
+    assert renamed.headers["ETag"] != plain.headers["ETag"]
+
+    async def get_cache(container: Container) -> DocumentCache:
+        return get_document_cache(container)
+
+    documents = run_with_container(client, get_cache)
+
+    assert (documents.builds, documents.hits) == (2, 1)
+
+
+def test_activity_json_response_renders_models(
+    capsule_settings: CapsuleSettings,
+) -> None:
+    actor = ActorAP.make_main_actor(capsule_settings)
+    actor.summary = None  # type: ignore[assignment]
+
+    response = ActivityJSONResponse(actor)
+
+    assert response.media_type == "application/activity+json"
+    assert (
+        response.body
+        == actor.model_dump_json(by_alias=True, exclude_none=True).encode()
+    )
+    assert b'"preferredUsername"' in response.body
+    assert b'"summary"' not in response.body
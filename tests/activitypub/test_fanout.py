@@ -0,0 +1,98 @@
+from fastapi import status
+from fastapi.testclient import TestClient
+from httpx import Response
+from respx import MockRouter
+from svcs import Container
+
+from capsule.activitypub.models import DeliveryTarget
+from capsule.activitypub.service import get_activitypub_service
+from capsule.security.utils import RSAKeyPair
+from capsule.settings import CapsuleSettings
+from tests.utils import (
+    ap_actor,
+    ap_actor_auth,
+    ap_follow,
+    ap_unfollow,
+    run_with_container,
+    wait_inbox_worker,
+)
+
+SHARED_INBOX = "https://social.example/inbox"
+
+
+def list_targets(client: TestClient) -> list[DeliveryTarget]:
+    async def run(container: Container) -> list[DeliveryTarget]:
+        return await get_activitypub_service(container).list_follower_targets()
+
+    return run_with_container(client, run)
+
+
+def test_fanout_groups_followers_by_shared_inbox(
+    client: TestClient,
+    capsule_settings: CapsuleSettings,
+    rsa_keypair: RSAKeyPair,
+    respx_mock: MockRouter,
+) -> None:
+    instance_username = capsule_settings.username
+    instance_inbox = f"/actors/{instance_username}/inbox"
+    actors = [ap_actor(f"user{i}", rsa_keypair.public_key) for i in range(3)] + [
+        ap_actor("loner", rsa_keypair.public_key, "other.example")
+    ]
+    follows = []
+
+    for actor in actors[:3]:
+        actor["endpoints"] = {"sharedInbox": SHARED_INBOX}
+
+    for actor in actors:
+        respx_mock.get(actor["id"]).mock(
+            return_value=Response(status_code=200, json=actor)
+        )
+        respx_mock.post(actor["inbox"]).mock(return_value=Response(status_code=202))
+
+        domain = actor["id"].split("/")[2]
+        follow = ap_follow(
+            actor["preferredUsername"], instance_username, from_domain=domain
+        )
+        follows.append(follow)
+
+        response = client.post(
+            instance_inbox, json=follow, auth=ap_actor_auth(actor, rsa_keypair)
+        )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        wait_inbox_worker(client)
+
+    targets = list_targets(client)
+
+    assert [(str(target.inbox), target.followers) for target in targets] == [
+        (actors[3]["inbox"], 1),
+        (SHARED_INBOX, 3),
+    ]
+
+    shared_route = respx_mock.post(SHARED_INBOX).mock(
+        return_value=Response(status_code=202)
+    )
+
+    async def fan_out(container: Container) -> int:
+        return await get_activitypub_service(container).deliver_to_followers(
+            {"type": "Create"}
+        )
+
+    assert run_with_container(client, fan_out) == 2
+    wait_inbox_worker(client)
+
+    assert shared_route.call_count == 1
+
+    response = client.post(
+        instance_inbox,
+        json=ap_unfollow("user0", follows[0]),
+        auth=ap_actor_auth(actors[0], rsa_keypair),
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
+
+    targets = list_targets(client)
+
+    assert [(str(target.inbox), target.followers) for target in targets] == [
+        (actors[3]["inbox"], 1),
+        (SHARED_INBOX, 2),
+    ]
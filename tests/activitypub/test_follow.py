@@ -4,9 +4,15 @@ from httpx import Response
 from pydantic import HttpUrl
 from respx import MockRouter
 
-from capsule.security.utils import RSAKeyPair, SignedRequestAuth
+from capsule.security.utils import (
+    HttpSignatureInfo,
+    RSAKeyPair,
+    SignedRequestAuth,
+    generate_ed25519_keypair,
+    public_key_pem_to_multibase,
+)
 from capsule.settings import CapsuleSettings
-from tests.utils import ap_follow, ap_unfollow
+from tests.utils import ap_actor_auth, ap_follow, ap_unfollow, wait_inbox_worker
 
 
 def test_follow_and_unfollow(
@@ -27,8 +33,9 @@ def test_follow_and_unfollow(
 
     follow = ap_follow(actor_username, instance_username)
 
-    response = client.post(instance_inbox, json=follow)
+    response = client.post(instance_inbox, json=follow, auth=ap_actor_auth(actor, keys))
     assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
 
     unfollow = ap_unfollow(actor_username, follow)
     auth = SignedRequestAuth(
@@ -38,6 +45,7 @@ def test_follow_and_unfollow(
 
     response = client.post(instance_inbox, json=unfollow, auth=auth)
     assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
 
 
 def test_accept_follow_failed(
@@ -48,7 +56,7 @@ def test_accept_follow_failed(
 ) -> None:
     instance_username = capsule_settings.username
     instance_inbox = f"/actors/{instance_username}/inbox"
-    actor, _ = actor_and_keypair
+    actor, keys = actor_and_keypair
     actor_username = actor["preferredUsername"]
 
     mocked_actor_response = Response(status_code=200, json=actor)
@@ -58,5 +66,55 @@ def test_accept_follow_failed(
 
     payload = ap_follow(actor_username, instance_username)
 
-    response = client.post(instance_inbox, json=payload)
+    response = client.post(
+        instance_inbox, json=payload, auth=ap_actor_auth(actor, keys)
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
+
+
+def test_accept_follow_signed_with_ed25519(
+    client: TestClient,
+    capsule_settings: CapsuleSettings,
+    actor_and_keypair: tuple[dict, RSAKeyPair],
+    respx_mock: MockRouter,
+) -> None:
+    instance_username = capsule_settings.username
+    instance_inbox = f"/actors/{instance_username}/inbox"
+    actor, keys = actor_and_keypair
+    actor_username = actor["preferredUsername"]
+    instance_keys = generate_ed25519_keypair()
+    capsule_settings.ed25519_private_key = instance_keys.private_key
+    capsule_settings.ed25519_public_key = instance_keys.public_key
+    actor["assertionMethod"] = [
+        {
+            "id": f"{actor['id']}#ed25519-key",
+            "type": "Multikey",
+            "controller": actor["id"],
+            "publicKeyMultibase": public_key_pem_to_multibase(
+                generate_ed25519_keypair().public_key
+            ),
+        }
+    ]
+
+    mocked_actor_response = Response(status_code=200, json=actor)
+    respx_mock.get(actor["id"]).mock(return_value=mocked_actor_response)
+    mocked_inbox_response = Response(status_code=202)
+    inbox_route = respx_mock.post(actor["inbox"]).mock(
+        return_value=mocked_inbox_response
+    )
+
+    response = client.post(
+        instance_inbox,
+        json=ap_follow(actor_username, instance_username),
+        auth=ap_actor_auth(actor, keys),
+    )
     assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
+
+    signature_info = HttpSignatureInfo.from_compiled_signature(
+        inbox_route.calls.last.request.headers["Signature"]
+    )
+
+    assert signature_info.keyid == capsule_settings.ed25519_key_id
+    assert signature_info.algorithm == "hs2019"
@@ -0,0 +1,97 @@
+import asyncio
+from datetime import timedelta
+from email.utils import format_datetime
+
+import pytest
+from httpx import Response
+from respx import MockRouter
+
+from capsule.activitypub.client import FederationClient
+from capsule.activitypub.exceptions import HostUnavailableError
+from capsule.activitypub.governor import parse_rate_limit_reset, parse_retry_after
+from capsule.settings import CapsuleSettings
+from capsule.utils import utc_now
+
+
+def test_parse_rate_limit_headers() -> None:
+    in_a_minute = utc_now() + timedelta(minutes=1)
+    naive = in_a_minute.replace(tzinfo=None)
+
+    assert parse_retry_after("120") == 120
+    assert 58 < (parse_retry_after(format_datetime(in_a_minute, usegmt=True)) or 0)
+    assert 58 < (parse_retry_after(format_datetime(naive)) or 0) <= 60
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+    assert parse_rate_limit_reset("30") == 30
+    assert 58 < (parse_rate_limit_reset(in_a_minute.isoformat()) or 0) <= 60
+    assert 58 < (parse_rate_limit_reset(str(in_a_minute.timestamp())) or 0) <= 60
+    assert 58 < (parse_rate_limit_reset(naive.isoformat()) or 0) <= 60
+    assert parse_rate_limit_reset("later") is None
+
+
+def test_fetch_governor_honors_remote_limits(
+    capsule_settings: CapsuleSettings, respx_mock: MockRouter
+) -> None:
+    capsule_settings.fetch_max_wait = 1
+    capsule_settings.fetch_governor_hosts = 2
+    reset = (utc_now() + timedelta(seconds=30)).isoformat()
+
+    busy = respx_mock.get("https://busy.example/actor").mock(
+        return_value=Response(status_code=429, headers={"Retry-After": "120"})
+    )
+    drained = respx_mock.get("https://drained.example/actor").mock(
+        return_value=Response(
+            status_code=200,
+            headers={"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": reset},
+        )
+    )
+
+    async def fetch() -> None:
+        async with FederationClient(settings=capsule_settings) as client:
+            governor = client.governor
+
+            response = await client.get("https://busy.example/actor")
+
+            assert response.status_code == 429
+            assert 119 < governor.retry_after("busy.example") <= 120
+
+            with pytest.raises(HostUnavailableError):
+                await client.get("https://busy.example/actor")
+
+            await client.get("https://drained.example/actor")
+
+            assert 28 < governor.retry_after("drained.example") <= 30
+            assert governor.size == 2
+
+    asyncio.run(fetch())
+
+    assert busy.call_count == 1
+    assert drained.call_count == 1
+
+
+def test_fetch_governor_token_bucket(
+    capsule_settings: CapsuleSettings, respx_mock: MockRouter
+) -> None:
+    capsule_settings.fetch_rate_limit = 50
+    capsule_settings.fetch_rate_limit_burst = 1
+
+    route = respx_mock.get(host="remote.example").mock(
+        return_value=Response(status_code=200)
+    )
+    respx_mock.post(host="remote.example").mock(return_value=Response(status_code=202))
+
+    async def fetch() -> FederationClient:
+        async with FederationClient(settings=capsule_settings) as client:
+            await asyncio.gather(
+                *(client.get(f"https://remote.example/{i}") for i in range(3))
+            )
+            await client.post("https://remote.example/inbox")
+
+        return client
+
+    federation_client = asyncio.run(fetch())
+
+    assert route.call_count == 3
+    assert federation_client.governor.throttled == 2
+    assert federation_client.governor.slots.semaphores == {}
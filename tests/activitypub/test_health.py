@@ -0,0 +1,120 @@
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from httpx import Response
+from pydantic import HttpUrl
+from respx import MockRouter
+from svcs import Container
+from typer.testing import CliRunner
+from wheke_sqlmodel import get_sqlmodel_service
+
+from capsule.__main__ import build_cli
+from capsule.activitypub.client import get_federation_client
+from capsule.activitypub.delivery import get_delivery_worker
+from capsule.activitypub.exceptions import HostUnavailableError
+from capsule.activitypub.health import HostHealthTracker, get_host_health_tracker
+from capsule.activitypub.models import (
+    CircuitState,
+    Delivery,
+    DeliveryStatus,
+    HostHealth,
+)
+from capsule.activitypub.repositories import HostHealthRepository
+from capsule.settings import CapsuleSettings
+from capsule.utils import utc_now
+from tests.utils import run_with_container, wait_inbox_worker
+
+INBOX = "https://dead.example/users/alice/inbox"
+
+
+def test_host_circuit_breaker(
+    client: TestClient, capsule_settings: CapsuleSettings
+) -> None:
+    capsule_settings.host_circuit_failure_threshold = 2
+    capsule_settings.host_circuit_open_seconds = 60
+
+    async def run(container: Container) -> list[HostHealth]:
+        tracker = HostHealthTracker(
+            settings=capsule_settings,
+            host_health_repository=HostHealthRepository(
+                get_sqlmodel_service(container)
+            ),
+        )
+
+        tracker.record("dead.example", 0.5, ok=False)
+
+        assert tracker.allow("dead.example")
+
+        tracker.record("dead.example", 1.5, ok=False)
+        circuit = tracker.circuits["dead.example"]
+
+        assert circuit.state == CircuitState.open
+        assert not tracker.allow("dead.example")
+        assert tracker.retry_after("dead.example") > 59
+
+        circuit.health.opened_until = utc_now()
+
+        assert tracker.allow("dead.example")
+        assert circuit.state == CircuitState.half_open
+        assert not tracker.allow("dead.example")
+
+        tracker.record("dead.example", 0.1, ok=True)
+
+        assert circuit.state == CircuitState.closed
+        assert tracker.short_circuited == 2
+
+        await tracker.flush()
+
+        return await tracker.repository.list_hosts()
+
+    hosts = run_with_container(client, run)
+
+    assert [
+        (host.host, host.state, host.requests, host.failures) for host in hosts
+    ] == [("dead.example", CircuitState.closed, 3, 2)]
+    assert hosts[0].latency_p50 == 500
+    assert hosts[0].last_success_at is not None
+
+
+def test_open_circuit_defers_deliveries(
+    client: TestClient, capsule_settings: CapsuleSettings, respx_mock: MockRouter
+) -> None:
+    capsule_settings.host_circuit_failure_threshold = 2
+    capsule_settings.delivery_retry_base = 0
+
+    route = respx_mock.post(INBOX).mock(return_value=Response(status_code=503))
+
+    async def enqueue(container: Container) -> Delivery:
+        return await get_delivery_worker(container).enqueue(
+            {"type": "Accept"}, HttpUrl(INBOX)
+        )
+
+    delivery_id = run_with_container(client, enqueue).id
+    wait_inbox_worker(client)
+
+    async def inspect(container: Container) -> Delivery | None:
+        with pytest.raises(HostUnavailableError):
+            await get_federation_client(container).get(INBOX)
+
+        await get_host_health_tracker(container).flush()
+
+        return await get_delivery_worker(container).deliveries.get_delivery(delivery_id)
+
+    delivery = run_with_container(client, inspect)
+
+    assert route.call_count == 2
+    assert delivery is not None
+    assert delivery.status == DeliveryStatus.pending
+    assert delivery.attempts == 2
+    assert delivery.next_attempt_at > utc_now()
+
+    response = client.get("/system/inbox/stats")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["host_circuits"] == {"open": 1, "short_circuited": 1}
+    assert response.json()["deliveries"]["deferred"] == 1
+
+    result = CliRunner().invoke(
+        build_cli(capsule_settings), ["federation", "hosts", "--state", "open"]
+    )
+    assert result.exit_code == 0
+    assert "dead.example" in result.stdout
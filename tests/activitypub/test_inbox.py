@@ -1,15 +1,37 @@
+import asyncio
+import json
+import time
 from datetime import UTC, datetime, timedelta
 from email.utils import format_datetime
+from typing import cast
 
+import pytest
 from fastapi import status
 from fastapi.testclient import TestClient
 from httpx import Response
 from pydantic import HttpUrl
 from respx import MockRouter
-
-from capsule.security.utils import RSAKeyPair, SignedRequestAuth
-from capsule.settings import CapsuleSettings
-from tests.utils import ap_create_note
+from svcs import Container
+
+from capsule.activitypub.limiter import HostRateLimiter, get_host_rate_limiter
+from capsule.activitypub.models import InboxEntry, InboxEntryStatus, RawActivity
+from capsule.activitypub.worker import InboxWorker, get_inbox_worker
+from capsule.activitypub.writer import get_inbox_writer
+from capsule.security.utils import (
+    RSAKeyPair,
+    SignedRequestAuth,
+    generate_ed25519_keypair,
+    generate_rsa_keypair,
+    public_key_pem_to_multibase,
+)
+from capsule.settings import CapsuleSettings, RateLimitBackend
+from capsule.utils import utc_now
+from tests.utils import (
+    ap_actor_auth,
+    ap_create_note,
+    run_with_container,
+    wait_inbox_worker,
+)
 
 
 def test_inbox(
@@ -30,8 +52,11 @@ def test_inbox(
         actor_username, instance_username, "Hello for the first time :)"
     )
 
-    response = client.post(instance_inbox, json=payload)
+    response = client.post(
+        instance_inbox, json=payload, auth=ap_actor_auth(actor, keys)
+    )
     assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
 
     payload = ap_create_note(
         actor_username, instance_username, "Hello for the second time :)"
@@ -43,6 +68,7 @@ def test_inbox(
 
     response = client.post(instance_inbox, json=payload, auth=auth)
     assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
 
 
 def test_inbox_bad_signature(
@@ -63,8 +89,11 @@ def test_inbox_bad_signature(
         actor_username, instance_username, "Hello for the first time :)"
     )
 
-    response = client.post(instance_inbox, json=payload)
+    response = client.post(
+        instance_inbox, json=payload, auth=ap_actor_auth(actor, keys)
+    )
     assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
 
     payload = ap_create_note(actor_username, instance_username, "Bad hello!")
 
@@ -157,7 +186,7 @@ def test_inbox_failed_to_fetch_actor(
 ) -> None:
     instance_username = capsule_settings.username
     instance_inbox = f"/actors/{instance_username}/inbox"
-    actor, _ = actor_and_keypair
+    actor, keys = actor_and_keypair
     actor_username = actor["preferredUsername"]
 
     mocked_response = Response(status_code=500)
@@ -165,5 +194,529 @@ def test_inbox_failed_to_fetch_actor(
 
     payload = ap_create_note(actor_username, instance_username)
 
-    response = client.post(instance_inbox, json=payload)
+    response = client.post(
+        instance_inbox, json=payload, auth=ap_actor_auth(actor, keys)
+    )
     assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
+
+
+def test_inbox_worker_recovers_expired_leases(
+    client: TestClient,
+    capsule_settings: CapsuleSettings,
+    actor_and_keypair: tuple[dict, RSAKeyPair],
+    respx_mock: MockRouter,
+) -> None:
+    instance_username = capsule_settings.username
+    capsule_settings.inbox_recovery_grace = 0
+    actor, _ = actor_and_keypair
+    actor_username = actor["preferredUsername"]
+
+    mocked_response = Response(status_code=200, json=actor)
+    respx_mock.get(actor["id"]).mock(return_value=mocked_response)
+
+    payload = ap_create_note(actor_username, instance_username)
+
+    async def recover(container: Container) -> list[InboxEntry]:
+        worker = get_inbox_worker(container)
+
+        await worker.activitypub.create_inbox_entry(
+            InboxEntry(
+                activity=RawActivity.from_bytes(json.dumps(payload).encode()),
+                status=InboxEntryStatus.processing,
+                leased_until=utc_now() - timedelta(seconds=1),
+            )
+        )
+        await worker.recover()
+        await worker.join()
+
+        return [
+            entry
+            async for entry in worker.activitypub.inbox.list_entries(
+                InboxEntryStatus.not_implemented
+            )
+        ]
+
+    entries = run_with_container(client, recover)
+
+    assert len(entries) == 1
+    assert entries[0].leased_until is None
+
+
+def test_inbox_worker_recovery_skips_recent_entries(
+    client: TestClient, capsule_settings: CapsuleSettings
+) -> None:
+    payload = ap_create_note("remoteactor", capsule_settings.username)
+
+    async def recover(container: Container) -> set[int]:
+        activitypub = get_inbox_worker(container).activitypub
+        worker = InboxWorker(settings=capsule_settings, activitypub_service=activitypub)
+
+        await activitypub.inbox.create_entry(
+            InboxEntry(activity=RawActivity.from_bytes(json.dumps(payload).encode()))
+        )
+        await worker.recover()
+
+        return worker.queued_ids
+
+    assert run_with_container(client, recover) == set()
+
+
+def test_inbox_worker_releases_leases_on_stop(
+    client: TestClient,
+    capsule_settings: CapsuleSettings,
+    actor_and_keypair: tuple[dict, RSAKeyPair],
+) -> None:
+    actor, _ = actor_and_keypair
+    payload = ap_create_note(actor["preferredUsername"], capsule_settings.username)
+
+    async def stop(container: Container) -> list[InboxEntry]:
+        activitypub = get_inbox_worker(container).activitypub
+        worker = InboxWorker(settings=capsule_settings, activitypub_service=activitypub)
+
+        entry = await activitypub.inbox.create_entry(
+            InboxEntry(activity=RawActivity.from_bytes(json.dumps(payload).encode()))
+        )
+
+        assert await activitypub.lease_inbox_entry(entry)
+
+        worker.leased_ids.add(cast(int, entry.id))
+        await worker.stop()
+
+        return [
+            entry
+            async for entry in activitypub.inbox.list_entries(InboxEntryStatus.created)
+        ]
+
+    entries = run_with_container(client, stop)
+
+    assert len(entries) == 1
+    assert entries[0].leased_until is None
+
+
+def test_inbox_worker_lane_survives_processing_errors(
+    client: TestClient,
+    capsule_settings: CapsuleSettings,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    payload = ap_create_note("remoteactor", capsule_settings.username)
+
+    async def lease(_entry: InboxEntry) -> bool:
+        msg = "database is locked"
+        raise RuntimeError(msg)
+
+    async def run(container: Container) -> bool:
+        activitypub = get_inbox_worker(container).activitypub
+        worker = InboxWorker(settings=capsule_settings, activitypub_service=activitypub)
+        monkeypatch.setattr(activitypub, "lease_inbox_entry", lease)
+
+        lane = worker.lanes[0]
+        task = asyncio.create_task(worker._run(lane))
+
+        for entry_id in (1, 2):
+            lane.queue.put_nowait(
+                (
+                    InboxEntry(
+                        id=entry_id,
+                        activity=RawActivity.from_bytes(json.dumps(payload).encode()),
+                    ),
+                    time.monotonic(),
+                )
+            )
+
+        await lane.queue.join()
+        alive = not task.done()
+        task.cancel()
+
+        return alive
+
+    assert run_with_container(client, run)
+
+
+def test_inbox_writer_batches_entries(
+    client: TestClient, capsule_settings: CapsuleSettings
+) -> None:
+    payloads = [
+        ap_create_note("remoteactor", capsule_settings.username) for _ in range(10)
+    ]
+
+    async def write(container: Container) -> list[InboxEntry | None]:
+        writer = get_inbox_writer(container)
+
+        return await asyncio.gather(
+            *(
+                writer.write(
+                    InboxEntry(activity=RawActivity.from_bytes(json.dumps(p).encode()))
+                )
+                for p in payloads
+            )
+        )
+
+    entries = run_with_container(client, write)
+
+    assert all(entry is not None and entry.id is not None for entry in entries)
+    assert len({entry.id for entry in entries}) == len(payloads)
+
+
+def test_inbox_writer_matches_raw_activity_ids(
+    client: TestClient, capsule_settings: CapsuleSettings
+) -> None:
+    payload = ap_create_note("remoteactor", capsule_settings.username)
+    payload["id"] = "https://Remote.Example"
+
+    async def write(container: Container) -> InboxEntry | None:
+        writer = get_inbox_writer(container)
+
+        return await writer.write(
+            InboxEntry(activity=RawActivity.from_bytes(json.dumps(payload).encode()))
+        )
+
+    entry = run_with_container(client, write)
+
+    assert entry is not None
+    assert entry.activity_id == "https://Remote.Example"
+    assert str(entry.activity.id) == "https://remote.example/"
+
+
+def test_inbox_duplicate_activity(
+    client: TestClient,
+    capsule_settings: CapsuleSettings,
+    actor_and_keypair: tuple[dict, RSAKeyPair],
+    respx_mock: MockRouter,
+) -> None:
+    instance_username = capsule_settings.username
+    instance_inbox = f"/actors/{instance_username}/inbox"
+    actor, keys = actor_and_keypair
+    actor_username = actor["preferredUsername"]
+
+    mocked_response = Response(status_code=200, json=actor)
+    route = respx_mock.get(actor["id"]).mock(return_value=mocked_response)
+
+    payload = ap_create_note(actor_username, instance_username)
+
+    for _ in range(3):
+        response = client.post(
+            instance_inbox, json=payload, auth=ap_actor_auth(actor, keys)
+        )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+
+    wait_inbox_worker(client)
+
+    assert route.call_count == 1
+
+    response = client.get("/system/inbox/stats")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["duplicates"] == 2
+
+
+def test_inbox_stores_raw_payload(
+    client: TestClient,
+    capsule_settings: CapsuleSettings,
+    actor_and_keypair: tuple[dict, RSAKeyPair],
+    respx_mock: MockRouter,
+) -> None:
+    instance_username = capsule_settings.username
+    actor, keys = actor_and_keypair
+    actor_username = actor["preferredUsername"]
+
+    mocked_response = Response(status_code=200, json=actor)
+    respx_mock.get(actor["id"]).mock(return_value=mocked_response)
+
+    payload = ap_create_note(actor_username, instance_username)
+    content = json.dumps(payload, indent=4).encode()
+
+    response = client.post(
+        f"/actors/{instance_username}/inbox",
+        content=content,
+        headers={"Content-Type": "application/activity+json"},
+        auth=ap_actor_auth(actor, keys),
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
+
+    async def list_entries(container: Container) -> list[InboxEntry]:
+        activitypub = get_inbox_worker(container).activitypub
+
+        return [
+            entry
+            async for entry in activitypub.inbox.list_entries(
+                InboxEntryStatus.not_implemented, activity_type="Create"
+            )
+        ]
+
+    entries = run_with_container(client, list_entries)
+
+    assert len(entries) == 1
+    assert entries[0].activity.raw == content
+    assert entries[0].activity.object_type == "Note"
+    assert entries[0].activity.parsed.object == payload["object"]
+
+
+def test_inbox_sheds_load_when_backlog_is_full(
+    client: TestClient, capsule_settings: CapsuleSettings
+) -> None:
+    instance_username = capsule_settings.username
+    capsule_settings.inbox_high_water = 0
+    capsule_settings.inbox_follower_high_water = 0
+
+    payload = ap_create_note("remoteactor", instance_username)
+
+    response = client.post(f"/actors/{instance_username}/inbox", json=payload)
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert int(response.headers["Retry-After"]) >= 1
+
+    response = client.get("/system/inbox/stats")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["queued"] == 0
+    assert response.json()["rejected"] == 1
+
+
+@pytest.mark.parametrize("backend", list(RateLimitBackend))
+def test_inbox_rate_limits_remote_host(
+    client: TestClient,
+    capsule_settings: CapsuleSettings,
+    actor_and_keypair: tuple[dict, RSAKeyPair],
+    respx_mock: MockRouter,
+    backend: RateLimitBackend,
+) -> None:
+    instance_username = capsule_settings.username
+    instance_inbox = f"/actors/{instance_username}/inbox"
+    actor, keys = actor_and_keypair
+    actor_username = actor["preferredUsername"]
+    capsule_settings.inbox_rate_limit = 0.01
+    capsule_settings.inbox_rate_limit_burst = 1
+    capsule_settings.inbox_rate_limit_backend = backend
+
+    mocked_response = Response(status_code=200, json=actor)
+    respx_mock.get(actor["id"]).mock(return_value=mocked_response)
+
+    payload = ap_create_note(actor_username, instance_username)
+
+    response = client.post(
+        instance_inbox, json=payload, auth=ap_actor_auth(actor, keys)
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
+
+    payload = ap_create_note(actor_username, instance_username)
+
+    response = client.post(
+        instance_inbox, json=payload, auth=ap_actor_auth(actor, keys)
+    )
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert int(response.headers["Retry-After"]) >= 1
+
+    response = client.post(
+        instance_inbox,
+        json=ap_create_note(actor_username, instance_username),
+        headers={"Signature": 'keyId="https://other.example/key",signature="..."'},
+    )
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+    response = client.get("/system/inbox/stats")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["rate_limited"] == 2
+
+
+def test_database_rate_limit_prunes_refilled_hosts(
+    client: TestClient, capsule_settings: CapsuleSettings
+) -> None:
+    capsule_settings.inbox_rate_limit = 10
+    capsule_settings.inbox_rate_limit_burst = 1
+    capsule_settings.inbox_rate_limit_backend = RateLimitBackend.database
+
+    async def run(container: Container) -> tuple[int, int]:
+        limiter = HostRateLimiter(
+            settings=capsule_settings,
+            rate_limit_repository=get_host_rate_limiter(container).repository,
+        )
+
+        await limiter.acquire("first.example")
+        limiter.pruned_at = 0
+        await asyncio.sleep(0.2)
+        await limiter.acquire("second.example")
+
+        return (
+            await limiter.repository.delete_refilled(time.time()),
+            await limiter.acquire("first.example"),
+        )
+
+    remaining, retry_after = run_with_container(client, run)
+
+    assert remaining == 1
+    assert retry_after == 0
+
+
+def test_inbox_worker_shards_entries_by_actor(
+    client: TestClient, capsule_settings: CapsuleSettings
+) -> None:
+    instance_username = capsule_settings.username
+
+    def make_entry(actor_username: str) -> InboxEntry:
+        payload = ap_create_note(actor_username, instance_username)
+
+        return InboxEntry(activity=RawActivity.from_bytes(json.dumps(payload).encode()))
+
+    async def get_lanes(container: Container) -> list[int]:
+        worker = get_inbox_worker(container)
+        entries = [make_entry("remoteactor"), make_entry("remoteactor")]
+        entries += [make_entry(f"remoteactor{i}") for i in range(20)]
+
+        return [worker.lanes.index(worker.get_lane(entry)) for entry in entries]
+
+    lanes = run_with_container(client, get_lanes)
+
+    assert lanes[0] == lanes[1]
+    assert len(set(lanes)) > 1
+
+    response = client.get("/system/inbox/stats")
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()["lanes"]) == capsule_settings.inbox_workers
+    assert all(lane["depth"] == 0 for lane in response.json()["lanes"])
+
+
+def test_inbox_worker_admission_respects_lane_capacity(
+    client: TestClient, capsule_settings: CapsuleSettings
+) -> None:
+    capsule_settings.inbox_workers = 2
+    capsule_settings.inbox_queue_size = 2
+    payload = ap_create_note("remoteactor", capsule_settings.username)
+
+    async def fill_lane(container: Container) -> InboxWorker:
+        worker = InboxWorker(
+            settings=capsule_settings,
+            activitypub_service=get_inbox_worker(container).activitypub,
+        )
+        entries = [
+            InboxEntry(
+                id=entry_id,
+                activity=RawActivity.from_bytes(json.dumps(payload).encode()),
+            )
+            for entry_id in (1, 2)
+        ]
+
+        assert worker.submit(entries[0])
+        assert not worker.admits(entries[0].activity.actor, is_follower=True)
+        assert not worker.submit(entries[1])
+
+        return worker
+
+    worker = run_with_container(client, fill_lane)
+
+    assert worker.backlog < capsule_settings.inbox_high_water
+    assert worker.overflowed == 1
+
+
+def test_inbox_ed25519_signature(
+    client: TestClient,
+    capsule_settings: CapsuleSettings,
+    actor_and_keypair: tuple[dict, RSAKeyPair],
+    respx_mock: MockRouter,
+) -> None:
+    instance_username = capsule_settings.username
+    instance_inbox = f"/actors/{instance_username}/inbox"
+    actor, rsa_keys = actor_and_keypair
+    actor_username = actor["preferredUsername"]
+    ed25519_keys = generate_ed25519_keypair()
+    ed25519_key_id = f"{actor['id']}#ed25519-key"
+    actor["assertionMethod"] = [
+        {
+            "id": ed25519_key_id,
+            "type": "Multikey",
+            "controller": actor["id"],
+            "publicKeyMultibase": public_key_pem_to_multibase(ed25519_keys.public_key),
+        }
+    ]
+
+    mocked_response = Response(status_code=200, json=actor)
+    respx_mock.get(actor["id"]).mock(return_value=mocked_response)
+
+    response = client.post(
+        instance_inbox,
+        json=ap_create_note(actor_username, instance_username),
+        auth=ap_actor_auth(actor, rsa_keys),
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
+
+    auth = SignedRequestAuth(
+        public_key_id=HttpUrl(ed25519_key_id),
+        private_key=ed25519_keys.private_key,
+    )
+
+    response = client.post(
+        instance_inbox,
+        json=ap_create_note(actor_username, instance_username),
+        auth=auth,
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
+
+    auth = SignedRequestAuth(
+        public_key_id=HttpUrl(ed25519_key_id),
+        private_key=rsa_keys.private_key,
+    )
+
+    response = client.post(
+        instance_inbox,
+        json=ap_create_note(actor_username, instance_username),
+        auth=auth,
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_inbox_unsigned_new_actor(
+    client: TestClient, capsule_settings: CapsuleSettings
+) -> None:
+    instance_username = capsule_settings.username
+    payload = ap_create_note("remoteactor", instance_username)
+
+    response = client.post(f"/actors/{instance_username}/inbox", json=payload)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_inbox_drops_forged_new_actor_activity(
+    client: TestClient,
+    capsule_settings: CapsuleSettings,
+    actor_and_keypair: tuple[dict, RSAKeyPair],
+    respx_mock: MockRouter,
+) -> None:
+    instance_username = capsule_settings.username
+    instance_inbox = f"/actors/{instance_username}/inbox"
+    actor, keys = actor_and_keypair
+    actor_username = actor["preferredUsername"]
+
+    mocked_response = Response(status_code=200, json=actor)
+    respx_mock.get(actor["id"]).mock(return_value=mocked_response)
+
+    payload = ap_create_note(actor_username, instance_username)
+
+    response = client.post(
+        instance_inbox,
+        json=payload,
+        auth=ap_actor_auth(actor, generate_rsa_keypair()),
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
+
+    async def list_entries(container: Container) -> list[InboxEntry]:
+        activitypub = get_inbox_worker(container).activitypub
+
+        return [
+            entry
+            async for entry in activitypub.inbox.list_entries(list(InboxEntryStatus))
+        ]
+
+    assert run_with_container(client, list_entries) == []
+
+    response = client.post(
+        instance_inbox, json=payload, auth=ap_actor_auth(actor, keys)
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
+
+    entries = run_with_container(client, list_entries)
+
+    assert len(entries) == 1
+    assert entries[0].status == InboxEntryStatus.not_implemented
+    assert entries[0].request_headers is None
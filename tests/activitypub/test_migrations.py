@@ -0,0 +1,59 @@
+import json
+import sqlite3
+from pathlib import Path
+
+from typer.testing import CliRunner
+
+from capsule.__main__ import build_cli
+from capsule.settings import CapsuleSettings
+from tests.utils import ap_create_note
+
+BASELINE_INBOX_TABLE = """
+CREATE TABLE inboxentry (
+    id INTEGER NOT NULL,
+    status VARCHAR(15) NOT NULL,
+    activity JSON NOT NULL,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    PRIMARY KEY (id)
+)
+"""
+
+
+def test_migrate_inbox_table(tmp_path: Path, capsule_settings: CapsuleSettings) -> None:
+    payload = ap_create_note("remoteactor", capsule_settings.username)
+    now = "2025-01-01 00:00:00.000000"
+
+    with sqlite3.connect(tmp_path / "test.db") as conn:
+        conn.execute(BASELINE_INBOX_TABLE)
+        conn.executemany(
+            "INSERT INTO inboxentry (status, activity, created_at, updated_at) "
+            "VALUES ('synced', ?, ?, ?)",
+            [(json.dumps(payload), now, now)] * 2,
+        )
+
+    runner = CliRunner()
+    cli = build_cli(capsule_settings)
+
+    result = runner.invoke(cli, ["syncdb"])
+    assert result.exit_code == 0
+
+    with sqlite3.connect(tmp_path / "test.db") as conn:
+        rows = conn.execute(
+            "SELECT activity_id, activity_type, activity_actor, leased_until, "
+            "request_headers FROM inboxentry"
+        ).fetchall()
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(inboxentry)")}
+
+    assert rows == [(payload["id"], "Create", payload["actor"], None, None)]
+    assert {
+        "ix_inboxentry_activity_id",
+        "ix_inboxentry_activity_type",
+        "ix_inboxentry_activity_actor",
+        "ix_inboxentry_status",
+        "ix_inboxentry_created_at",
+        "ix_inboxentry_updated_at",
+    } <= indexes
+
+    result = runner.invoke(cli, ["dropdb"])
+    assert result.exit_code == 0
@@ -0,0 +1,213 @@
+from datetime import timedelta
+
+from fastapi import status
+from fastapi.testclient import TestClient
+from httpx import Request, Response
+from pydantic import HttpUrl
+from respx import MockRouter
+from svcs import Container
+
+from capsule.activitypub.models import Actor, InboxEntry, InboxEntryStatus
+from capsule.activitypub.service import get_activitypub_service
+from capsule.security.utils import RSAKeyPair, generate_rsa_keypair
+from capsule.settings import CapsuleSettings
+from capsule.utils import utc_now
+from tests.utils import (
+    ap_actor,
+    ap_actor_auth,
+    ap_create_note,
+    run_with_container,
+    wait_inbox_worker,
+)
+
+
+def age_actor(client: TestClient, actor_id: str) -> None:
+    async def age(container: Container) -> None:
+        activitypub = get_activitypub_service(container)
+        actor = await activitypub.get_actor(HttpUrl(actor_id))
+
+        assert actor is not None
+
+        await activitypub.actors.upsert_actor(
+            actor.model_copy(update={"fetched_at": utc_now() - timedelta(days=2)})
+        )
+
+    run_with_container(client, age)
+
+
+def get_actor(client: TestClient, actor_id: str) -> Actor | None:
+    async def get(container: Container) -> Actor | None:
+        return await get_activitypub_service(container).get_actor(HttpUrl(actor_id))
+
+    return run_with_container(client, get)
+
+
+def test_refresh_stale_actors(
+    client: TestClient,
+    capsule_settings: CapsuleSettings,
+    actor_and_keypair: tuple[dict, RSAKeyPair],
+    respx_mock: MockRouter,
+) -> None:
+    instance_username = capsule_settings.username
+    actor, keys = actor_and_keypair
+    actor_username = actor["preferredUsername"]
+
+    def handle(request: Request) -> Response:
+        if request.headers.get("if-none-match") == '"v1"':
+            return Response(status_code=304)
+
+        return Response(status_code=200, json=actor, headers={"ETag": '"v1"'})
+
+    route = respx_mock.get(actor["id"]).mock(side_effect=handle)
+
+    payload = ap_create_note(actor_username, instance_username)
+
+    response = client.post(
+        f"/actors/{instance_username}/inbox",
+        json=payload,
+        auth=ap_actor_auth(actor, keys),
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
+
+    stored = get_actor(client, actor["id"])
+
+    assert stored is not None
+    assert stored.etag == '"v1"'
+    assert stored.fetched_at is not None
+
+    age_actor(client, actor["id"])
+
+    async def refresh(container: Container) -> int:
+        return await get_activitypub_service(container).refresh_stale_actors()
+
+    assert run_with_container(client, refresh) == 1
+    assert route.call_count == 2
+    assert route.calls.last.response.status_code == 304
+
+    refreshed = get_actor(client, actor["id"])
+
+    assert refreshed is not None
+    assert refreshed.fetched_at is not None
+    assert refreshed.fetched_at > stored.fetched_at
+    assert run_with_container(client, refresh) == 0
+
+
+def test_inbox_refetches_rotated_key(
+    client: TestClient,
+    capsule_settings: CapsuleSettings,
+    actor_and_keypair: tuple[dict, RSAKeyPair],
+    respx_mock: MockRouter,
+) -> None:
+    instance_username = capsule_settings.username
+    instance_inbox = f"/actors/{instance_username}/inbox"
+    actor, keys = actor_and_keypair
+    actor_username = actor["preferredUsername"]
+    rotated_keys = generate_rsa_keypair()
+    rotated_actor = ap_actor(actor_username, rotated_keys.public_key)
+
+    route = respx_mock.get(actor["id"]).mock(
+        return_value=Response(status_code=200, json=actor)
+    )
+
+    response = client.post(
+        instance_inbox,
+        json=ap_create_note(actor_username, instance_username),
+        auth=ap_actor_auth(actor, keys),
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
+
+    route.mock(return_value=Response(status_code=200, json=rotated_actor))
+
+    response = client.post(
+        instance_inbox,
+        json=ap_create_note(actor_username, instance_username),
+        auth=ap_actor_auth(rotated_actor, rotated_keys),
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    age_actor(client, actor["id"])
+
+    payload = ap_create_note(actor_username, instance_username)
+
+    response = client.post(
+        instance_inbox, json=payload, auth=ap_actor_auth(rotated_actor, rotated_keys)
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
+
+    assert route.call_count == 2
+
+    async def get_entry(container: Container) -> InboxEntry | None:
+        async for entry in get_activitypub_service(container).inbox.list_entries(
+            list(InboxEntryStatus)
+        ):
+            if entry.activity.id == HttpUrl(payload["id"]):
+                return entry
+
+        return None
+
+    entry = run_with_container(client, get_entry)
+
+    assert entry is not None
+    assert entry.request_headers is None
+
+    response = client.post(
+        instance_inbox,
+        json=ap_create_note(actor_username, instance_username),
+        auth=ap_actor_auth(actor, keys),
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_inbox_keeps_entry_when_refresh_fails(
+    client: TestClient,
+    capsule_settings: CapsuleSettings,
+    actor_and_keypair: tuple[dict, RSAKeyPair],
+    respx_mock: MockRouter,
+) -> None:
+    instance_username = capsule_settings.username
+    instance_inbox = f"/actors/{instance_username}/inbox"
+    actor, keys = actor_and_keypair
+    actor_username = actor["preferredUsername"]
+    rotated_keys = generate_rsa_keypair()
+    rotated_actor = ap_actor(actor_username, rotated_keys.public_key)
+
+    route = respx_mock.get(actor["id"]).mock(
+        return_value=Response(status_code=200, json=actor)
+    )
+
+    response = client.post(
+        instance_inbox,
+        json=ap_create_note(actor_username, instance_username),
+        auth=ap_actor_auth(actor, keys),
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
+
+    age_actor(client, actor["id"])
+    route.mock(return_value=Response(status_code=503))
+
+    payload = ap_create_note(actor_username, instance_username)
+
+    response = client.post(
+        instance_inbox, json=payload, auth=ap_actor_auth(rotated_actor, rotated_keys)
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
+
+    async def get_entry(container: Container) -> InboxEntry | None:
+        async for entry in get_activitypub_service(container).inbox.list_entries(
+            list(InboxEntryStatus)
+        ):
+            if entry.activity.id == HttpUrl(payload["id"]):
+                return entry
+
+        return None
+
+    entry = run_with_container(client, get_entry)
+
+    assert entry is not None
+    assert entry.status == InboxEntryStatus.error
+    assert entry.request_headers is not None
@@ -1,11 +1,23 @@
+import json
+
+import pytest
 from fastapi import status
 from fastapi.testclient import TestClient
 from httpx import Response
 from respx import MockRouter
+from svcs import Container
 
+from capsule.activitypub.models import InboxEntry, InboxEntryStatus, RawActivity
+from capsule.activitypub.service import get_activitypub_service
 from capsule.security.utils import RSAKeyPair
 from capsule.settings import CapsuleSettings
-from tests.utils import ap_follow
+from tests.utils import (
+    ap_actor_auth,
+    ap_create_note,
+    ap_follow,
+    run_with_container,
+    wait_inbox_worker,
+)
 
 
 def test_system_inbox_sync(
@@ -15,7 +27,7 @@ def test_system_inbox_sync(
     respx_mock: MockRouter,
 ) -> None:
     instance_username = capsule_settings.username
-    actor, _ = actor_and_keypair
+    actor, keys = actor_and_keypair
     actor_username = actor["preferredUsername"]
 
     response = client.post("/system/inbox/cleanup", json={})
@@ -26,8 +38,13 @@ def test_system_inbox_sync(
 
     payload = ap_follow(actor_username, instance_username)
 
-    response = client.post(f"/actors/{instance_username}/inbox", json=payload)
+    response = client.post(
+        f"/actors/{instance_username}/inbox",
+        json=payload,
+        auth=ap_actor_auth(actor, keys),
+    )
     assert response.status_code == status.HTTP_202_ACCEPTED
+    wait_inbox_worker(client)
 
     mocked_response = Response(status_code=200, json=actor)
     respx_mock.get(actor["id"]).mock(return_value=mocked_response)
@@ -36,3 +53,130 @@ def test_system_inbox_sync(
 
     response = client.post("/system/inbox/sync?status=error", json={})
     assert response.status_code == status.HTTP_202_ACCEPTED
+
+
+def test_system_inbox_sync_in_chunks(
+    client: TestClient,
+    capsule_settings: CapsuleSettings,
+    actor_and_keypair: tuple[dict, RSAKeyPair],
+    respx_mock: MockRouter,
+) -> None:
+    instance_username = capsule_settings.username
+    actor, keys = actor_and_keypair
+    actor_username = actor["preferredUsername"]
+
+    capsule_settings.inbox_sync_chunk_size = 2
+
+    mocked_response = Response(status_code=500)
+    respx_mock.get(actor["id"]).mock(return_value=mocked_response)
+
+    for _ in range(5):
+        payload = ap_create_note(actor_username, instance_username)
+
+        response = client.post(
+            f"/actors/{instance_username}/inbox",
+            json=payload,
+            auth=ap_actor_auth(actor, keys),
+        )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+
+    wait_inbox_worker(client)
+
+    mocked_response = Response(status_code=200, json=actor)
+    respx_mock.get(actor["id"]).mock(return_value=mocked_response)
+
+    response = client.post("/system/inbox/sync?status=error", json={})
+    assert response.status_code == status.HTTP_202_ACCEPTED
+
+    async def list_synced(container: Container) -> list[InboxEntry]:
+        activitypub = get_activitypub_service(container)
+
+        return [
+            entry
+            async for entry in activitypub.inbox.list_entries(
+                InboxEntryStatus.not_implemented
+            )
+        ]
+
+    assert len(run_with_container(client, list_synced)) == 5
+
+
+def test_system_inbox_sync_skips_leased_entries(
+    client: TestClient, capsule_settings: CapsuleSettings
+) -> None:
+    payload = ap_follow("remoteactor", capsule_settings.username)
+
+    async def lease(container: Container) -> InboxEntry:
+        activitypub = get_activitypub_service(container)
+        entry = await activitypub.inbox.create_entry(
+            InboxEntry(activity=RawActivity.from_bytes(json.dumps(payload).encode()))
+        )
+
+        assert await activitypub.lease_inbox_entry(entry)
+
+        return entry
+
+    entry = run_with_container(client, lease)
+
+    response = client.post("/system/inbox/sync?status=created", json={})
+    assert response.status_code == status.HTTP_202_ACCEPTED
+
+    async def list_leased(container: Container) -> list[InboxEntry]:
+        activitypub = get_activitypub_service(container)
+
+        return [
+            entry
+            async for entry in activitypub.inbox.list_entries(
+                InboxEntryStatus.processing
+            )
+        ]
+
+    assert [leased.id for leased in run_with_container(client, list_leased)] == [
+        entry.id
+    ]
+
+
+def test_system_inbox_cleanup_by_status_and_age(
+    client: TestClient,
+    capsule_settings: CapsuleSettings,
+    actor_and_keypair: tuple[dict, RSAKeyPair],
+    respx_mock: MockRouter,
+) -> None:
+    instance_username = capsule_settings.username
+    actor, keys = actor_and_keypair
+    actor_username = actor["preferredUsername"]
+
+    mocked_response = Response(status_code=500)
+    respx_mock.get(actor["id"]).mock(return_value=mocked_response)
+
+    for _ in range(3):
+        payload = ap_create_note(actor_username, instance_username)
+
+        response = client.post(
+            f"/actors/{instance_username}/inbox",
+            json=payload,
+            auth=ap_actor_auth(actor, keys),
+        )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+
+    wait_inbox_worker(client)
+
+    response = client.post("/system/inbox/cleanup?status=error")
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.json()["deleted"] == 0
+
+    response = client.post(
+        "/system/inbox/cleanup?status=error&older_than=0&chunk_size=2"
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.json()["deleted"] == 3
+    assert response.json()["elapsed"] >= 0
+
+
+@pytest.mark.parametrize("query", ["chunk_size=0", "chunk_size=-1", "older_than=-1"])
+def test_system_inbox_cleanup_rejects_invalid_bounds(
+    client: TestClient, query: str
+) -> None:
+    response = client.post(f"/system/inbox/cleanup?{query}")
+
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
@@ -1,8 +1,10 @@
 from pathlib import Path
 
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
 from typer.testing import CliRunner
 
 from capsule.__main__ import build_cli
+from capsule.security.utils import load_private_key
 from tests.utils import setup_testing_env
 
 
@@ -31,3 +33,20 @@ def test_keypair(tmp_path: Path) -> None:
 
     assert "-----BEGIN PUBLIC KEY-----" in result.stdout
     assert "-----END PUBLIC KEY-----" in result.stdout
+
+
+def test_keypair_ed25519(tmp_path: Path) -> None:
+    with setup_testing_env(tmp_path):
+        cli = build_cli()
+
+    runner = CliRunner()
+
+    result = runner.invoke(cli, ["security", "keypair", "--type", "ed25519"])
+    assert result.exit_code == 0
+
+    assert "-----BEGIN PUBLIC KEY-----" in result.stdout
+
+    private_key_end = result.stdout.index("-----BEGIN PUBLIC KEY-----")
+    private_key = load_private_key(result.stdout[:private_key_end])
+
+    assert isinstance(private_key, Ed25519PrivateKey)
@@ -0,0 +1,70 @@
+import asyncio
+
+from httpx import Request
+from pydantic import HttpUrl
+
+from capsule.security.services import SignatureService
+from capsule.security.utils import (
+    HttpSignatureInfo,
+    RSAKeyPair,
+    SignedRequestAuth,
+    generate_rsa_keypair,
+    load_private_key,
+)
+from capsule.settings import CapsuleSettings
+
+
+def test_public_key_cache(capsule_settings: CapsuleSettings) -> None:
+    capsule_settings.signature_key_cache_size = 2
+    service = SignatureService(settings=capsule_settings)
+    key_id = "https://remote.example/actor#main-key"
+    first_key, rotated_key, other_key = (
+        generate_rsa_keypair().public_key for _ in range(3)
+    )
+
+    cached = service.load_public_key(key_id, first_key)
+
+    assert service.load_public_key(key_id, first_key) is cached
+    assert service.load_public_key(key_id, rotated_key) is not cached
+    assert len(service.public_keys) == 2
+
+    service.load_public_key("https://other.example/actor#main-key", other_key)
+
+    assert len(service.public_keys) == 2
+    assert service.load_public_key(key_id, first_key) is not cached
+
+    service.shutdown()
+
+
+def test_sign_requests_in_batch(
+    capsule_settings: CapsuleSettings, rsa_keypair: RSAKeyPair
+) -> None:
+    key_id = "https://local.example/actor#main-key"
+    auth = SignedRequestAuth(HttpUrl(key_id), rsa_keypair.private_key)
+    service = SignatureService(settings=capsule_settings)
+    public_key = service.load_public_key(key_id, rsa_keypair.public_key)
+    requests = [
+        Request("POST", f"https://remote{i}.example/inbox", json={"index": i})
+        for i in range(5)
+    ]
+
+    load_private_key.cache_clear()
+    signed = asyncio.run(auth.sign_requests(requests))
+
+    assert load_private_key.cache_info().currsize == 1
+
+    for request in signed:
+        signature_info = HttpSignatureInfo.from_compiled_signature(
+            request.headers["Signature"]
+        )
+        data = "\n".join(
+            f"{header}: {request.method.lower()} {request.url.path}"
+            if header == "(request-target)"
+            else f"{header}: {request.headers[header]}"
+            for header in signature_info.headers
+        )
+
+        assert signature_info.keyid == key_id
+        service.verify_signature(signature_info.signature, data, public_key)
+
+    service.shutdown()
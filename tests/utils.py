@@ -1,11 +1,20 @@
 import os
-from collections.abc import Generator
+from collections.abc import Awaitable, Callable, Generator
 from contextlib import contextmanager
 from pathlib import Path
+from typing import Any
 from uuid import uuid4
 
+from fastapi.testclient import TestClient
+from pydantic import HttpUrl
+from svcs import Container
+from svcs.fastapi import get_registry
 from wheke_sqlmodel import SQLITE_DRIVER
 
+from capsule.activitypub.delivery import get_delivery_worker
+from capsule.activitypub.worker import get_inbox_worker
+from capsule.security.utils import RSAKeyPair, SignedRequestAuth
+
 SQLMODEL_DB_ENV = "CAPSULE__FEATURES__SQLMODEL__CONNECTION_STRING"
 LADYBUG_DB_ENV = "CAPSULE__FEATURES__LADYBUG__CONNECTION_STRING"
 LADYBUG_DB_ECHO_ENV = "CAPSULE__FEATURES__LADYBUG__ECHO_OPERATIONS"
@@ -24,6 +33,25 @@ def setup_testing_env(tmp_path: Path) -> Generator:
     os.environ.pop(LADYBUG_DB_ECHO_ENV, None)
 
 
+def run_with_container(
+    client: TestClient, func: Callable[[Container], Awaitable[Any]]
+) -> Any:
+    async def run() -> Any:
+        async with Container(get_registry(client)) as container:
+            return await func(container)
+
+    assert client.portal is not None
+    return client.portal.call(run)
+
+
+def wait_inbox_worker(client: TestClient) -> None:
+    async def join(container: Container) -> None:
+        await get_inbox_worker(container).join()
+        await get_delivery_worker(container).join()
+
+    run_with_container(client, join)
+
+
 def ap_create_note(
     from_actor: str,
     to_actor: str,
@@ -82,6 +110,13 @@ def ap_unfollow(
     }
 
 
+def ap_actor_auth(actor: dict, keys: RSAKeyPair) -> SignedRequestAuth:
+    return SignedRequestAuth(
+        public_key_id=HttpUrl(actor["publicKey"]["id"]),
+        private_key=keys.private_key,
+    )
+
+
 def ap_actor(username: str, public_key: str, domain: str = "social.example") -> dict:
     name = username.replace("_", " ").title()
     return {